@@ -0,0 +1,2 @@
+"""Tools for measuring how fast the crawler is and how much memory the browser uses while crawling.
+"""
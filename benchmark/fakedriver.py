@@ -0,0 +1,336 @@
+"""An in-process stand-in for the Firefox WebDriver, serving the pages in fixtures.py from parsed lxml trees.
+
+It implements the parts of the Selenium API used by fbscrape: finding elements by css, xpath and link text,
+reading their text and attributes, clicking, the scripts in base.py and the scroll snippets. Infinite scroll
+is emulated by reading the configuration of the infinite scroll script in each page and appending the next
+batch whenever the page (or its scroller) is scrolled. Nothing is rendered and there's no network, so crawls
+take milliseconds and only measure the work done by the crawler itself.
+
+Example usage:
+    crawler = FBCrawler(driver=FakeDriver())
+    crawler.min_delay = 0
+    crawler.crawl_friends('http://fake/bench-1000', callback)
+"""
+
+import json
+import re
+
+from lxml import etree, html
+from selenium.common.exceptions import NoSuchElementException
+from selenium.webdriver.remote.command import Command
+
+try:
+    from urlparse import urlparse, parse_qs
+except ImportError:
+    from urllib.parse import urlparse, parse_qs
+
+# local imports
+import fixtures
+
+from fbscrape.base import EXTRACT_ITEMS_JS, PRUNE_ITEMS_JS, WAIT_FOR_ITEMS_JS
+from fbscrape.custom import css_selectors
+from fbscrape.offline import compile_selector, extract, parse, value
+
+
+SCROLL_TO_BOTTOM_JS = 'window.scrollTo(0, document.body.scrollHeight);'
+SCROLL_ELEMENT_JS = 'a = arguments[0]; a.scrollTo(0, a.scrollHeight);'
+DOM_SIZE_JS = 'return document.getElementsByTagName("*").length;'
+
+_conf = re.compile(r'var conf = (\{.*?\});')
+
+
+class InfiniteScroll(object):
+    """Appends the next batch of a fixtures list to the page every time it's scrolled to the bottom.
+    <conf> is the configuration given to fixtures.INFINITE_SCROLL_JS.
+    """
+
+    def __init__(self, conf):
+        self.conf = conf
+        self.offset = conf['offset']
+
+    def more(self, doc):
+        conf = self.conf
+        if self.offset >= conf['total']:
+            return
+        markup = fixtures.chunk(conf['list'], conf['size'], self.offset, conf['batch'], conf['total'])
+        container = compile_selector(conf['container'])(doc)[0]
+        for el in html.fragments_fromstring(markup):
+            container.append(el)
+        self.offset += conf['batch']
+
+    def scroll(self, doc, el=None):
+        """Loads more if the page was scrolled and there's no scroller, or if el is the scroller.
+        """
+        scroller = self.conf['scroller']
+        if scroller is None and el is None:
+            self.more(doc)
+        elif scroller is not None and el is not None and el in compile_selector(scroller)(doc):
+            self.more(doc)
+
+    def reset(self, doc, offset=0):
+        """Empties the list and starts again from offset, like window.fbsReset.
+        """
+        container = compile_selector(self.conf['container'])(doc)[0]
+        for child in list(container):
+            container.remove(child)
+        container.text = None
+        self.offset = offset
+        self.more(doc)
+
+
+def _show_about_section(driver, el):
+    main = compile_selector(css_selectors['about_main'])(driver.doc)[0]
+    for child in list(main):
+        main.remove(child)
+    main.text = fixtures.about_text(el.get('title'), int(main.get('data-repeat')))
+
+
+def _show_guests(driver, el):
+    if driver.scroll:
+        driver.scroll.reset(driver.doc)
+
+
+"""What happens when elements matching each css selector are clicked, the equivalent of the event listeners
+in the fixture pages. Clicking anything else does nothing.
+"""
+click_handlers = [
+    ("[data-testid='info_section_left_nav'] > li", _show_about_section),
+    ('span.className > a', _show_guests),
+]
+
+
+class FakeElement(object):
+    """The equivalent of a selenium WebElement wrapping an lxml element.
+    """
+
+    def __init__(self, parent, el):
+        self.parent = parent
+        self.el = el
+
+    def __eq__(self, other):
+        return isinstance(other, FakeElement) and self.el is other.el
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __hash__(self):
+        return hash(self.el)
+
+    def _execute(self, command, params=None):
+        params = dict(params or {}, id=self)
+        return self.parent.execute(command, params)['value']
+
+    def find_element_by_css_selector(self, selector):
+        return self._execute(Command.FIND_CHILD_ELEMENT, {'using': 'css selector', 'value': selector})
+
+    def find_elements_by_css_selector(self, selector):
+        return self._execute(Command.FIND_CHILD_ELEMENTS, {'using': 'css selector', 'value': selector})
+
+    def find_element_by_xpath(self, xpath):
+        return self._execute(Command.FIND_CHILD_ELEMENT, {'using': 'xpath', 'value': xpath})
+
+    def find_elements_by_xpath(self, xpath):
+        return self._execute(Command.FIND_CHILD_ELEMENTS, {'using': 'xpath', 'value': xpath})
+
+    def find_element_by_link_text(self, text):
+        return self._execute(Command.FIND_CHILD_ELEMENT, {'using': 'link text', 'value': text})
+
+    def find_elements_by_link_text(self, text):
+        return self._execute(Command.FIND_CHILD_ELEMENTS, {'using': 'link text', 'value': text})
+
+    @property
+    def text(self):
+        return self._execute(Command.GET_ELEMENT_TEXT)
+
+    def get_attribute(self, name):
+        return self._execute(Command.GET_ELEMENT_ATTRIBUTE, {'name': name})
+
+    def click(self):
+        self._execute(Command.CLICK_ELEMENT)
+
+
+class FakeDriver(object):
+    """Serves pages from <pages>, a function taking the path and the parsed query string of a url and returning
+    the markup of the page or None if there's no such page (fixtures.page by default).
+    Every command goes through execute() like it does in selenium, so wrapping it counts every round trip.
+    """
+
+    def __init__(self, pages=None, batch=20):
+        self.pages = pages if pages else lambda path, query: fixtures.page(path, query, batch)
+        self.doc = parse('<html><body></body></html>')
+        self.url = 'about:blank'
+        self.scroll = None
+        self.script_timeout = None
+        # the last item tagged by each cursor, see UNSEEN_ITEMS_JS
+        self.cursors = {}
+
+    def _find(self, context, using, selector):
+        if using == 'link text':
+            return [a for a in context.iter('a') if a.text_content().strip() == selector]
+        return compile_selector(selector, 'xpath' if using == 'xpath' else 'css')(context)
+
+    def _wrap(self, result):
+        """Turns the lxml elements in the result of a script into FakeElements.
+        """
+        if isinstance(result, list):
+            return [self._wrap(r) for r in result]
+        if isinstance(result, dict):
+            return dict((k, self._wrap(v)) for k, v in result.items())
+        if isinstance(result, etree.ElementBase):
+            return FakeElement(self, result)
+        return result
+
+    def _unwrap(self, arg):
+        return arg.el if isinstance(arg, FakeElement) else arg
+
+    def _get(self, url):
+        parsed = urlparse(url)
+        markup = self.pages(parsed.path, parse_qs(parsed.query))
+        if markup is None:
+            markup = fixtures.missing_page()
+        self.url = url
+        self.doc = parse(markup, url)
+        self.cursors = {}
+        conf = _conf.search(markup)
+        self.scroll = InfiniteScroll(json.loads(conf.group(1))) if conf else None
+
+    def _click(self, el):
+        for selector, handler in click_handlers:
+            if el in compile_selector(selector)(self.doc):
+                handler(self, el)
+
+    def _unseen(self, root, selector, xpath, token, following):
+        """The python equivalent of unseenItems() in base.UNSEEN_ITEMS_JS, except that css selectors always go
+        through the whole page.
+        """
+        root = root if root is not None else self.doc
+        last = self.cursors.get(token)
+        if xpath and following and last is not None and root in last.iterancestors():
+            return compile_selector(following, 'xpath')(last)
+        return compile_selector(selector, 'xpath' if xpath else 'css')(root)
+
+    def _run(self, script, args):
+        """Runs one of the scripts fbscrape uses. Returns None for scripts it doesn't know about.
+        """
+        args = [self._unwrap(a) for a in args]
+        if script == EXTRACT_ITEMS_JS:
+            root, selector, xpath, fields, mark, following = args
+            items = self._unseen(root, selector, xpath, mark[1], following)
+            results = []
+            for item in items:
+                results.append(extract(item, fields, self.url))
+                item.set(mark[0], mark[1])
+            if items:
+                self.cursors[mark[1]] = items[-1]
+            return results
+        if script == PRUNE_ITEMS_JS:
+            root, selector, container, token = args
+            containers = set(compile_selector(container)(self.doc)) if container else set()
+            pruned = 0
+            for item in compile_selector(selector)(root if root is not None else self.doc):
+                target = next((a for a in item.iterancestors() if a in containers), item)
+                if target.get('data-fbscrape-pruned') is not None:
+                    continue
+                if token in self.cursors and target in self.cursors[token].iterancestors():
+                    self.cursors[token] = target
+                for child in list(target):
+                    target.remove(child)
+                target.text = None
+                target.set('data-fbscrape-pruned', '')
+                pruned += 1
+            return pruned
+        if script == SCROLL_TO_BOTTOM_JS:
+            if self.scroll:
+                self.scroll.scroll(self.doc)
+            return None
+        if script == SCROLL_ELEMENT_JS:
+            if self.scroll:
+                self.scroll.scroll(self.doc, args[0])
+            return None
+        if script == DOM_SIZE_JS:
+            return sum(1 for _ in self.doc.iter(etree.Element))
+        if 'background-image' in script:
+            return 'url("{}")'.format(value(args[0], 'bg'))
+        return None
+
+    def _wait_for_items(self, args):
+        # new items are added as soon as the page is scrolled so there's nothing to wait for
+        root, selector, xpath = [self._unwrap(a) for a in args[:3]]
+        token, following = args[7:9]
+        return [len(self._unseen(root, selector, xpath, token, following)), True]
+
+    def execute(self, command, params=None):
+        """Runs a selenium command and returns the response in the same format as a real driver.
+        """
+        params = params or {}
+        element = params['id'].el if 'id' in params else None
+        result = None
+        if command == Command.GET:
+            self._get(params['url'])
+        elif command == Command.GET_CURRENT_URL:
+            result = self.url
+        elif command == Command.GET_PAGE_SOURCE:
+            result = etree.tostring(self.doc, encoding='unicode', method='html')
+        elif command in (Command.FIND_ELEMENT, Command.FIND_CHILD_ELEMENT):
+            found = self._find(element if element is not None else self.doc, params['using'], params['value'])
+            if not found:
+                raise NoSuchElementException('Unable to locate element: ' + params['value'])
+            result = FakeElement(self, found[0])
+        elif command in (Command.FIND_ELEMENTS, Command.FIND_CHILD_ELEMENTS):
+            found = self._find(element if element is not None else self.doc, params['using'], params['value'])
+            result = [FakeElement(self, el) for el in found]
+        elif command == Command.GET_ELEMENT_TEXT:
+            result = value(element, 'text')
+        elif command == Command.GET_ELEMENT_ATTRIBUTE:
+            result = value(element, params['name'], self.url)
+        elif command == Command.CLICK_ELEMENT:
+            self._click(element)
+        elif command == Command.EXECUTE_SCRIPT:
+            result = self._wrap(self._run(params['script'], params['args']))
+        elif command == Command.EXECUTE_ASYNC_SCRIPT:
+            if params['script'] == WAIT_FOR_ITEMS_JS:
+                result = self._wait_for_items(params['args'])
+        elif command == Command.SET_SCRIPT_TIMEOUT:
+            self.script_timeout = params['ms'] / 1000.0
+        return {'value': result}
+
+    def get(self, url):
+        self.execute(Command.GET, {'url': url})
+
+    @property
+    def current_url(self):
+        return self.execute(Command.GET_CURRENT_URL)['value']
+
+    @property
+    def page_source(self):
+        return self.execute(Command.GET_PAGE_SOURCE)['value']
+
+    def find_element_by_css_selector(self, selector):
+        return self.execute(Command.FIND_ELEMENT, {'using': 'css selector', 'value': selector})['value']
+
+    def find_elements_by_css_selector(self, selector):
+        return self.execute(Command.FIND_ELEMENTS, {'using': 'css selector', 'value': selector})['value']
+
+    def find_element_by_xpath(self, xpath):
+        return self.execute(Command.FIND_ELEMENT, {'using': 'xpath', 'value': xpath})['value']
+
+    def find_elements_by_xpath(self, xpath):
+        return self.execute(Command.FIND_ELEMENTS, {'using': 'xpath', 'value': xpath})['value']
+
+    def find_element_by_link_text(self, text):
+        return self.execute(Command.FIND_ELEMENT, {'using': 'link text', 'value': text})['value']
+
+    def find_elements_by_link_text(self, text):
+        return self.execute(Command.FIND_ELEMENTS, {'using': 'link text', 'value': text})['value']
+
+    def execute_script(self, script, *args):
+        return self.execute(Command.EXECUTE_SCRIPT, {'script': script, 'args': list(args)})['value']
+
+    def execute_async_script(self, script, *args):
+        return self.execute(Command.EXECUTE_ASYNC_SCRIPT, {'script': script, 'args': list(args)})['value']
+
+    def set_script_timeout(self, time_to_wait):
+        self.execute(Command.SET_SCRIPT_TIMEOUT, {'ms': float(time_to_wait) * 1000})
+
+    def quit(self):
+        pass
@@ -0,0 +1,298 @@
+"""Synthetic Facebook pages matching the selectors in fbscrape/custom.py.
+
+Every list is generated on the fly from the index of each item so profiles of any size cost nothing to serve.
+The first <batch> items of a list are sent with the page and the rest are fetched in batches from /chunk
+by the infinite scroll script as the page (or the event guest dialog) is scrolled to the bottom.
+"""
+
+import json
+import re
+
+try:
+    from urllib import quote
+except ImportError:
+    from urllib.parse import quote
+
+
+# the time of the newest post, every post after that is an hour older
+NEWEST_POST = 1500000000
+
+
+def post(i):
+    return (u'<div class="userContentWrapper"><div class="fbUserContent"><div>'
+            u'<p>Post number {0}. Lorem ipsum dolor sit amet, consectetur adipiscing elit, sed do eiusmod.</p>'
+            u'<a href="/bench/posts/{0}"><abbr data-utime="{1}"><span class="timestampContent">{0} hours ago</span>'
+            u'</abbr></a></div></div><div class="comments">No comments</div></div>').format(i, NEWEST_POST - i * 3600)
+
+
+def friend(i):
+    return (u'<li><div data-testid="friend_list_item"><a data-hovercard="/hovercard?id={0}" href="/friend{0}">'
+            u'<img src="/img/friend{0}.jpg"></a><div><a data-hovercard="/hovercard?id={0}" '
+            u'href="/friend{0}?fref=pb">Friend {0}</a></div></div></li>').format(i)
+
+
+def like(i):
+    return u'<li><a data-hovercard="/hovercard?page={0}" href="/page{0}">Page {0}</a></li>'.format(i)
+
+
+def photo(i):
+    return (u'<div class="fbPhotoStarGridElement" data-starred-src="/img/photo{0}.jpg">'
+            u'<a href="/photo.php?fbid={0}" aria-label="tree, person, smiling"></a></div>').format(i)
+
+
+def album(i):
+    return u'<tr><td><a class="photoTextTitle" href="/album/{{size}}?id={0}">Album {0}</a></td></tr>'.format(i)
+
+
+def album_photo(i):
+    return (u'<a ajaxify="/photo.php?fbid={0}&set=a" href="#">'
+            u'<img style="background-image: url(\'/img/album{0}.jpg\')"></a>').format(i)
+
+
+def group(i):
+    return u'<li><a data-hovercard="/hovercard?group={0}" href="/groups/{0}">Group {0}</a></li>'.format(i)
+
+
+def checkin(i):
+    return u'<li><div><div><a href="/place{0}">Place {0}</a></div></div></li>'.format(i)
+
+
+def search_result(i):
+    return (u'<div data-bt="{0}"><div data-gt="{0}"><div class="clearfix"><a href="/result{0}">'
+            u'<img src="/img/result{0}.jpg"></a><div class="clearfix"><div><div>'
+            u'<a data-testid="serp_result_link" href="/result{0}?ref=br">{0}</a>'
+            u'<a data-testid="serp_result_name" href="/result{0}">Result {0}</a>'
+            u'</div></div></div></div></div></div>').format(i)
+
+
+def guest(i):
+    return (u'<div><div><table><tr><td><div><a data-hovercard="/hovercard?id={0}" href="/guest{0}">'
+            u'<img src="/img/guest{0}.jpg"></a><div><a data-hovercard="/hovercard?id={0}" href="/guest{0}?fref=ev">'
+            u'<span>Guest {0}</span></a></div></div></td></tr></table></div></div>').format(i)
+
+
+"""For each list: the function generating each item, the markup the items go in ({items} is replaced by the
+first batch) and the css selector of the element new items are added to.
+"""
+lists = {
+    'posts': (post, u'<div id="recent_capsule_container"><div id="posts">{items}</div></div>', '#posts'),
+    'friends': (friend, u'<ul data-pnref="friends">{items}</ul>', "ul[data-pnref='friends']"),
+    'likes': (like, u'<div id="pagelet_timeline_medley_likes"><ul id="likes">{items}</ul></div>', '#likes'),
+    'photos': (photo, u'<div id="pagelet_timeline_medley_photos"><div id="photos">{items}</div></div>', '#photos'),
+    'albums': (album, u'<div id="pagelet_timeline_medley_photos"><table class="fbPhotosGrid" id="albums">'
+               u'{items}</table></div>', '#albums'),
+    'album': (album_photo, u'<div id="fbTimelinePhotosContent"><div><div id="album">{items}</div></div></div>',
+              '#album'),
+    'groups': (group, u'<div id="timeline-medley"><ul id="groups">{items}</ul></div>', '#groups'),
+    'checkins': (checkin, u'<div id="pagelet_timeline_medley_map"><ul id="checkins">{items}</ul></div>', '#checkins'),
+    'search': (search_result, u'<div id="initial_browse_result"><div id="results">{items}</div></div>', '#results'),
+    'event': (guest, u'', '#guests'),
+}
+
+about_sections = ['Overview', 'Work and Education', 'Places He\'s Lived', 'Contact and Basic Info',
+                  'Family and Relationships', 'Details About Him', 'Life Events']
+
+guest_labels = ['going', 'interested', 'invited']
+
+# the section pages of a profile, keyed by their sk= query parameter
+profile_sections = {
+    None: 'posts',
+    'friends': 'friends',
+    'likes': 'likes',
+    'photos': 'photos',
+    'groups': 'groups',
+    'map': 'checkins',
+}
+
+# the number of albums every profile has
+ALBUMS = 5
+
+
+STYLE = u"""
+body { margin: 0; }
+.userContentWrapper, li, div[data-bt], .fbPhotoStarGridElement, #album > a, #guests table { display: block; min-height: 60px; }
+.uiScrollableAreaWrap { height: 400px; overflow-y: scroll; }
+"""
+
+# fetches more items from /chunk whenever the page (or the scroller) is scrolled near the bottom
+INFINITE_SCROLL_JS = u"""
+(function() {
+    var conf = %s;
+    // the generation changes whenever the list is reset so batches from before the reset are thrown away
+    var offset = conf.offset, loading = false, generation = 0;
+
+    function scroller() {
+        return conf.scroller ? document.querySelector(conf.scroller) : null;
+    }
+
+    function nearBottom() {
+        var s = scroller();
+        if (s) {
+            return s.scrollTop + s.clientHeight >= s.scrollHeight - 200;
+        }
+        return window.innerHeight + window.pageYOffset >= document.body.scrollHeight - 200;
+    }
+
+    function more() {
+        if (loading || offset >= conf.total || !nearBottom()) {
+            return;
+        }
+        loading = true;
+        var started = generation;
+        var xhr = new XMLHttpRequest();
+        xhr.open('GET', '/chunk?list=' + conf.list + '&size=' + conf.size + '&offset=' + offset);
+        xhr.onload = function() {
+            if (started !== generation) {
+                return;
+            }
+            document.querySelector(conf.container).insertAdjacentHTML('beforeend', xhr.responseText);
+            offset += conf.batch;
+            loading = false;
+            // keep going if the new items didn't fill the screen
+            more();
+        };
+        xhr.send();
+    }
+
+    window.fbsReset = function(newOffset) {
+        generation++;
+        loading = false;
+        offset = newOffset;
+        document.querySelector(conf.container).innerHTML = '';
+        more();
+    };
+    window.addEventListener('scroll', more);
+    document.addEventListener('scroll', more, true);
+    more();
+})();
+"""
+
+
+def items(name, start, end, size):
+    """Returns the markup of items start to end (not including end) of the list.
+    """
+    item = lists[name][0]
+    return u''.join(item(i) for i in range(start, end)).replace(u'{size}', str(size))
+
+
+def _page(body, script=u''):
+    return (u'<!DOCTYPE html><html><head><meta charset="utf-8"><title>fbscraper benchmark</title>'
+            u'<style>{}</style></head><body><div id="content">{}</div><script>{}</script></body></html>'
+            ).format(STYLE, body, script)
+
+
+def _infinite_scroll(name, size, total, batch, scroller=None, offset=None):
+    conf = {
+        'list': name,
+        'size': size,
+        'total': total,
+        'offset': min(batch, total) if offset is None else offset,
+        'batch': batch,
+        'container': lists[name][2],
+        'scroller': scroller,
+    }
+    return INFINITE_SCROLL_JS % json.dumps(conf)
+
+
+def list_page(name, size, batch=20, total=None):
+    """Returns a page of <total> items (<size> by default) with the first batch already in the page.
+    """
+    total = size if total is None else total
+    markup = lists[name][1].format(items=items(name, 0, min(batch, total), size))
+    return _page(markup, _infinite_scroll(name, size, total, batch))
+
+
+def chunk(name, size, offset, batch=20, total=None):
+    """Returns the markup of the next batch of items after offset.
+    """
+    total = size if total is None else total
+    return items(name, offset, min(offset + batch, total), size)
+
+
+def about_page(size):
+    nav = u''.join(u'<li title="{0}"><a href="?sk=about&section={1}">{0}</a></li>'.format(s, quote(s))
+                   for s in about_sections)
+    body = (u'<ul data-pnref="about"><li><ul data-testid="info_section_left_nav">{}</ul></li>'
+            u'<li><div><div></div><div id="about_main" data-repeat="{}">Overview</div></div></li></ul>'
+            ).format(nav, max(1, size // 10))
+    script = u"""
+    Array.prototype.forEach.call(document.querySelectorAll('[data-testid=info_section_left_nav] > li'), function(li) {
+        li.addEventListener('click', function(e) {
+            e.preventDefault();
+            var main = document.getElementById('about_main');
+            main.innerText = li.title + '\\n' + new Array(Number(main.dataset.repeat) + 1).join(li.title + ' ');
+        });
+    });
+    """
+    return _page(body, script)
+
+
+def about_text(title, repeat):
+    """The text shown in the about page after clicking on the section called title.
+    """
+    return title + u'\n' + (title + u' ') * repeat
+
+
+def event_page(size, batch=20):
+    """An event with a guest list dialog containing <size> guests for each response.
+    """
+    tabs = u''.join(u'<span class="className"><a href="#" data-label="{0}">{1} {2}</a></span>'.format(
+        l, l.capitalize(), size) for l in guest_labels)
+    # the crawler finds the dialog by going up three levels from the tabs
+    body = (u'<div id="event_guest_list"><a rel="dialog" href="#">See guests</a></div>'
+            u'<div id="dialog" style="display: none"><div>{}</div>'
+            u'<div class="uiScrollableArea"><div class="uiScrollableAreaWrap"><div><div id="guests"></div>'
+            u'</div></div></div></div>').format(tabs)
+    # nothing is loaded until one of the tabs is clicked
+    script = _infinite_scroll('event', size, size, batch, '.uiScrollableAreaWrap', offset=size) + u"""
+    document.querySelector('#event_guest_list a').addEventListener('click', function(e) {
+        e.preventDefault();
+        document.getElementById('dialog').style.display = 'block';
+    });
+    Array.prototype.forEach.call(document.querySelectorAll('span.className > a'), function(a) {
+        a.addEventListener('click', function(e) {
+            e.preventDefault();
+            window.fbsReset(0);
+        });
+    });
+    """
+    return _page(body, script)
+
+
+def missing_page():
+    return _page(u'<h2>Sorry, this content isn\'t available right now</h2>')
+
+
+def page(path, query, batch=20):
+    """Returns the markup for the page at path with the parsed query string, or None if there's no such page.
+    """
+    param = lambda name: query.get(name, [None])[0]
+
+    if path == '/chunk':
+        return chunk(param('list'), int(param('size')), int(param('offset')), batch)
+
+    match = re.match(r'^/bench-(\d+)$', path)
+    if match:
+        size = int(match.group(1))
+        sk = param('sk')
+        if sk in profile_sections:
+            return list_page(profile_sections[sk], size, batch)
+        if sk == 'photos_albums':
+            return list_page('albums', size, batch, total=ALBUMS)
+        if sk == 'about':
+            return about_page(size)
+        return None
+
+    match = re.match(r'^/album/(\d+)$', path)
+    if match:
+        return list_page('album', int(match.group(1)), batch)
+
+    match = re.match(r'^/search/(\d+)/', path)
+    if match:
+        return list_page('search', int(match.group(1)), batch)
+
+    match = re.match(r'^/events/(\d+)', path)
+    if match:
+        return event_page(int(match.group(1)), batch)
+
+    return None
@@ -0,0 +1,25 @@
+"""Helpers for measuring a crawler while it's running.
+"""
+
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+
+def browser_rss(crawler):
+    """Returns the total resident memory in bytes of the browser processes started by the crawler.
+    Returns None if psutil isn't installed or there's no browser process (e.g. with a FakeDriver).
+    """
+    service = getattr(crawler.driver, 'service', None)
+    if psutil is None or service is None:
+        return None
+    driver_process = psutil.Process(service.process.pid)
+    return sum(p.memory_info().rss for p in driver_process.children(recursive=True))
+
+
+def dom_size(crawler):
+    """Returns the number of elements currently in the page.
+    """
+    return crawler.js('return document.getElementsByTagName("*").length;')
+
@@ -0,0 +1,79 @@
+"""Compares crawling a long list with and without pruning scraped items from the page.
+
+Example usage (from the root folder of the project):
+    python -m benchmark.pruning --target zuck --section friends --items 2000 --loginfile login.txt
+"""
+
+import argparse
+import logging as log
+import sys
+
+from time import time
+
+# local imports
+from fbscrape import FBCrawler
+from fbscrape.helpers import get_targeturl
+from measure import browser_rss, dom_size
+
+
+def run(crawler, section, targeturl, items, sample_every=100):
+    """Crawls <section> of <targeturl> until <items> items have been scraped.
+    Returns a dict of the number of items, items per second, and the peak browser memory and page size.
+    """
+    result = {'items': 0, 'peak_rss': browser_rss(crawler), 'peak_dom': 0}
+
+    def callback(*args):
+        result['items'] += 1
+        if result['items'] % sample_every == 0:
+            if result['peak_rss'] is not None:
+                result['peak_rss'] = max(result['peak_rss'], browser_rss(crawler))
+            result['peak_dom'] = max(result['peak_dom'], dom_size(crawler))
+        if result['items'] >= items:
+            crawler.stop_request = True
+
+    start = time()
+    getattr(crawler, 'crawl_' + section)(targeturl, callback)
+    elapsed = time() - start
+    crawler.restart()
+
+    result['peak_dom'] = max(result['peak_dom'], dom_size(crawler))
+    result['items_per_sec'] = result['items'] / elapsed if elapsed else 0
+    return result
+
+
+def report(name, res):
+    rss = '{:.1f} MB'.format(res['peak_rss'] / 1024.0 / 1024.0) if res['peak_rss'] is not None else 'n/a'
+    print('{:<10} {:>8d} items {:>10.2f} items/sec   peak browser memory {:>10}   peak page size {:>8d} elements'.format(
+        name, res['items'], res['items_per_sec'], rss, res['peak_dom']))
+
+
+def main(args):
+    log.basicConfig(format='%(levelname)s:%(message)s', level=log.WARNING)
+    targeturl = get_targeturl(args.target)
+    results = {}
+    for prune in (False, True):
+        # use a fresh browser for each run so memory from the previous run doesn't count
+        crawler = FBCrawler()
+        with open(args.loginfile, 'r') as f:
+            lines = f.readlines()
+        if not crawler.login(lines[0].strip(), lines[1].strip()):
+            sys.exit('Failed to log into Facebook.')
+        crawler.prune = prune
+        results[prune] = run(crawler, args.section, targeturl, args.items)
+        crawler.driver.quit()
+
+    report('unpruned', results[False])
+    report('pruned', results[True])
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Compare crawling with and without pruning the page.')
+    parser.add_argument('--target', '-t', dest='target', required=True,
+                        help='the Facebook ID, username, or URL to crawl')
+    parser.add_argument('--section', '-s', dest='section', default='friends',
+                        help='the section to crawl, e.g. posts, friends, likes, photos')
+    parser.add_argument('--items', '-n', dest='items', type=int, default=1000,
+                        help='the number of items to crawl in each run')
+    parser.add_argument('--loginfile', '-l', dest='loginfile', default='login.txt',
+                        help='the file to read login credentials from')
+    main(parser.parse_args())
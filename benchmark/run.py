@@ -0,0 +1,174 @@
+"""Measures the throughput of every crawl_* method of FBCrawler against the local fake Facebook in server.py.
+
+For each method and size it reports the items crawled per second, the number of WebDriver commands sent per
+item (counted by the crawler's CrawlStats), the time spent sleeping in delays and the peak memory used by the browser (if psutil is installed), and compares them against a baseline.
+With --fake the pages are served by a FakeDriver instead of Firefox, which only measures the crawler's own work.
+
+Example usage (from the root folder of the project):
+    python -m benchmark.run --methods friends,posts
+    python -m benchmark.run --sizes 10000,50000 --methods friends
+    python -m benchmark.run --fake --min-delay 0
+
+The committed baseline.json was made with `python -m benchmark.run --fake --min-delay 0 --save-baseline`, so it
+only has the FakeDriver results. Save a baseline of your own before comparing runs with Firefox.
+"""
+
+import argparse
+import json
+import logging as log
+import os
+
+from time import time
+
+# local imports
+from fbscrape import BrowserProfile, FBCrawler
+from fakedriver import FakeDriver
+from measure import browser_rss, dom_size
+from server import FakeFacebook
+
+
+BASELINE_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'baseline.json')
+
+# big enough to see how the crawl scales without taking all day, ask for 10000 or 50000 items with --sizes
+DEFAULT_SIZES = [100, 1000]
+
+# the FakeDriver doesn't care about the host
+FAKE_URL = 'http://fake'
+
+"""How to run each benchmark: the crawl method and the path on the fake Facebook for a given size.
+"""
+benchmarks = {
+    'posts': ('crawl_posts', '/bench-{size}'),
+    'friends': ('crawl_friends', '/bench-{size}'),
+    'likes': ('crawl_likes', '/bench-{size}'),
+    'photos': ('crawl_photos', '/bench-{size}'),
+    'albums': ('crawl_albums', '/bench-{size}'),
+    'one_album': ('crawl_one_album', '/album/{size}'),
+    'about': ('crawl_about', '/bench-{size}'),
+    'groups': ('crawl_groups', '/bench-{size}'),
+    'checkins': ('crawl_checkins', '/bench-{size}'),
+    'search_results': ('crawl_search_results', '/search/{size}/str/bench/users-named'),
+    'event_guests': ('crawl_event_guests', '/events/{size}'),
+}
+
+
+def run_one(crawler, name, url, sample_every=100):
+    """Runs a single benchmark and returns its results.
+    """
+    method = getattr(crawler, benchmarks[name][0])
+    result = {'items': 0, 'peak_rss': browser_rss(crawler), 'peak_dom': 0}
+
+    def sample():
+        if result['peak_rss'] is not None:
+            result['peak_rss'] = max(result['peak_rss'], browser_rss(crawler))
+
+    def callback(*args):
+        result['items'] += 1
+        if result['items'] % sample_every == 0:
+            sample()
+
+    start = time()
+    method(url, callback)
+    elapsed = time() - start
+
+    sample()
+    # only count the commands sent by the crawl itself
+    summary = crawler.stats.summary(url).get(benchmarks[name][0], {'commands': {}, 'sleep': {'seconds': 0.0}})
+    result['commands'] = dict((c, v['count']) for c, v in summary['commands'].items())
+    result['calls'] = sum(result['commands'].values())
+    result['slept'] = summary['sleep']['seconds']
+    result['peak_dom'] = dom_size(crawler)
+    result['seconds'] = elapsed
+    result['items_per_sec'] = result['items'] / elapsed if elapsed else 0.0
+    result['calls_per_item'] = float(result['calls']) / result['items'] if result['items'] else 0.0
+    return result
+
+
+def run(names, sizes, latency=0.0, prune=False, min_delay=0.5, headless=True, fake=False):
+    """Runs every benchmark in names at every size and returns the results keyed by '<name>-<size>'
+    (or '<name>-<size>-fake' when using the FakeDriver).
+    """
+    server = None if fake else FakeFacebook(latency=latency).start()
+    base_url = FAKE_URL if fake else server.url
+    results = {}
+    try:
+        for name in names:
+            for size in sizes:
+                # a fresh browser for every run so memory from previous runs doesn't count
+                if fake:
+                    crawler = FBCrawler(driver=FakeDriver())
+                else:
+                    crawler = FBCrawler(profile=BrowserProfile.lightweight(headless))
+                crawler.min_delay = min_delay
+                crawler.prune = prune
+                url = base_url + benchmarks[name][1].format(size=size)
+                key = '{}-{}-fake'.format(name, size) if fake else '{}-{}'.format(name, size)
+                try:
+                    results[key] = run_one(crawler, name, url)
+                finally:
+                    crawler.driver.quit()
+    finally:
+        if server:
+            server.stop()
+    return results
+
+
+def compare(results, baseline):
+    """Prints every result next to its baseline.
+    """
+    print('{:<22} {:>8} {:>12} {:>10} {:>12} {:>10} {:>12} {:>10}'.format(
+        'benchmark', 'items', 'items/sec', 'vs base', 'calls/item', 'slept s', 'peak MB', 'vs base'))
+    for key in sorted(results):
+        res = results[key]
+        base = baseline.get(key)
+        speed = rss = '-'
+        if base and base['items_per_sec']:
+            speed = '{:.2f}x'.format(res['items_per_sec'] / base['items_per_sec'])
+        if base and base.get('peak_rss') and res['peak_rss']:
+            rss = '{:.2f}x'.format(float(res['peak_rss']) / base['peak_rss'])
+        mb = '{:.1f}'.format(res['peak_rss'] / 1024.0 / 1024.0) if res['peak_rss'] else 'n/a'
+        print('{:<22} {:>8d} {:>12.2f} {:>10} {:>12.2f} {:>10.2f} {:>12} {:>10}'.format(
+            key, res['items'], res['items_per_sec'], speed, res['calls_per_item'], res['slept'], mb, rss))
+
+
+def main(args):
+    log.basicConfig(format='%(levelname)s:%(message)s', level=log.WARNING)
+    names = args.methods.split(',') if args.methods else sorted(benchmarks)
+    sizes = [int(s) for s in args.sizes.split(',')] if args.sizes else DEFAULT_SIZES
+
+    results = run(names, sizes, args.latency, args.prune, args.min_delay, not args.window, args.fake)
+
+    baseline = {}
+    if os.path.isfile(args.baseline):
+        with open(args.baseline, 'r') as f:
+            baseline = json.load(f)
+    compare(results, baseline)
+
+    if args.save_baseline:
+        baseline.update(results)
+        with open(args.baseline, 'w') as f:
+            json.dump(baseline, f, indent=2, sort_keys=True)
+        print('Saved the results as the baseline in {}'.format(args.baseline))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark the crawler against a local fake Facebook.')
+    parser.add_argument('--methods', '-m', dest='methods', required=False,
+                        help='comma separated benchmarks to run: ' + ', '.join(sorted(benchmarks)))
+    parser.add_argument('--sizes', '-s', dest='sizes', required=False,
+                        help='comma separated numbers of items to crawl (default: 100,1000)')
+    parser.add_argument('--latency', dest='latency', type=float, default=0.0,
+                        help='seconds the fake Facebook waits before answering each request')
+    parser.add_argument('--min-delay', dest='min_delay', type=float, default=0.5,
+                        help='the min_delay of the crawler in seconds')
+    parser.add_argument('--prune', dest='prune', action='store_true',
+                        help='prune scraped items from the page while crawling')
+    parser.add_argument('--fake', dest='fake', action='store_true',
+                        help='crawl with the in-process FakeDriver instead of Firefox and the local server')
+    parser.add_argument('--window', dest='window', action='store_true',
+                        help='show the browser window instead of running headless')
+    parser.add_argument('--baseline', dest='baseline', default=BASELINE_FILE,
+                        help='the file to compare the results against')
+    parser.add_argument('--save-baseline', dest='save_baseline', action='store_true',
+                        help='save the results as the new baseline')
+    main(parser.parse_args())
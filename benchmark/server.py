@@ -0,0 +1,103 @@
+"""A local fake Facebook serving the synthetic pages in fixtures.py.
+
+The size of each profile is part of its url so any size can be crawled without any setup:
+    /bench-<size>                     timeline, add ?sk=friends, ?sk=likes, ?sk=photos, ?sk=photos_albums,
+                                      ?sk=about, ?sk=groups or ?sk=map for the other sections
+    /album/<size>                     an album with <size> photos
+    /search/<size>/str/bench/users-named   <size> search results
+    /events/<size>                    an event with <size> guests for each response
+Every request is delayed by <latency> seconds to simulate the network.
+
+Example usage (from the root folder of the project):
+    python -m benchmark.server --port 8000 --latency 0.2
+"""
+
+import argparse
+
+from threading import Thread
+from time import sleep
+
+try:
+    from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+    from SocketServer import ThreadingMixIn
+    from urlparse import urlparse, parse_qs
+except ImportError:
+    from http.server import BaseHTTPRequestHandler, HTTPServer
+    from socketserver import ThreadingMixIn
+    from urllib.parse import urlparse, parse_qs
+
+# local imports
+import fixtures
+
+
+# a 1x1 transparent gif served for every image
+PIXEL = (b'GIF89a\x01\x00\x01\x00\x80\x00\x00\x00\x00\x00\xff\xff\xff!\xf9\x04\x01\x00\x00\x00\x00'
+         b',\x00\x00\x00\x00\x01\x00\x01\x00\x00\x02\x02D\x01\x00;')
+
+
+class FakeFacebookHandler(BaseHTTPRequestHandler):
+
+    def log_message(self, *args):
+        # don't flood the benchmark output with every request
+        pass
+
+    def _send(self, body, content_type='text/html; charset=utf-8', status=200):
+        if not isinstance(body, bytes):
+            body = body.encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        if url.path.startswith('/img/'):
+            return self._send(PIXEL, 'image/gif')
+
+        sleep(self.server.latency)
+        body = fixtures.page(url.path, parse_qs(url.query), self.server.batch)
+        if body is None:
+            return self._send(fixtures.missing_page(), status=404)
+        self._send(body)
+
+
+class FakeFacebook(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+    def __init__(self, port=0, latency=0.0, batch=20):
+        """Serves the fake Facebook on localhost. A port of 0 picks any free port.
+        <latency> is how many seconds to wait before answering each request.
+        <batch> is how many items are sent with a page and with each infinite scroll request.
+        """
+        HTTPServer.__init__(self, ('127.0.0.1', port), FakeFacebookHandler)
+        self.latency = latency
+        self.batch = batch
+
+    @property
+    def url(self):
+        return 'http://127.0.0.1:{}'.format(self.server_address[1])
+
+    def start(self):
+        """Starts serving in a background thread.
+        """
+        Thread(target=self.serve_forever, name='fake-facebook').start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Serve a fake Facebook for benchmarking.')
+    parser.add_argument('--port', '-p', dest='port', type=int, default=8000,
+                        help='the port to serve on')
+    parser.add_argument('--latency', dest='latency', type=float, default=0.0,
+                        help='seconds to wait before answering each request')
+    parser.add_argument('--batch', dest='batch', type=int, default=20,
+                        help='the number of items sent with each page and infinite scroll request')
+    args = parser.parse_args()
+    server = FakeFacebook(args.port, args.latency, args.batch)
+    print('Serving a fake Facebook at {}'.format(server.url))
+    server.serve_forever()
@@ -1,5 +1,18 @@
+import metrics
 import search
+import tracing
 
+from archive import SnapshotArchive, SnapshotRecorder
 from base import BaseCrawler
+from browser import BrowserProfile
+from checkpoint import Checkpoint
 from crawler import FBCrawler
+from download import DownloadEngine
+from index import SeenIndex
+from latency import LatencyModel
 from scraper import FBScraper
+from pool import ScraperPool
+from record import CSVSink
+from sinks import ParquetSink, SQLiteSink
+from stats import CrawlStats
+from writer import RecordWriter
@@ -0,0 +1,109 @@
+import json
+import mmap
+import os
+import zlib
+
+from threading import Lock
+from time import time
+
+# local imports
+from helpers import get_target, path_safe
+from record import make_path
+
+
+class SnapshotArchive(object):
+
+    def __init__(self, path, level=6):
+        """An append-only archive of compressed page snapshots.
+        Every snapshot is compressed on its own and appended to <path>.snap, and its position is appended to
+        the index in <path>.idx. Reading a snapshot back only decompresses that one snapshot.
+        <level> is the zlib compression level.
+        """
+        self.path = path
+        self.level = level
+        self.data_file = path + '.snap'
+        self.index_file = path + '.idx'
+        self._index = None
+        self._map = None
+        self._map_file = None
+
+    def append(self, kind, url, page_source):
+        """Adds a snapshot of the page at url. <kind> describes when the snapshot was taken, e.g. 'load' or 'scroll'.
+        """
+        data = zlib.compress(page_source.encode('utf-8'), self.level)
+        with open(self.data_file, 'ab') as f:
+            f.seek(0, os.SEEK_END)
+            offset = f.tell()
+            f.write(data)
+        entry = {'offset': offset, 'length': len(data), 'time': time(), 'kind': kind, 'url': url}
+        with open(self.index_file, 'a') as f:
+            f.write(json.dumps(entry) + '\n')
+        if self._index is not None:
+            self._index.append(entry)
+
+    def index(self):
+        """Returns a list of the position, time, kind and url of every snapshot in the archive.
+        """
+        if self._index is None:
+            self._index = []
+            if os.path.isfile(self.index_file):
+                with open(self.index_file, 'r') as f:
+                    self._index = [json.loads(line) for line in f if line.strip()]
+        return self._index
+
+    def __len__(self):
+        return len(self.index())
+
+    def read(self, i):
+        """Returns the page source of the <i>th snapshot.
+        """
+        entry = self.index()[i]
+        end = entry['offset'] + entry['length']
+        if self._map is None or len(self._map) < end:
+            # the archive has grown since it was last mapped
+            self.close()
+            self._map_file = open(self.data_file, 'rb')
+            self._map = mmap.mmap(self._map_file.fileno(), 0, access=mmap.ACCESS_READ)
+        return zlib.decompress(self._map[entry['offset']:end]).decode('utf-8')
+
+    def __iter__(self):
+        """Yields the index entry and page source of every snapshot in order.
+        """
+        for i, entry in enumerate(self.index()):
+            yield entry, self.read(i)
+
+    def close(self):
+        if self._map is not None:
+            self._map.close()
+            self._map_file.close()
+            self._map = None
+            self._map_file = None
+
+
+class SnapshotRecorder(object):
+
+    def __init__(self, folder, level=6):
+        """Keeps a SnapshotArchive for every target and section inside folder, e.g. <folder>/zuck/crawl_friends.snap
+        Can be shared between crawlers.
+        """
+        self.folder = folder
+        self.level = level
+        self.archives = {}
+        self._lock = Lock()
+
+    def archive(self, target, section):
+        """Returns the archive for the section of the target.
+        """
+        name = path_safe(get_target(target) or target) if target else 'unknown'
+        key = (name, section)
+        with self._lock:
+            if key not in self.archives:
+                folder = os.path.join(self.folder, name)
+                make_path(folder)
+                self.archives[key] = SnapshotArchive(os.path.join(folder, section or 'page'), self.level)
+            return self.archives[key]
+
+    def record(self, target, section, kind, url, page_source):
+        archive = self.archive(target, section)
+        with self._lock:
+            archive.append(kind, url, page_source)
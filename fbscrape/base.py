@@ -1,12 +1,332 @@
 import logging as log
+import re
 
 from contextlib import contextmanager
 
-from selenium import webdriver
-from selenium.common.exceptions import ElementNotVisibleException, WebDriverException
+from selenium.common.exceptions import ElementNotVisibleException, TimeoutException, WebDriverException
 from selenium.webdriver.support.ui import WebDriverWait
 
 from time import sleep, time
+from uuid import uuid4
+
+# local imports
+import tracing
+
+from browser import BrowserProfile
+from metrics import registry as metrics
+from latency import LatencyModel
+from stats import CrawlStats
+
+
+# the longest a single call waiting for items lasts, so stop requests are noticed between calls
+WAIT_SLICE = 0.2
+
+
+# Finds the items matching a selector inside root (or the whole document) which come after the last item tagged
+# by a cursor. New items are added to the end of the list, so once a cursor has tagged some items only the
+# elements after the last of them are looked at instead of the whole page, which keeps the cost of each batch
+# flat however long the list gets. Items added in front of it are missed. Pruning can replace the last item with
+# its placeholder (see PRUNE_ITEMS_JS). XPath selectors are evaluated from the last item with <following> (see
+# Cursor.following), or over the whole of root if the selector couldn't be rewritten.
+UNSEEN_ITEMS_JS = """
+function unseenItems(root, selector, byXPath, token, following) {
+    var result = [], i;
+    var last = (window.__fbscrapeCursors || {})[token], known = last && root.contains(last);
+    if (byXPath) {
+        var context = following && known ? last : root;
+        var snap = document.evaluate(following && known ? following : selector, context, null,
+                                     XPathResult.ORDERED_NODE_SNAPSHOT_TYPE, null);
+        for (i = 0; i < snap.snapshotLength; i++) {
+            result.push(snap.snapshotItem(i));
+        }
+        return result;
+    }
+    if (!known) {
+        return Array.prototype.slice.call(root.querySelectorAll(selector));
+    }
+    var walker = document.createTreeWalker(root === document ? document.body : root, NodeFilter.SHOW_ELEMENT);
+    walker.currentNode = last;
+    while (walker.nextNode()) {
+        if (walker.currentNode.matches(selector)) {
+            result.push(walker.currentNode);
+        }
+    }
+    return result;
+}
+
+function rememberLast(token, items) {
+    if (items.length) {
+        window.__fbscrapeCursors = window.__fbscrapeCursors || {};
+        window.__fbscrapeCursors[token] = items[items.length - 1];
+    }
+}
+"""
+
+
+# Waits for items matching a selector to show up inside root (or the whole document).
+# Resolves with [number of matching items, true] as soon as <target> items exist or once the DOM has stopped
+# changing for <quiet> ms, or with [number of matching items, false] once <slice> ms have passed without either.
+# When the page last changed is kept in the page between calls so a long wait can be split into short calls,
+# <fresh> starts the quiet period over. Only the items after the last one tagged by the cursor with <token> count.
+WAIT_FOR_ITEMS_JS = UNSEEN_ITEMS_JS + """
+var root = arguments[0] || document, selector = arguments[1], byXPath = arguments[2],
+    target = arguments[3], quiet = arguments[4], slice = arguments[5], fresh = arguments[6], token = arguments[7],
+    following = arguments[8], done = arguments[arguments.length - 1];
+var node = root === document ? document.body : root, start = Date.now();
+var state = window.__fbscrapeWait;
+
+function count() {
+    return unseenItems(root, selector, byXPath, token, following).length;
+}
+
+if (!state || state.node !== node) {
+    if (state) {
+        state.observer.disconnect();
+    }
+    state = window.__fbscrapeWait = {node: node, changed: start};
+    state.observer = new MutationObserver(function() {
+        state.changed = Date.now();
+    });
+    state.observer.observe(node, {childList: true, subtree: true});
+}
+if (fresh) {
+    state.changed = start;
+}
+
+// don't re-run the selector on every single mutation, facebook makes a lot of them
+function check() {
+    var now = Date.now(), n = count();
+    if (n >= target || now - state.changed >= quiet) {
+        done([n, true]);
+    } else if (now - start >= slice) {
+        done([n, false]);
+    } else {
+        setTimeout(check, 50);
+    }
+}
+check();
+"""
+
+
+# Extracts fields from every item matching a selector in a single round trip and tags the items with
+# the given attribute. Returns a list with one object per item, see field() for the format of the fields.
+EXTRACT_ITEMS_JS = UNSEEN_ITEMS_JS + """
+var root = arguments[0] || document, selector = arguments[1], byXPath = arguments[2],
+    fields = arguments[3], mark = arguments[4], following = arguments[5];
+
+function select(context, by, selector) {
+    var result = [], i;
+    if (by === 'self') {
+        return [context];
+    }
+    if (by === 'xpath') {
+        var snap = document.evaluate(selector, context, null, XPathResult.ORDERED_NODE_SNAPSHOT_TYPE, null);
+        for (i = 0; i < snap.snapshotLength; i++) {
+            result.push(snap.snapshotItem(i));
+        }
+        return result;
+    }
+    if (by === 'link') {
+        var links = context.querySelectorAll('a');
+        for (i = 0; i < links.length; i++) {
+            if ((links[i].innerText || links[i].textContent).trim() === selector) {
+                result.push(links[i]);
+            }
+        }
+        return result;
+    }
+    // css selectors can be a list of fallbacks which are tried in order
+    var selectors = [].concat(selector);
+    for (i = 0; i < selectors.length; i++) {
+        result = Array.prototype.slice.call(context.querySelectorAll(selectors[i]));
+        if (result.length) {
+            break;
+        }
+    }
+    return result;
+}
+
+function value(el, attr) {
+    if (attr === 'exists') {
+        return el !== undefined;
+    }
+    if (el === undefined) {
+        return null;
+    }
+    if (attr === 'element') {
+        return el;
+    }
+    if (attr === 'text') {
+        return (el.innerText || el.textContent || '').trim();
+    }
+    if (attr === 'bg') {
+        var style = el.currentStyle || window.getComputedStyle(el, false);
+        return style['background-image'].replace(/^url\\(["']?/, '').replace(/["']?\\)$/, '');
+    }
+    // prefer the property like webdriver does so that urls are absolute
+    var prop = el[attr];
+    if (typeof prop === 'string' || typeof prop === 'number' || typeof prop === 'boolean') {
+        return prop;
+    }
+    return el.getAttribute(attr);
+}
+
+var items = unseenItems(root, selector, byXPath, mark[1], following);
+var results = items.map(function(item) {
+    var res = {};
+    for (var name in fields) {
+        var f = fields[name];
+        res[name] = value(select(item, f.by, f.selector)[f.index], f.attr);
+    }
+    // tag the item so the next query skips it
+    item.setAttribute(mark[0], mark[1]);
+    return res;
+});
+// the next query starts after the last item
+rememberLast(mark[1], items);
+return results;
+"""
+
+
+def field(attr, selector=None, by='css', index=0):
+    """Describes a value to be extracted from an item by BaseCrawler.extract_items.
+    <attr> is the attribute to read: 'text' for the visible text, 'bg' for the background image url,
+    'exists' to check whether the selector matches anything, 'element' for the element itself, otherwise
+    the name of an attribute (e.g. 'href').
+    <selector> is relative to the item. If no selector is given the item itself is used. <by> is either
+    'css', 'xpath' or 'link' (matches links by their text). A list of css selectors can be given, in which
+    case the first one that matches is used. <index> chooses which of the matching elements to use.
+    """
+    return {
+        'attr': attr,
+        'selector': selector,
+        'by': by if selector is not None else 'self',
+        'index': index,
+    }
+
+
+# Empties every item matching the selector (or the closest container of each item) while keeping its height,
+# so the page stays small without breaking the scroll position and facebook's infinite scroll.
+# If the last item tagged by the cursor with <token> is emptied out its placeholder takes its place.
+PRUNE_ITEMS_JS = """
+var root = arguments[0] || document, selector = arguments[1], container = arguments[2], token = arguments[3];
+var items = root.querySelectorAll(selector), pruned = 0, cursors = window.__fbscrapeCursors || {};
+for (var i = 0; i < items.length; i++) {
+    var target = (container && items[i].closest(container)) || items[i];
+    if (target.hasAttribute('data-fbscrape-pruned')) {
+        continue;
+    }
+    if (cursors[token] && target !== cursors[token] && target.contains(cursors[token])) {
+        cursors[token] = target;
+    }
+    target.style.height = target.offsetHeight + 'px';
+    target.style.overflow = 'hidden';
+    while (target.firstChild) {
+        target.removeChild(target.firstChild);
+    }
+    target.setAttribute('data-fbscrape-pruned', '');
+    pruned++;
+}
+return pruned;
+"""
+
+
+def _xpath_steps(path):
+    """Splits an xpath into its steps and the separator ('/' or '//') in front of each, ignoring slashes inside
+    predicates and strings. Returns None if it's a union of paths.
+    """
+    steps, seps, depth, quote, start, i = [], [], 0, None, 0, 0
+    while i < len(path):
+        c = path[i]
+        if quote:
+            quote = None if c == quote else quote
+        elif c in '"\'':
+            quote = c
+        elif c == '[':
+            depth += 1
+        elif c == ']':
+            depth -= 1
+        elif c == '|' and not depth:
+            return None
+        elif c == '/' and not depth:
+            steps.append(path[start:i])
+            sep = '//' if path[i:i + 2] == '//' else '/'
+            seps.append(sep)
+            i += len(sep)
+            start = i
+            continue
+        i += 1
+    steps.append(path[start:])
+    return steps, [''] + seps
+
+
+# a step with a name test and predicates, without an axis or a position in its predicates
+_simple_step = re.compile(r'^(\*|[A-Za-z_][\w.-]*)(\[.*\])?$')
+_positional = re.compile(r'\[\s*\d+\s*\]|position\(\)|last\(\)')
+
+
+def following_xpath(path):
+    """Rewrites an absolute xpath like //div[@id='x']//li//a[@href] into one evaluated from any node which only
+    matches the nodes after it: following::a[@href][ancestor::li[ancestor::div[@id='x']]].
+    Returns None for the paths it can't rewrite, i.e. relative paths, unions, axes and positional predicates.
+    """
+    split = _xpath_steps(path)
+    if split is None:
+        return None
+    steps, seps = split
+    # an absolute path starts with an empty step before the first //
+    if steps[0] or seps[1:2] != ['//'] or len(steps) < 2:
+        return None
+    steps, seps = steps[1:], seps[2:]
+    if not all(_simple_step.match(step) for step in steps) or _positional.search(path):
+        return None
+    condition = steps[0]
+    for step, sep in zip(steps[1:-1], seps[:-1]):
+        condition = '{}[{}::{}]'.format(step, 'ancestor' if sep == '//' else 'parent', condition)
+    if len(steps) == 1:
+        return 'following::' + steps[0]
+    return 'following::{}[{}::{}]'.format(steps[-1], 'ancestor' if seps[-1] == '//' else 'parent', condition)
+
+
+class Cursor(object):
+    """Keeps track of which items matching a selector have already been processed by tagging them in the page.
+    Only the untagged items after the last tagged one are ever queried so the cost of each batch doesn't grow
+    with the size of the page (xpath selectors which following_xpath can't rewrite still go through the whole
+    page).
+    <root> is an optional element to search inside of.
+    <container> is an optional css selector for the closest ancestor of each item to remove when pruning.
+    """
+    attribute = 'data-fbscrape'
+
+    def __init__(self, selector, xpath=False, root=None, container=None):
+        self.selector = selector
+        self.xpath = xpath
+        self.root = root
+        self.container = container
+        # use a new token for every cursor so the same page can be crawled more than once
+        self.token = uuid4().hex[:8]
+
+    @property
+    def unseen(self):
+        """A selector matching only the items that haven't been tagged by this cursor yet.
+        """
+        if self.xpath:
+            return '{}[not(@{}="{}")]'.format(self.selector, self.attribute, self.token)
+        untagged = ':not([{}="{}"])'.format(self.attribute, self.token)
+        return ', '.join(part.strip() + untagged for part in self.selector.split(','))
+
+    @property
+    def following(self):
+        """For xpath cursors, an xpath matching the same items as unseen which is evaluated from the last item
+        tagged so only the nodes after it are looked at. None if the selector can't be rewritten that way.
+        """
+        return following_xpath(self.unseen) if self.xpath else None
+
+    @property
+    def seen(self):
+        """A css selector matching the items that have been tagged by this cursor but not pruned yet.
+        """
+        return '[{}="{}"]:not([data-fbscrape-pruned])'.format(self.attribute, self.token)
 
 
 @contextmanager
@@ -20,55 +340,168 @@ def wait_for_page_load(driver, timeout=30.0):
 
 class BaseCrawler(object):
 
-    def __init__(self, min_delay=2, dynamic_delay=True):
-        """By default the crawler will measure the average time a page takes to load and
+    def __init__(self, min_delay=2, dynamic_delay=True, profile=None, latency=None, driver=None):
+        """By default the crawler will measure the typical time each type of page takes to load and
         waits that amount of time (minimum of 2 seconds by default). If you want it to always
         wait a constant period of time, set dynamic_delay to False. It will then always
         wait <min_delay> number of seconds.
+        <profile> is the BrowserProfile to launch the browser with. By default it's a normal windowed Firefox.
+        <latency> is a LatencyModel to start from, e.g. one saved from a previous run.
+        <driver> is an already running WebDriver to use instead of launching a browser from the profile.
         """
-        self.driver = webdriver.Firefox()
+        self.profile = profile if profile else BrowserProfile()
+        self.driver = driver if driver else self.profile.launch()
         self.min_delay = min_delay  # seconds to wait for infinite scroll items to populate
-        self.loads = 0
-        self.load_time = 0
+        self.latency = latency if latency else LatencyModel()
+        self.page_type = 'page'  # the type of page currently loaded
+        self.delay_percentile = 50  # how long to wait compared to previous loads of the same page type
+        self.timeout_percentile = 95  # the slow loads used for working out when to give up
+        self.min_load_timeout = 30.0  # never give up on a page sooner than this many seconds
+        self.load_retries = 1  # how many more times to try loading a page which timed out
         self.dynamic_delay = dynamic_delay
+        # remove items from the page once they've been extracted to keep memory usage flat on long lists
+        self.prune = False
+        # a SnapshotRecorder to save the page to after every load and scroll, if any
+        self.snapshots = None
+        # what is currently being crawled, used for naming the snapshots
+        self.target = None
+        self.section = None
+        # counts and times every command sent to the browser and every delay
+        self.stats = CrawlStats()
+        self._use_driver(self.driver)
 
+    def _use_driver(self, driver):
+        self.driver = driver
+        self.stats.instrument(driver, lambda: (self.section, self.target))
         # shorter funciton for executing javascript
-        self.js = self.driver.execute_script
+        self.js = driver.execute_script
 
     def __del__(self):
         self.driver.quit()
 
-    def _update_delay(self, seconds):
-        self.load_time += seconds
-        self.loads += 1
+    def browser_alive(self):
+        """Returns False if the browser has crashed or been closed.
+        """
+        try:
+            self.driver.current_url
+            return True
+        except WebDriverException:
+            return False
+
+    def relaunch(self):
+        """Closes the browser (if it's still running) and launches a new one from the profile.
+        The new browser isn't logged in.
+        """
+        try:
+            self.driver.quit()
+        except WebDriverException:
+            pass
+        self._use_driver(self.profile.launch())
+        metrics.inc('fbscrape_browser_restarts_total')
+
+    def _delay_secs(self, multiplier=1):
+        """Returns the typical amount of time it has taken to load the current type of page
+        or at least self.min_delay seconds.
+        """
+        typical = self.latency.percentile(self.page_type, self.delay_percentile)
+        if typical is None or not self.dynamic_delay:
+            return self.min_delay * multiplier
+        return max(typical, self.min_delay) * multiplier
+
+    def _load_timeout(self):
+        """Returns how long to wait for the current type of page to load before giving up, three times as long
+        as the slow loads of this type of page but at least self.min_load_timeout seconds.
+        """
+        slow = self.latency.percentile(self.page_type, self.timeout_percentile)
+        if slow is None:
+            return self.min_load_timeout
+        return max(slow * 3, self.min_load_timeout)
 
     def delay(self, multiplier=1):
-        """Sleeps the average amount of time it has taken to load a page or at least self.min_delay seconds.
+        """Sleeps the typical amount of time it has taken to load this type of page or at least self.min_delay seconds.
         Multiplier is how much more or less time you want to wait. e.g. multiplier=2 would wait 2 times
         as long as usual.
         """
-        if self.loads == 0:
-            secs = self.min_delay
-        else:
-            avg = self.load_time / self.loads
-            secs = max(avg, self.min_delay) if self.dynamic_delay else self.min_delay
-            secs *= multiplier
+        secs = self._delay_secs(multiplier)
         log.info('Sleeping %f seconds', secs)
+        metrics.set('fbscrape_delay_seconds', secs)
+        start = time()
+        with tracing.span('delay', seconds=secs):
+            self._sleep(secs)
+        self.stats.add_sleep(self.section, self.target, time() - start)
+
+    def _sleep(self, secs):
         sleep(secs)
 
-    def load(self, url, force=False, scroll=True):
+    def _interrupted(self):
+        """Returns True if whatever is being waited for should be given up on, e.g. because of a stop request.
+        """
+        return False
+
+    def wait_for_items(self, cursor, new=1, quiet=None, timeout=None):
+        """Waits for new items to be added to the page instead of sleeping a fixed time.
+        Returns as soon as there are at least <new> items the cursor hasn't seen yet, when the page (or the cursor's
+        root element) has stopped changing for <quiet> seconds, or when <timeout> seconds have passed,
+        whichever comes first. By default quiet is self.min_delay and the timeout is three times the usual delay.
+        The wait is split into calls of WAIT_SLICE seconds so it also stops soon after _interrupted() is True.
+        Returns the number of unseen items.
+        """
+        quiet = self.min_delay if quiet is None else quiet
+        timeout = max(self._delay_secs(3), quiet) if timeout is None else timeout
+        end = time() + timeout
+        # give the script a bit of leeway before webdriver gives up on it
+        self.driver.set_script_timeout(WAIT_SLICE + 5)
+        fresh = True
+        try:
+            while True:
+                remaining = max(end - time(), 0)
+                found, finished = self.driver.execute_async_script(
+                    WAIT_FOR_ITEMS_JS, cursor.root, cursor.unseen, cursor.xpath, new, int(quiet * 1000),
+                    int(min(WAIT_SLICE, remaining) * 1000), fresh, cursor.token, cursor.following)
+                if finished or remaining <= WAIT_SLICE or self._interrupted():
+                    return found
+                fresh = False
+        except TimeoutException:
+            log.warning('Timed out waiting for new items to load')
+            return 0
+
+    def load(self, url, force=False, scroll=True, page_type=None):
         """Load url in the browser if it's not already loaded. Use force=True to force a reload.
-        Also keeps track of how long it has taken to load.
+        Also keeps track of how long it has taken to load, per <page_type> (e.g. 'posts' or 'friends').
         If scroll is True (default) it will scroll to the bottom once load is complete (to trigger infinite scroll).
+        A page which doesn't load in time is tried again self.load_retries times.
+        Returns False if it never loaded, in which case whatever needed the page should be skipped.
         """
+        if page_type:
+            self.page_type = page_type
         if url == self.driver.current_url and not force:
-            return
-        start = time()
-        with wait_for_page_load(self.driver):
-            self.driver.get(url)
-        self._update_delay(time() - start)
-        if scroll:
-            self.scroll_to_bottom()
+            return True
+        with tracing.span('load', url=url, page_type=self.page_type):
+            start = time()
+            for attempt in range(self.load_retries + 1):
+                try:
+                    with tracing.span('wait_for_page_load', attempt=attempt):
+                        with wait_for_page_load(self.driver, self._load_timeout()):
+                            self.driver.get(url)
+                    break
+                except TimeoutException:
+                    log.warning('Timed out loading %s (attempt %d of %d)', url, attempt + 1, self.load_retries + 1)
+            else:
+                log.error('Giving up on loading %s', url)
+                return False
+            elapsed = time() - start
+            self.latency.add(self.page_type, elapsed)
+            metrics.observe('fbscrape_page_load_seconds', elapsed, page_type=self.page_type)
+            self._snapshot('load')
+            if scroll:
+                self.scroll_to_bottom()
+        return True
+
+    def _snapshot(self, kind):
+        """Saves the current page source if snapshots are being recorded.
+        """
+        if self.snapshots is not None:
+            self.snapshots.record(self.target, self.section, kind, self.driver.current_url, self.driver.page_source)
 
     def centre_on_element(self, el, wait=False):
         self.js('window.scrollTo(0, arguments[0].getBoundingClientRect().top + window.pageYOffset - window.innerHeight /2)', el)
@@ -83,6 +516,36 @@ class BaseCrawler(object):
         if wait:
             self.delay()
 
+    def extract_items(self, cursor, fields):
+        """Returns a list of dicts, one for every item the cursor hasn't seen yet, and marks them as seen.
+        <fields> maps the keys of each dict to a field() describing the value to extract from the item.
+        Everything is evaluated inside the page so the whole batch only costs a single round trip.
+        """
+        return self.js(EXTRACT_ITEMS_JS, cursor.root, cursor.unseen, cursor.xpath, fields,
+                       [cursor.attribute, cursor.token], cursor.following)
+
+    def prune_items(self, cursor):
+        """Empties the items the cursor has already seen, leaving behind blank placeholders of the same height.
+        Returns the number of items pruned.
+        """
+        return self.js(PRUNE_ITEMS_JS, cursor.root, cursor.seen, cursor.container, cursor.token)
+
+    def scroll_for_items(self, cursor, scroller=None, **kwargs):
+        """Scrolls to the bottom of the page (or the bottom of the scroller element if given) to trigger
+        infinite scroll, and waits until items the cursor hasn't seen yet have populated.
+        Accepts the same keyword arguments as wait_for_items. Returns the number of unseen items.
+        If self.prune is True, the items the cursor has already seen are pruned from the page first.
+        """
+        with tracing.span('scroll'):
+            if self.prune:
+                self.prune_items(cursor)
+            if scroller is None:
+                self.scroll_to_bottom()
+            else:
+                self.js('a = arguments[0]; a.scrollTo(0, a.scrollHeight);', scroller)
+            found = self.wait_for_items(cursor, **kwargs)
+            self._snapshot('scroll')
+        return found
 
     def force_click(self, parent, clickable):
         """Will attempt to click on clickable 3 times. Assume you can tell if it was successful if the text
@@ -90,19 +553,20 @@ class BaseCrawler(object):
         Waits 0.5 seconds after each click. On the last attempt, wait the full delay duration.
         Returns True if the text of the parent changed.
         """
-        try:
-            post_text = parent.text
-            attempts = 3
-            self.centre_on_element(clickable)
-            while post_text == parent.text and attempts > 0:
-                attempts -= 1
-                clickable.click()
-                sleep(0.5)
-                if attempts == 1:
-                    self.delay()
-            return post_text != parent.text
-        except (WebDriverException, ElementNotVisibleException):
-            return False
+        with tracing.span('force_click'):
+            try:
+                post_text = parent.text
+                attempts = 3
+                self.centre_on_element(clickable)
+                while post_text == parent.text and attempts > 0:
+                    attempts -= 1
+                    clickable.click()
+                    self._sleep(0.5)
+                    if attempts == 1:
+                        self.delay()
+                return post_text != parent.text
+            except (WebDriverException, ElementNotVisibleException):
+                return False
 
 
     def get_bg_img_url(self, el):
@@ -120,6 +584,6 @@ class BaseCrawler(object):
         return img.strip("'").strip('"')
 
     def reload(self, scroll=True):
-        """Force a reload of the current page.
+        """Force a reload of the current page. Returns False if it didn't load.
         """
-        self.load(self.driver.current_url, force=True, scroll=scroll)
+        return self.load(self.driver.current_url, force=True, scroll=scroll)
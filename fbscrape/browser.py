@@ -0,0 +1,59 @@
+from selenium import webdriver
+from selenium.webdriver.firefox.options import Options
+
+
+class BrowserProfile(object):
+
+    def __init__(self, headless=False, block_images=False, block_media=False, block_fonts=False,
+                 disable_animations=False):
+        """Describes how to set up the browser the crawler uses. The default is a normal windowed Firefox.
+        The crawler only reads text and urls from the page so it doesn't need to download images, video or fonts,
+        or run animations. Turning those off makes pages load a lot faster and use a lot less memory.
+        """
+        self.headless = headless
+        self.block_images = block_images
+        self.block_media = block_media
+        self.block_fonts = block_fonts
+        self.disable_animations = disable_animations
+
+    @classmethod
+    def lightweight(cls, headless=True):
+        """A profile that blocks everything the crawler doesn't need.
+        """
+        return cls(headless=headless, block_images=True, block_media=True, block_fonts=True,
+                   disable_animations=True)
+
+    def preferences(self):
+        """Returns the Firefox preferences for this profile.
+        """
+        prefs = {
+            # facebook asks to show notifications which gets in the way of clicking things
+            'dom.webnotifications.enabled': False,
+            'permissions.default.desktop-notification': 2,
+        }
+        if self.block_images:
+            prefs['permissions.default.image'] = 2
+        if self.block_media:
+            prefs['media.autoplay.enabled'] = False
+            prefs['media.autoplay.default'] = 5
+            prefs['media.mediasource.enabled'] = False
+            prefs['media.peerconnection.enabled'] = False
+        if self.block_fonts:
+            prefs['browser.display.use_document_fonts'] = 0
+            prefs['gfx.downloadable_fonts.enabled'] = False
+        if self.disable_animations:
+            prefs['toolkit.cosmeticAnimations.enabled'] = False
+            prefs['image.animation_mode'] = 'none'
+            prefs['ui.prefersReducedMotion'] = 1
+        return prefs
+
+    def launch(self):
+        """Starts a new Firefox with this profile and returns its webdriver.
+        """
+        profile = webdriver.FirefoxProfile()
+        for key, value in self.preferences().items():
+            profile.set_preference(key, value)
+        options = Options()
+        if self.headless:
+            options.add_argument('-headless')
+        return webdriver.Firefox(firefox_profile=profile, firefox_options=options)
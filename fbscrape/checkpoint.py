@@ -0,0 +1,98 @@
+import json
+import logging as log
+import os
+
+from threading import Lock
+from time import time
+
+
+class Checkpoint(object):
+
+    def __init__(self, filename, save_every=5.0):
+        """Keeps track of the progress of a run in a JSON file so an interrupted run can carry on where it
+        left off: the targets which are done, the sections of each target which are done, the record file
+        each section is being written to and the key of the last item recorded in each section.
+        The file is written to at most every <save_every> seconds while items are being recorded, and straight
+        away whenever a section or target is finished. Can be shared between scrapers.
+        """
+        self.filename = filename
+        self.save_every = save_every
+        self.state = {'targets': {}}
+        self.last_save = 0
+        self._lock = Lock()
+        if os.path.isfile(filename):
+            with open(filename, 'r') as f:
+                self.state = json.load(f)
+            log.info('Resuming from the checkpoint in %s', filename)
+
+    def _target(self, target):
+        return self.state['targets'].setdefault(target, {'done': False, 'sections': {}})
+
+    def _section(self, target, section):
+        return self._target(target)['sections'].setdefault(section, {'done': False, 'file': None, 'last': None})
+
+    def _save(self):
+        # only called while holding the lock
+        # write to a temporary file first so a crash halfway through writing doesn't lose the checkpoint
+        tmp = self.filename + '.tmp'
+        with open(tmp, 'w') as f:
+            json.dump(self.state, f, indent=1, sort_keys=True)
+        try:
+            os.replace(tmp, self.filename)
+        except AttributeError:
+            # python 2 doesn't have os.replace but rename replaces the file on anything but windows
+            if os.name == 'nt' and os.path.exists(self.filename):
+                os.remove(self.filename)
+            os.rename(tmp, self.filename)
+        self.last_save = time()
+
+    def save(self):
+        with self._lock:
+            self._save()
+
+    def target_done(self, target):
+        with self._lock:
+            return self.state['targets'].get(target, {}).get('done', False)
+
+    def finish_target(self, target):
+        with self._lock:
+            self._target(target)['done'] = True
+            self._save()
+
+    def section_done(self, target, section):
+        with self._lock:
+            return self.state['targets'].get(target, {}).get('sections', {}).get(section, {}).get('done', False)
+
+    def finish_section(self, target, section):
+        with self._lock:
+            self._section(target, section)['done'] = True
+            self._save()
+
+    def record_file(self, target, section):
+        """Returns the record file (without the extension) section was being written to, or None.
+        """
+        with self._lock:
+            return self.state['targets'].get(target, {}).get('sections', {}).get(section, {}).get('file')
+
+    def set_record_file(self, target, section, filename):
+        with self._lock:
+            self._section(target, section)['file'] = filename
+            self._save()
+
+    def last_item(self, target, section):
+        """Returns the key of the last item recorded in section, or None.
+        """
+        with self._lock:
+            return self.state['targets'].get(target, {}).get('sections', {}).get(section, {}).get('last')
+
+    def set_last_item(self, target, section, key, flush=None):
+        """Sets the key of the last item recorded in section.
+        <flush> is called before the checkpoint is written, use it to flush the record file so the checkpoint
+        is never ahead of what has actually been written.
+        """
+        with self._lock:
+            self._section(target, section)['last'] = key
+            if time() - self.last_save >= self.save_every:
+                if flush:
+                    flush()
+                self._save()
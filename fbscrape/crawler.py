@@ -2,13 +2,23 @@ import logging as log
 
 from selenium.common.exceptions import NoSuchElementException, WebDriverException
 from datetime import date
+from threading import Condition
+from time import time
 
 # local imports
-from base import BaseCrawler
+import tracing
+
+from base import BaseCrawler, Cursor, field
+from metrics import registry as metrics
 from custom import css_selectors, xpath_selectors, page_references, text_content
 from helpers import join_url
 
 
+# a pinned post can be older than the ones under it, so only stop going down the timeline once
+# this many posts in a row are older than the date being scraped from
+OLD_POSTS_IN_A_ROW = 3
+
+
 def _posts_selector(year=None):
     prefix = css_selectors['recents_container']
     if year:
@@ -22,10 +32,55 @@ def _posts_selector(year=None):
     return prefix + ' ' + css_selectors['user_posts']
 
 
+"""The fields extracted from each item of the different lists, see BaseCrawler.extract_items
+"""
+post_fields = {
+    'text': field('text'),
+    'time': field('data-utime', xpath_selectors['post_date'], by='xpath'),  # this is unix time!!!
+    'link': field('href', xpath_selectors['post_date'] + '/..', by='xpath'),
+    # these all need clicking so we'll need the element itself
+    'see_original': field('exists', text_content['see_original'], by='link'),
+    'see_more': field('exists', css_selectors['see_more']),
+    'see_translation': field('exists', text_content['see_translation_text'], by='link'),
+    'element': field('element'),
+}
+link_fields = {
+    'name': field('text'),
+    'url': field('href'),
+}
+friend_fields = {
+    'name': field('text', xpath_selectors['friend_info'], by='xpath'),
+    'url': field('href', xpath_selectors['friend_info'], by='xpath'),
+    'imgurl': field('src', css_selectors['friend_image']),
+}
+event_guest_fields = {
+    'name': field('text', xpath_selectors['event_friend_info'], by='xpath'),
+    'url': field('href', xpath_selectors['event_friend_info'], by='xpath'),
+    'imgurl': field('src', css_selectors['friend_image']),
+}
+photo_fields = {
+    'source': field('data-starred-src'),
+    'description': field('aria-label', 'a'),
+    'permalink': field('href', 'a'),
+}
+album_photo_fields = {
+    # videos in the video folder don't have an img
+    'source': field('bg', ['img', 'span > div']),
+    'permalink': field('ajaxify'),
+}
+search_result_fields = {
+    'name': field('text', css_selectors['search_link'], index=1),
+    'url': field('href', css_selectors['search_link'], index=1),
+    'imageurl': field('src', css_selectors['search_pics']),
+}
+
+
 class FBCrawler(BaseCrawler):
 
-    def __init__(self):
-        BaseCrawler.__init__(self)
+    def __init__(self, profile=None, latency=None, driver=None):
+        BaseCrawler.__init__(self, profile=profile, latency=latency, driver=driver)
+        # guards the status and the pause/stop requests, and is notified whenever any of them change
+        self._state = Condition()
         self.stop_request = False
         self.pause_request = False
         self.status = 'init'
@@ -36,7 +91,8 @@ class FBCrawler(BaseCrawler):
         Does this by checking if a certain error message text is contained inside the page body.
         """
         try:
-            self.load(targeturl)
+            if not self.load(targeturl, page_type='posts'):
+                return False
             header_text = self.driver.find_element_by_css_selector(css_selectors.get('error_header')).text
             return text_content.get('error_header_text').lower() not in header_text.lower()
         except NoSuchElementException:
@@ -45,10 +101,29 @@ class FBCrawler(BaseCrawler):
     def _set_status(self, s):
         """Sets s as the new status. Returns the previous status as result.
         """
-        temp = self.status
-        self.status = s
+        with self._state:
+            temp = self.status
+            self.status = s
+            self._state.notify_all()
         return temp
 
+    def wait_for_status(self, status, timeout=None):
+        """Blocks until the status is <status> (or one of them if a tuple is given) without using any CPU.
+        Returns False if <timeout> seconds pass before that happens.
+        """
+        statuses = status if isinstance(status, tuple) else (status,)
+        end = time() + timeout if timeout is not None else None
+        with self._state:
+            while self.status not in statuses:
+                if end is None:
+                    self._state.wait()
+                else:
+                    remaining = end - time()
+                    if remaining <= 0:
+                        return False
+                    self._state.wait(remaining)
+        return True
+
     def running(func):
         """This is a decorator in order to set the status as running when running
         and the status as ready when action is complete
@@ -58,20 +133,40 @@ class FBCrawler(BaseCrawler):
             if self.stop_request:
                 return None
 
+            # keep track of what we're crawling, nested crawls (e.g. an album inside the albums)
+            # still belong to the outer target
+            old_target, old_section = self.target, self.section
+            if func.__name__.startswith('crawl_'):
+                self.target = self.target or (args[0] if args else None)
+                self.section = func.__name__
+                # count the items and time how long is spent in the callback if we're tracing
+                # the callback is always the first function given, anything after it (e.g. skip) isn't one
+                args = list(args)
+                for i, a in enumerate(args):
+                    if callable(a):
+                        args[i] = tracing.wrap('callback', metrics.counted(self.section, a))
+                        break
+
             # we're ready to runble
             old = self._set_status('running')
-            ret = func(self, *args, **kwargs)
-            if self.stop_request:
-                self._set_status('stopped')
-            else:
-                self._set_status(old)
-            return ret
+            try:
+                with tracing.tags(target=self.target, section=self.section):
+                    with tracing.span(func.__name__):
+                        return func(self, *args, **kwargs)
+            finally:
+                self.target, self.section = old_target, old_section
+                # even if the crawl failed, otherwise interrupt() would wait for it forever
+                # check the stop request while holding the lock so an interrupt can't slip in between
+                with self._state:
+                    self.status = 'stopped' if self.stop_request else old
+                    self._state.notify_all()
         return do_stuff
 
     @running
     def login(self, user, password):
         try:
-            self.load('https://www.facebook.com/login.php')
+            if not self.load('https://www.facebook.com/login.php', page_type='login'):
+                return False
             self.js("document.querySelector('{}').value = '{}';".format(css_selectors.get('email_field'), user))
             self.js("document.querySelector('{}').value = '{}';".format(css_selectors.get('password_field'), password))
             self.js("document.querySelector('{}').submit();".format(css_selectors.get('login_form')))
@@ -82,35 +177,66 @@ class FBCrawler(BaseCrawler):
             return False
 
     def pause(self):
-        self.pause_request = True
+        with self._state:
+            self.pause_request = True
+            self._state.notify_all()
 
     def unpause(self):
-        self.pause_request = False
+        with self._state:
+            self.pause_request = False
+            self._state.notify_all()
 
     def interrupt(self, callback=None, restart=False):
-        self.stop_request = True
-        if self.status == 'ready':
-            self._set_status('stopped')
-        # loop until we are ready to do things
-        while self.status != 'stopped':
-            pass
+        with self._state:
+            self.stop_request = True
+            if self.status == 'ready':
+                self.status = 'stopped'
+            # wake up anything that's sleeping or paused
+            self._state.notify_all()
+        # wait until we are ready to do things
+        self.wait_for_status('stopped')
         if restart:
             self.restart()
         if callback:
             callback()
 
     def restart(self):
-        self.pause_request = False
-        self.stop_request = False
+        with self._state:
+            self.pause_request = False
+            self.stop_request = False
         self._set_status('ready')
 
+    def _sleep(self, secs):
+        """Sleeps for secs seconds, or until there's a stop request.
+        """
+        end = time() + secs
+        with self._state:
+            while not self.stop_request:
+                remaining = end - time()
+                if remaining <= 0:
+                    return
+                self._state.wait(remaining)
+
+    def _interrupted(self):
+        return self.stop_request
+
+    def _wait_while_paused(self):
+        with self._state:
+            while self.pause_request and not self.stop_request:
+                self._state.wait()
+
     def delay(self, multiplier=1):
         self._set_status('paused')
         BaseCrawler.delay(self, multiplier)
-        while (self.pause_request) and not self.stop_request:
-            pass
+        self._wait_while_paused()
         self._set_status('running')
 
+    def wait_for_items(self, *args, **kwargs):
+        self._set_status('paused')
+        found = BaseCrawler.wait_for_items(self, *args, **kwargs)
+        self._wait_while_paused()
+        self._set_status('running')
+        return found
 
     def _grab_post_content(self, p, with_translation=True):
         translation = ''
@@ -185,48 +311,77 @@ class FBCrawler(BaseCrawler):
                 return True
         return False
 
-    def _crawl_posts_helper(self, select_func, selector, callback):
+    def _crawl_posts_helper(self, selector, callback, skip=None, stop=None, since=None, until=None):
         """Callback is time, text, url, translation, count
+        Posts for which skip(time, url) returns True are scrolled past without being processed or counted.
+        Crawling stops altogether as soon as stop(time, url) returns True for a post.
+        Posts newer than the unix time <until> are skipped and crawling stops once the posts are older than <since>.
         """
         # will not load the page, expects the page to already be loaded
+        cursor = Cursor(selector, container=css_selectors['post_wrapper'])
         count = 0
+        older = 0  # how many posts in a row have been older than since
         while True:
-            all_posts = select_func(selector)
+            posts = self.extract_items(cursor, post_fields)
             # break if there are no more posts left
-            if len(all_posts) <= count:
+            if not posts:
                 break
 
             # scrape each post
-            for p in all_posts[count:]:
+            for p in posts:
                 if self.stop_request:
                     return count
 
-                post_text, translation = self._grab_post_content(p)
+                if stop and stop(p['time'], p['link']):
+                    return count
 
-                date_el = p.find_element_by_xpath(xpath_selectors.get('post_date'))
-                p_time = date_el.get_attribute('data-utime')  # this is unix time!!!
-                p_link = date_el.find_element_by_xpath('..').get_attribute('href')
+                utime = int(p['time']) if p['time'] else None
+                if since is not None and utime is not None and utime < since:
+                    older += 1
+                    if older >= OLD_POSTS_IN_A_ROW:
+                        return count
+                    continue
+                older = 0
+                if until is not None and utime is not None and utime > until:
+                    continue
+
+                if skip and skip(p['time'], p['link']):
+                    continue
+
+                if p['see_original'] or p['see_more'] or p['see_translation']:
+                    # expanding the post needs clicking so do it the slow way
+                    post_text, translation = self._grab_post_content(p['element'])
+                else:
+                    post_text, translation = p['text'], ''
 
                 count += 1
                 # date, post_text, permalink, translation, count
-                callback(p_time, post_text, p_link, translation, count)
+                callback(p['time'], post_text, p['link'], translation, count)
 
-            self.scroll_to_bottom(wait=True)
+            self.scroll_for_items(cursor)
 
         return count
 
 
     @running
-    def crawl_posts(self, targeturl, callback, year=None):
+    def crawl_posts(self, targeturl, callback, year=None, skip=None, stop=None, since=None, until=None):
+        """Callback format: unix_time, post_text, permalink, translation, count
+        <skip> is an optional function taking the unix time and permalink of a post and returning True if
+        the post should be skipped, e.g. because it was already scraped by a previous run.
+        <stop> is an optional function taking the same arguments and returning True if there's no need to
+        go any further down the timeline, e.g. because the rest of the posts have already been scraped.
+        <since> and <until> are optional unix times to only crawl the posts in between of. Without a year
+        this works from the most recent posts, newer posts are skipped without being expanded and the timeline
+        is only scrolled until the posts are older than <since>.
+        """
         # load their timeline page
-        self.load(targeturl, scroll=True)
+        if not self.load(targeturl, scroll=True, page_type='posts'):
+            return 0
         if year:
             if not self._click_on_year(year):
                 log.error('Couldn\'t find the year {} in the profile {}'.format(year, targeturl))
                 return 0
-        count = self._crawl_posts_helper(self.driver.find_elements_by_css_selector,
-                                         _posts_selector(year),
-                                         callback)
+        count = self._crawl_posts_helper(_posts_selector(year), callback, skip, stop, since, until)
         return count
 
     @running
@@ -237,22 +392,24 @@ class FBCrawler(BaseCrawler):
         count = 0
         # load the likes page
         likesurl = join_url(targeturl, page_references.get('likes_page'))
-        self.load(likesurl)
+        if not self.load(likesurl, page_type='likes'):
+            return 0
 
+        cursor = Cursor(xpath_selectors.get('likes_selector'), xpath=True)
         while True:
-            all_likes = self.driver.find_elements_by_xpath(xpath_selectors.get('likes_selector'))
+            all_likes = self.extract_items(cursor, link_fields)
             # break if no more likes
-            if len(all_likes) <= count:
+            if not all_likes:
                 break
 
-            for like in all_likes[count:]:
+            for like in all_likes:
                 if self.stop_request:
                     return count
 
                 count += 1
-                callback(like.text, like.get_attribute('href'), count)
+                callback(like['name'], like['url'], count)
 
-            self.scroll_to_bottom(wait=True)
+            self.scroll_for_items(cursor)
 
         return count
 
@@ -261,25 +418,23 @@ class FBCrawler(BaseCrawler):
         count = 0
         # load the friends page
         friendsurl = join_url(targeturl, page_references.get('friends_page'))
-        self.load(friendsurl)
+        if not self.load(friendsurl, page_type='friends'):
+            return 0
 
+        cursor = Cursor(css_selectors.get('friends_selector'))
         while True:
-            all_friends = self.driver.find_elements_by_css_selector(css_selectors.get('friends_selector'))
+            all_friends = self.extract_items(cursor, friend_fields)
             # break if no more friends
-            if len(all_friends) <= count:
+            if not all_friends:
                 break
 
-            for friend in all_friends[count:]:
+            for friend in all_friends:
                 if self.stop_request:
                     return count
                 count += 1
-                friend_info = friend.find_element_by_xpath(xpath_selectors.get('friend_info'))
-                name = friend_info.text
-                url = friend_info.get_attribute('href')
-                imgurl = friend.find_element_by_css_selector(css_selectors.get('friend_image')).get_attribute('src')
-                callback(name, url, imgurl, count)
+                callback(friend['name'], friend['url'], friend['imgurl'], count)
 
-            self.scroll_to_bottom(wait=True)
+            self.scroll_for_items(cursor)
 
         return count
 
@@ -292,46 +447,40 @@ class FBCrawler(BaseCrawler):
         might be contained within the image for example: "trees, person, smiling" could be a description.
         """
         albumurl = join_url(targeturl, page_references.get('photos_page'))
-        self.load(albumurl)
+        if not self.load(albumurl, page_type='photos'):
+            return 0
 
+        cursor = Cursor(css_selectors.get('photo_selector'))
         count = 0
         while True:
-            all_photos = self.driver.find_elements_by_css_selector(css_selectors.get('photo_selector'))
+            all_photos = self.extract_items(cursor, photo_fields)
             # break if no more photos
-            if len(all_photos) <= count:
+            if not all_photos:
                 break
 
-            for p in all_photos[count:]:
+            for p in all_photos:
                 if self.stop_request:
                     return count
 
-                # url of the image
-                photo_source_url = p.get_attribute('data-starred-src')
-
-                # get the metadata and store that too
-                link = p.find_element_by_css_selector('a')
-                photo_description = link.get_attribute('aria-label')
-                # get the permalink url of the image post
-                photo_post_permalink = link.get_attribute('href')
-
                 count += 1
-                callback(photo_source_url, photo_description, photo_post_permalink, count)
+                callback(p['source'], p['description'], p['permalink'], count)
 
-            self.scroll_to_bottom(wait=True)
+            self.scroll_for_items(cursor)
 
         return count
 
     @running
     def crawl_albums(self, targeturl, callback):
         # scrape all albums
-        self.load(join_url(targeturl, page_references.get('albums')))
-        albums = self.driver.find_elements_by_css_selector(css_selectors.get('indiv_albums'))
+        if not self.load(join_url(targeturl, page_references.get('albums')), page_type='albums'):
+            return 0
+        albums = self.extract_items(Cursor(css_selectors.get('indiv_albums')), link_fields)
         count = 0
-        for album_name, album_url in [(a.text, a.get_attribute('href')) for a in albums]:
+        for a in albums:
             if self.stop_request:
                 return count
             count += 1
-            callback(album_name, album_url, count)
+            callback(a['name'], a['url'], count)
         return count
 
     @running
@@ -339,37 +488,31 @@ class FBCrawler(BaseCrawler):
         """Callback format: photo_source_url, photo_post_permalink, count
         """
 
-        self.load(albumurl)
+        if not self.load(albumurl, page_type='photos'):
+            return 0
+        cursor = Cursor(css_selectors.get('album_photo'))
         count = 0
         while True:
-            all_photos = self.driver.find_elements_by_css_selector(css_selectors.get('album_photo'))
+            all_photos = self.extract_items(cursor, album_photo_fields)
             # break if no more photos
-            if len(all_photos) <= count:
+            if not all_photos:
                 break
 
-            for p in all_photos[count:]:
+            for p in all_photos:
                 if self.stop_request:
                     return count
 
-                # url of the image
-                try:
-                    img = p.find_element_by_css_selector('img')
-                except NoSuchElementException:
-                    # this is probably a video in the video folder
-                    img = p.find_element_by_css_selector('span > div')
-
-                photo_source_url = self.get_bg_img_url(img)
-                photo_post_permalink = p.get_attribute('ajaxify')
                 count += 1
-                callback(photo_source_url, photo_post_permalink, count)
+                callback(p['source'], p['permalink'], count)
 
-            self.scroll_to_bottom(wait=True)
+            self.scroll_for_items(cursor)
 
         return count
 
     @running
     def crawl_about(self, targeturl, callback):
-        self.load(join_url(targeturl, page_references.get('about_page')))
+        if not self.load(join_url(targeturl, page_references.get('about_page')), page_type='about'):
+            return 0
         about_links = self.driver.find_elements_by_css_selector(css_selectors.get('about_links'))
         count = 0
         for l in about_links:
@@ -387,12 +530,14 @@ class FBCrawler(BaseCrawler):
     def crawl_groups(self, targeturl, callback):
         """Callback format: group_name, group_url, count
         """
-        self.load(join_url(targeturl, page_references.get('groups_page')))
+        if not self.load(join_url(targeturl, page_references.get('groups_page')), page_type='groups'):
+            return 0
+        cursor = Cursor(css_selectors.get('groups'))
         count = 0
         while True:
             # get groups, break if no more groups
-            groups = self.driver.find_elements_by_css_selector(css_selectors.get('groups'))
-            if len(groups) <= count:
+            groups = self.extract_items(cursor, link_fields)
+            if not groups:
                 break
 
             # extract group info
@@ -401,9 +546,9 @@ class FBCrawler(BaseCrawler):
                     return count
 
                 count += 1
-                callback(g.text, g.get_attribute('href'), count)
+                callback(g['name'], g['url'], count)
 
-            self.scroll_to_bottom(wait=True)
+            self.scroll_for_items(cursor)
 
         return count
 
@@ -412,12 +557,14 @@ class FBCrawler(BaseCrawler):
     def crawl_checkins(self, targeturl, callback):
         """Callback format: check_in_name, check_in_url, count
         """
-        self.load(join_url(targeturl, page_references.get('checkins')))
+        if not self.load(join_url(targeturl, page_references.get('checkins')), page_type='checkins'):
+            return 0
+        cursor = Cursor(css_selectors.get('checkins'))
         count = 0
         while True:
             # get groups, break if no more groups
-            checkins = self.driver.find_elements_by_css_selector(css_selectors.get('checkins'))
-            if len(checkins) <= count:
+            checkins = self.extract_items(cursor, link_fields)
+            if not checkins:
                 break
 
             # extract check in info
@@ -426,9 +573,9 @@ class FBCrawler(BaseCrawler):
                     return count
 
                 count += 1
-                callback(p.text, p.get_attribute('href'), count)
+                callback(p['name'], p['url'], count)
 
-            self.scroll_to_bottom(wait=True)
+            self.scroll_for_items(cursor)
 
         return count
 
@@ -439,23 +586,22 @@ class FBCrawler(BaseCrawler):
         as well as the current search result count.
         Limit is the maximum number of results to return. A limit of zero is unlimited.
         """
-        self.load(url)
+        if not self.load(url, page_type='search'):
+            return 0
+        cursor = Cursor(css_selectors.get('search_results'))
         count = 0
         while True:
-            results = self.driver.find_elements_by_css_selector(css_selectors.get('search_results'))
-            if len(results) <= count:
+            results = self.extract_items(cursor, search_result_fields)
+            if not results:
                 break
 
-            for r in results[count:]:
+            for r in results:
                 if self.stop_request or limit > 0 and count >= limit:
                     return count
-                imageurl = r.find_element_by_css_selector(css_selectors.get('search_pics')).get_attribute('src')
-                url = r.find_elements_by_css_selector(css_selectors.get('search_link'))[1]
-                name = url.text
                 count += 1
-                callback(name, url.get_attribute('href'), imageurl, count)
+                callback(r['name'], r['url'], r['imageurl'], count)
 
-            self.scroll_to_bottom(wait=True)
+            self.scroll_for_items(cursor)
 
         return count
 
@@ -463,7 +609,8 @@ class FBCrawler(BaseCrawler):
     def crawl_event_guests(self, url, callback, guest_filter=None):
         if guest_filter is None:
             guest_filter = ['interested', 'going', 'invited']
-        self.load(url, scroll=False)
+        if not self.load(url, scroll=False, page_type='event'):
+            return 0
         total = 0
         # open guests list
         guest_list = self.driver.find_element_by_css_selector(css_selectors.get('event_guests'))
@@ -482,23 +629,19 @@ class FBCrawler(BaseCrawler):
             b.click()
             self.delay()
             scroller = dialog.find_element_by_css_selector(css_selectors.get('guest_scroller'))
+            cursor = Cursor(css_selectors.get('guest_list'), root=dialog)
             while True:
-                results = dialog.find_elements_by_css_selector(css_selectors.get('guest_list'))
-                if len(results) <= count:
+                results = self.extract_items(cursor, event_guest_fields)
+                if not results:
                     break
 
-                for friend in results[count:]:
+                for friend in results:
                     if self.stop_request:
                         return total
-                    friend_info = friend.find_element_by_xpath(xpath_selectors.get('event_friend_info'))
-                    name = friend_info.text
-                    url = friend_info.get_attribute('href')
-                    imgurl = friend.find_element_by_css_selector(css_selectors.get('friend_image')).get_attribute('src')
                     count += 1
                     total += 1
-                    callback(label, name, url, imgurl, total)
+                    callback(label, friend['name'], friend['url'], friend['imgurl'], total)
 
-                self.js('a = arguments[0]; a.scrollTo(0, a.scrollHeight);', scroller)
-                self.delay()
+                self.scroll_for_items(cursor, scroller=scroller)
 
         return total
@@ -19,6 +19,8 @@ css_selectors = {
     'friends_selector': "ul[data-pnref='friends'] div[data-testid='friend_list_item']",
     'friend_image': "a[data-hovercard] img",
     'user_posts': "div.fbUserContent > div:first-of-type",
+    # the whole post including likes and comments, this is what gets removed when pruning
+    'post_wrapper': "div.userContentWrapper",
     'see_more': "a.see_more_link span.see_more_link_inner",
     # the left hand side of the about page with the different sections
     'about_links': "ul[data-pnref='about'] > li ul[data-testid='info_section_left_nav'] > li",
@@ -51,11 +53,14 @@ css_selectors = {
     'recents_container': "#recent_capsule_container",
     # the container identifier with the posts sorted by year
     'year_post_container': "#pagelet_timeline_year_",  # + year but we'll add the year later
+    # the 'see more' pager at the bottom of lists which are continued by infinite scroll
+    'more_pager': ".uiMorePager",
 }
 
 
 """These are selectors written in xpath to select different parts of the page.
-Only use XPath when you can't express it in CSS.
+Only use XPath when you can't express it in CSS. Selectors of lists crawled with a Cursor should be plain
+chains of //name[predicate] steps so that they can be evaluated from the last item (see base.following_xpath).
 """
 xpath_selectors = {
     'friend_info': ".//div//a[@data-hovercard and not(*)]",
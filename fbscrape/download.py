@@ -0,0 +1,158 @@
+import logging as log
+
+from threading import BoundedSemaphore, Lock, Thread
+from time import sleep
+
+try:
+    from Queue import Queue
+    from urllib2 import urlopen, HTTPError
+    from urlparse import urlparse
+except ImportError:
+    from queue import Queue
+    from urllib.request import urlopen
+    from urllib.error import HTTPError
+    from urllib.parse import urlparse
+
+try:
+    import requests
+    from requests.adapters import HTTPAdapter
+except ImportError:
+    # without requests every download opens a connection of its own
+    requests = None
+
+# local imports
+import tracing
+
+from metrics import registry as metrics
+
+
+def _retryable(error):
+    """Returns False for errors which will happen again however many times the download is tried,
+    like a 404.
+    """
+    if isinstance(error, ValueError):
+        # a url which can't be downloaded at all
+        return False
+    status = getattr(getattr(error, 'response', None), 'status_code', None)
+    if status is None and isinstance(error, HTTPError):
+        status = error.code
+    return status is None or status == 429 or status >= 500
+
+
+class DownloadEngine(object):
+
+    def __init__(self, workers=8, per_host=4, queue_size=500, retries=3, backoff=1.0, timeout=30):
+        """Downloads files with a fixed number of <workers> threads, keeping the connections to each host alive
+        between downloads. At most <per_host> downloads from the same host happen at the same time.
+        A download which fails is tried again up to <retries> times, waiting <backoff> seconds and then twice as
+        long each time. At most <queue_size> downloads can be waiting, after which adding more blocks until
+        the workers catch up. Can be shared between scrapers.
+        """
+        self.per_host = per_host
+        self.retries = retries
+        self.backoff = backoff
+        self.timeout = timeout
+        self.hosts = {}  # host -> semaphore limiting the downloads from it
+        self.failures = []  # (url, error) of every download which failed
+        self._lock = Lock()
+        self.session = None
+        if requests is not None:
+            self.session = requests.Session()
+            # every worker can keep a connection to each host open
+            adapter = HTTPAdapter(pool_connections=16, pool_maxsize=workers)
+            self.session.mount('http://', adapter)
+            self.session.mount('https://', adapter)
+        self.queue = Queue(queue_size)
+        self.threads = []
+        for i in range(workers):
+            thread = Thread(target=self._work, name='download-{}'.format(i + 1))
+            thread.daemon = True
+            thread.start()
+            self.threads.append(thread)
+
+    def _host(self, url):
+        host = urlparse(url).netloc
+        with self._lock:
+            if host not in self.hosts:
+                self.hosts[host] = BoundedSemaphore(self.per_host)
+            return self.hosts[host]
+
+    def _fetch(self, url):
+        with self._host(url):
+            if self.session is None:
+                return urlopen(url, timeout=self.timeout).read()
+            response = self.session.get(url, timeout=self.timeout)
+            response.raise_for_status()
+            return response.content
+
+    def _download(self, url, path):
+        """Downloads url to path, trying again if it fails. Returns the error if it didn't work in the end.
+        """
+        for attempt in range(self.retries + 1):
+            try:
+                with tracing.span('download', url=url, attempt=attempt):
+                    content = self._fetch(url)
+                    with open(path, 'wb') as f:
+                        f.write(content)
+                metrics.inc('fbscrape_images_downloaded_total')
+                metrics.inc('fbscrape_image_bytes_total', len(content))
+                return None
+            except Exception as e:
+                # anything from a dropped connection to a url urlopen doesn't understand
+                if attempt == self.retries or not _retryable(e):
+                    return e
+                log.info('Failed to download %s (%s), trying again', url, e)
+                sleep(self.backoff * 2 ** attempt)
+
+    def _work(self):
+        while True:
+            url, path, callback = self.queue.get()
+            error = None
+            try:
+                error = self._download(url, path)
+            except Exception as e:
+                error = e
+            finally:
+                # whatever happens the callback has to hear about it, or whoever is waiting for it waits forever
+                if error is not None:
+                    metrics.inc('fbscrape_images_failed_total')
+                    log.error('Failed to download image %s: %s', url, error)
+                    with self._lock:
+                        self.failures.append((url, error))
+                if callback:
+                    try:
+                        callback(url, path, error)
+                    except Exception:
+                        log.exception('Failed to handle the download of %s', url)
+                self.queue.task_done()
+
+    def download(self, url, path, callback=None):
+        """Queues url to be downloaded to path and returns straight away, unless the queue is full.
+        Once it's done callback(url, path, error) is called from the download thread, where error is None if
+        the download worked.
+        """
+        self.queue.put((url, path, callback))
+
+    def alive(self):
+        """Returns True if any of the download threads are still running.
+        """
+        return any(t.is_alive() for t in self.threads)
+
+    def wait(self):
+        """Waits until everything queued has been downloaded.
+        """
+        self.queue.join()
+
+
+_shared = None
+_shared_lock = Lock()
+
+
+def shared_engine():
+    """Returns the DownloadEngine shared by every album, creating it the first time.
+    """
+    global _shared
+    with _shared_lock:
+        if _shared is None:
+            _shared = DownloadEngine()
+        return _shared
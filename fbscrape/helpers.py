@@ -1,4 +1,5 @@
-from datetime import datetime
+from datetime import datetime, timedelta
+from time import mktime
 
 try:
     from urlparse import urljoin, urlparse, parse_qs
@@ -31,6 +32,24 @@ def timestring(unix=None):
     return datetime.now().strftime(timeformat)
 
 
+def parse_timestring(timestamp):
+    """Converts a timestamp made by timestring back into a unix time stamp, or None if it's empty.
+    """
+    if not timestamp:
+        return None
+    return int(mktime(datetime.strptime(timestamp, "%Y%m%d-%H%M%S").timetuple()))
+
+
+def unixtime(day, end_of_day=False):
+    """Converts a date in the format YYYY-MM-DD into a unix time stamp of the start of that day in local time,
+    or of the last second of that day if end_of_day is True.
+    """
+    start = datetime.strptime(day, "%Y-%m-%d")
+    if end_of_day:
+        return int(mktime((start + timedelta(days=1)).timetuple())) - 1
+    return int(mktime(start.timetuple()))
+
+
 def path_safe(path):
     """Makes a path a bit safer by replacing the unsafe characters found in unsafe_char with '-'.
     """
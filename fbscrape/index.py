@@ -0,0 +1,84 @@
+import logging as log
+import sqlite3
+
+from threading import Lock
+from time import time
+
+
+class SeenIndex(object):
+
+    def __init__(self, filename):
+        """Keeps track of every item scraped from every target in the SQLite database <filename>, so running
+        over the same targets again (or over overlapping year ranges) doesn't record the same items twice.
+        Items are keyed by target, kind (e.g. posts, friends or photos) and key (e.g. a permalink, profile url
+        or image filename). Can be shared between scrapers.
+
+        Items added are only written to the database by commit(), which the records call whenever they're
+        flushed, so the index is never ahead of what has actually been recorded.
+        """
+        self.filename = filename
+        self._lock = Lock()
+        # shared between the threads of a pool, the lock makes sure only one uses it at a time
+        self.db = sqlite3.connect(filename, check_same_thread=False)
+        self.db.execute('CREATE TABLE IF NOT EXISTS seen ('
+                        'target TEXT NOT NULL, kind TEXT NOT NULL, key TEXT NOT NULL, added REAL NOT NULL, '
+                        'PRIMARY KEY (target, kind, key))')
+        self.db.commit()
+        log.info('Using the index of scraped items in %s', filename)
+
+    def seen(self, target, kind, key):
+        with self._lock:
+            row = self.db.execute('SELECT 1 FROM seen WHERE target = ? AND kind = ? AND key = ?',
+                                  (target, kind, key)).fetchone()
+        return row is not None
+
+    def add(self, target, kind, key):
+        """Adds an item to the index. Returns False if it was already in it.
+        """
+        with self._lock:
+            cur = self.db.execute('INSERT OR IGNORE INTO seen (target, kind, key, added) VALUES (?, ?, ?, ?)',
+                                  (target, kind, key, time()))
+        return cur.rowcount == 1
+
+    def count(self, target=None, kind=None):
+        """Returns the number of items in the index, optionally only those of <target> and/or <kind>.
+        """
+        where = [(c, v) for c, v in (('target', target), ('kind', kind)) if v is not None]
+        query = 'SELECT COUNT(*) FROM seen'
+        if where:
+            query += ' WHERE ' + ' AND '.join(c + ' = ?' for c, _ in where)
+        with self._lock:
+            return self.db.execute(query, tuple(v for _, v in where)).fetchone()[0]
+
+    def commit(self):
+        with self._lock:
+            self.db.commit()
+
+    def close(self):
+        with self._lock:
+            self.db.commit()
+            self.db.close()
+
+    def items(self, target, kind):
+        """Returns the items of one kind scraped from target, for passing to Record and Album.
+        """
+        return SeenItems(self, target, kind)
+
+
+class SeenItems(object):
+
+    def __init__(self, index, target, kind):
+        """The items of one kind scraped from one target. Supports `key in items` and items.add(key).
+        """
+        self.index = index
+        self.target = target
+        self.kind = kind
+
+    def __contains__(self, key):
+        return self.index.seen(self.target, self.kind, key)
+
+    def add(self, key):
+        return self.index.add(self.target, self.kind, key)
+
+    def commit(self):
+        self.index.commit()
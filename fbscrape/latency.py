@@ -0,0 +1,65 @@
+import json
+
+from collections import deque
+from threading import Lock
+
+
+class LatencyModel(object):
+
+    def __init__(self, window=50):
+        """Keeps track of how long pages take to load, separately for each type of page (posts, friends,
+        photos, etc.) so slow pages don't make the waits on fast pages longer.
+        Only the last <window> loads of each type are kept so a few slow outliers are soon forgotten.
+        Can be shared between crawlers.
+        """
+        self.window = window
+        self.samples = {}
+        self._lock = Lock()
+
+    def add(self, page_type, seconds):
+        with self._lock:
+            if page_type not in self.samples:
+                self.samples[page_type] = deque(maxlen=self.window)
+            self.samples[page_type].append(seconds)
+
+    def percentile(self, page_type, pct):
+        """Returns the <pct>th percentile of the load times of page_type.
+        If there haven't been any loads of page_type it uses the load times of all the pages instead.
+        Returns None if no pages have been loaded yet.
+        """
+        with self._lock:
+            samples = list(self.samples.get(page_type, []))
+            if not samples:
+                samples = [s for window in self.samples.values() for s in window]
+        if not samples:
+            return None
+        samples.sort()
+        # nearest rank
+        index = int(round(pct / 100.0 * (len(samples) - 1)))
+        return samples[index]
+
+    def export(self):
+        """Returns the state of the model as something that can be serialised as JSON.
+        """
+        with self._lock:
+            return {
+                'window': self.window,
+                'samples': dict((k, list(v)) for k, v in self.samples.items()),
+            }
+
+    @classmethod
+    def from_export(cls, state):
+        model = cls(state.get('window', 50))
+        for page_type, samples in state.get('samples', {}).items():
+            for s in samples:
+                model.add(page_type, s)
+        return model
+
+    def save(self, filename):
+        with open(filename, 'w') as f:
+            json.dump(self.export(), f)
+
+    @classmethod
+    def load(cls, filename):
+        with open(filename, 'r') as f:
+            return cls.from_export(json.load(f))
@@ -0,0 +1,138 @@
+"""A lightweight crawler that fetches pages over plain HTTP instead of driving a browser.
+
+Lists like friends, likes, groups, check-ins and the about page are mostly plain HTML so there's no need
+to pay for a whole browser to read them. Whenever a page can't be read without Javascript (e.g. the list
+continues with infinite scroll, or we got redirected to the login page) NeedsBrowser is raised before any
+callbacks are executed so the caller can fall back to FBCrawler.
+"""
+
+import logging as log
+
+import requests
+
+from requests.adapters import HTTPAdapter
+
+try:
+    from urlparse import urljoin
+except ImportError:
+    from urllib.parse import urljoin
+
+# local imports
+from crawler import friend_fields, link_fields
+from custom import css_selectors, xpath_selectors, page_references
+from helpers import join_url
+from offline import compile_selector, extract_items, parse
+
+
+USER_AGENT = 'Mozilla/5.0 (X11; Ubuntu; Linux x86_64; rv:54.0) Gecko/20100101 Firefox/54.0'
+
+
+class NeedsBrowser(Exception):
+    pass
+
+
+class LiteCrawler(object):
+
+    def __init__(self, cookies=None, stopped=None, timeout=30):
+        """<cookies> is a list of cookies as returned by webdriver's get_cookies(), e.g. from a logged in FBCrawler.
+        <stopped> is a function returning True when crawling should stop.
+        """
+        self.session = requests.Session()
+        # keep connections open between requests
+        self.session.mount('https://', HTTPAdapter(pool_connections=4, pool_maxsize=8))
+        self.session.headers['User-Agent'] = USER_AGENT
+        for c in cookies or []:
+            self.session.cookies.set(c['name'], c['value'], domain=c.get('domain'), path=c.get('path', '/'))
+        self.stopped = stopped if stopped else (lambda: False)
+        self.timeout = timeout
+
+    def fetch(self, url):
+        """Returns the parsed page at url. Raises NeedsBrowser if the page couldn't be fetched properly.
+        """
+        try:
+            res = self.session.get(url, timeout=self.timeout)
+        except requests.RequestException as e:
+            raise NeedsBrowser('Failed to fetch {}: {}'.format(url, e))
+        if res.status_code != 200 or 'login' in res.url:
+            raise NeedsBrowser('Failed to fetch {}: got {} from {}'.format(url, res.status_code, res.url))
+        return parse(res.content, res.url)
+
+    def _list(self, url, selector, fields, xpath=False):
+        """Returns the fields of every item in the list at url.
+        Raises NeedsBrowser if the list is empty or continues past what was sent in the page.
+        """
+        doc = self.fetch(url)
+        items = extract_items(doc, selector, fields, xpath)
+        if not items:
+            raise NeedsBrowser('No items found at {}'.format(url))
+        if compile_selector(css_selectors['more_pager'])(doc):
+            raise NeedsBrowser('The list at {} needs scrolling'.format(url))
+        return items
+
+    def _emit(self, items, callback, *keys):
+        count = 0
+        for item in items:
+            if self.stopped():
+                break
+            count += 1
+            callback(*([item[k] for k in keys] + [count]))
+        return count
+
+    def crawl_likes(self, targeturl, callback):
+        """Callback format: Liked Page Name, Liked Page URL, count
+        """
+        url = join_url(targeturl, page_references.get('likes_page'))
+        items = self._list(url, xpath_selectors.get('likes_selector'), link_fields, xpath=True)
+        return self._emit(items, callback, 'name', 'url')
+
+    def crawl_friends(self, targeturl, callback):
+        """Callback format: name, url, imgurl, count
+        """
+        url = join_url(targeturl, page_references.get('friends_page'))
+        items = self._list(url, css_selectors.get('friends_selector'), friend_fields)
+        return self._emit(items, callback, 'name', 'url', 'imgurl')
+
+    def crawl_groups(self, targeturl, callback):
+        """Callback format: group_name, group_url, count
+        """
+        url = join_url(targeturl, page_references.get('groups_page'))
+        items = self._list(url, css_selectors.get('groups'), link_fields)
+        return self._emit(items, callback, 'name', 'url')
+
+    def crawl_checkins(self, targeturl, callback):
+        """Callback format: check_in_name, check_in_url, count
+        """
+        url = join_url(targeturl, page_references.get('checkins'))
+        items = self._list(url, css_selectors.get('checkins'), link_fields)
+        return self._emit(items, callback, 'name', 'url')
+
+    def crawl_about(self, targeturl, callback):
+        """Callback format: section title, section text
+        """
+        doc = self.fetch(join_url(targeturl, page_references.get('about_page')))
+        links = compile_selector(css_selectors.get('about_links'))(doc)
+        sections = []
+        for l in links:
+            a = compile_selector('a[href]')(l)
+            if not a:
+                raise NeedsBrowser('About section {} has no link'.format(l.get('title')))
+            sections.append((l.get('title'), urljoin(doc.base_url, a[0].get('href'))))
+        if not sections:
+            raise NeedsBrowser('No about sections found for {}'.format(targeturl))
+
+        # fetch every section before calling back so we can still fall back to the browser
+        contents = []
+        for title, url in sections:
+            main_pane = compile_selector(css_selectors.get('about_main'))(self.fetch(url))
+            if not main_pane:
+                raise NeedsBrowser('About section {} has no content'.format(title))
+            contents.append((title, main_pane[0].text_content().strip()))
+
+        count = 0
+        for title, text in contents:
+            if self.stopped():
+                break
+            callback(title, text)
+            count += 1
+        log.info('Fetched %d about sections without the browser', count)
+        return count
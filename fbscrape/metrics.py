@@ -0,0 +1,173 @@
+"""Counters describing a running scrape, which can be served over HTTP in the Prometheus text format
+so long running jobs can be watched (or scraped by Prometheus) while they're going.
+
+Everything is collected in the module level registry. Start the endpoint with serve(port) and read the
+metrics at http://localhost:<port>/metrics.
+"""
+
+import logging
+
+from collections import deque
+from threading import Lock, Thread
+from time import time
+
+try:
+    from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+except ImportError:
+    from http.server import BaseHTTPRequestHandler, HTTPServer
+
+
+# the buckets of the page load time histogram in seconds
+LOAD_BUCKETS = [0.25, 0.5, 1.0, 2.0, 3.0, 5.0, 8.0, 13.0, 20.0, 30.0]
+
+# items scraped in the last RATE_WINDOW seconds are used for working out the items per second
+RATE_WINDOW = 60.0
+
+"""The type and description of every metric.
+"""
+descriptions = {
+    'fbscrape_items_total': ('counter', 'Items scraped, by crawl method.'),
+    'fbscrape_items_per_second': ('gauge', 'Items scraped per second over the last minute, by crawl method.'),
+    'fbscrape_targets_total': ('counter', 'Targets scraped.'),
+    'fbscrape_page_load_seconds': ('histogram', 'Time taken to load pages, by page type.'),
+    'fbscrape_delay_seconds': ('gauge', 'The last delay waited between pages.'),
+    'fbscrape_images_downloaded_total': ('counter', 'Images downloaded.'),
+    'fbscrape_images_failed_total': ('counter', 'Images which failed to download.'),
+    'fbscrape_image_bytes_total': ('counter', 'Bytes of images downloaded.'),
+    'fbscrape_queue_depth': ('gauge', 'Targets waiting to be scraped.'),
+    'fbscrape_write_queue_depth': ('gauge', 'Records waiting to be written.'),
+    'fbscrape_browser_restarts_total': ('counter', 'Browsers relaunched after crashing.'),
+    'fbscrape_log_messages_total': ('counter', 'Warnings and errors logged, by level.'),
+}
+
+
+def _labels(labels):
+    if not labels:
+        return ''
+    return '{' + ','.join('{}="{}"'.format(k, str(v).replace('\\', '\\\\').replace('"', '\\"'))
+                          for k, v in labels) + '}'
+
+
+class Metrics(object):
+
+    def __init__(self):
+        """A thread-safe collection of counters, gauges and histograms, each of which can have labels.
+        """
+        self.values = {}  # (name, labels) -> value, for counters and gauges
+        self.histograms = {}  # (name, labels) -> [count in each bucket, sum, count, buckets]
+        self.recent = {}  # section -> times of the items scraped in the last RATE_WINDOW seconds
+        self._lock = Lock()
+
+    def inc(self, name, amount=1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def set(self, name, value, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self.values[key] = value
+
+    def observe(self, name, value, buckets=LOAD_BUCKETS, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            if key not in self.histograms:
+                self.histograms[key] = [[0] * len(buckets), 0.0, 0, buckets]
+            hist = self.histograms[key]
+            for i, bound in enumerate(buckets):
+                if value <= bound:
+                    hist[0][i] += 1
+            hist[1] += value
+            hist[2] += 1
+
+    def item(self, section):
+        """Counts an item scraped by section.
+        """
+        now = time()
+        self.inc('fbscrape_items_total', section=section)
+        with self._lock:
+            times = self.recent.setdefault(section, deque())
+            times.append(now)
+            while times and times[0] < now - RATE_WINDOW:
+                times.popleft()
+
+    def counted(self, section, callback):
+        """Returns callback wrapped so every call counts as an item scraped by section.
+        """
+        def counting(*args, **kwargs):
+            self.item(section)
+            return callback(*args, **kwargs)
+        return counting
+
+    def render(self):
+        """Returns all the metrics in the Prometheus text format.
+        """
+        now = time()
+        with self._lock:
+            for section, times in self.recent.items():
+                while times and times[0] < now - RATE_WINDOW:
+                    times.popleft()
+                self.values[('fbscrape_items_per_second', (('section', section),))] = len(times) / RATE_WINDOW
+            by_name = {}
+            for (name, labels), value in sorted(self.values.items()):
+                by_name.setdefault(name, []).append('{}{} {}'.format(name, _labels(labels), value))
+            for (name, labels), (counts, total, count, buckets) in sorted(self.histograms.items()):
+                lines = by_name.setdefault(name, [])
+                for bound, n in zip(buckets, counts):
+                    lines.append('{}_bucket{} {}'.format(name, _labels(labels + (('le', bound),)), n))
+                lines.append('{}_bucket{} {}'.format(name, _labels(labels + (('le', '+Inf'),)), count))
+                lines.append('{}_sum{} {}'.format(name, _labels(labels), total))
+                lines.append('{}_count{} {}'.format(name, _labels(labels), count))
+        out = []
+        for name in sorted(by_name):
+            kind, description = descriptions.get(name, ('untyped', name))
+            out.append('# HELP {} {}'.format(name, description))
+            out.append('# TYPE {} {}'.format(name, kind))
+            out.extend(by_name[name])
+        return '\n'.join(out) + '\n'
+
+
+registry = Metrics()
+
+
+class MetricsLogHandler(logging.Handler):
+    """Counts the warnings and errors logged, by level.
+    """
+
+    def __init__(self, metrics=registry):
+        logging.Handler.__init__(self, logging.WARNING)
+        self.metrics = metrics
+
+    def emit(self, record):
+        self.metrics.inc('fbscrape_log_messages_total', level=record.levelname)
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+
+    def log_message(self, *args):
+        # don't flood the scraping log with every request
+        pass
+
+    def do_GET(self):
+        if self.path.split('?')[0] not in ('/', '/metrics'):
+            self.send_error(404)
+            return
+        body = self.server.metrics.render().encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+def serve(port, metrics=registry, host='127.0.0.1'):
+    """Serves the metrics at http://<host>:<port>/metrics from a background thread and starts counting the
+    warnings and errors logged. Returns the server, call shutdown() on it to stop serving.
+    """
+    server = HTTPServer((host, port), _MetricsHandler)
+    server.metrics = metrics
+    logging.getLogger().addHandler(MetricsLogHandler(metrics))
+    thread = Thread(target=server.serve_forever, name='metrics')
+    thread.daemon = True
+    thread.start()
+    return server
@@ -0,0 +1,200 @@
+"""Extracts the same records as the crawl_* methods of FBCrawler from saved page sources, without a browser.
+
+All the selectors in custom.py (and the ones used by the fields in crawler.py) are compiled to XPath once when
+this module is imported, so pages can be processed at parser speed. Useful for fixing extraction bugs and
+re-deriving CSV files from archived pages instead of scraping everything again.
+
+Example usage (from the root folder of the project):
+    python -m fbscrape.offline friends saved/*.html --output friends
+"""
+
+import argparse
+import re
+
+from cssselect import HTMLTranslator
+from lxml import etree, html
+
+try:
+    from urlparse import urljoin
+except ImportError:
+    from urllib.parse import urljoin
+
+# local imports
+import record
+
+from crawler import (post_fields, link_fields, friend_fields, event_guest_fields, photo_fields, album_photo_fields,
+                     search_result_fields)
+from custom import css_selectors, xpath_selectors
+
+
+_translator = HTMLTranslator()
+_compiled = {}
+
+
+def compile_selector(selector, by='css'):
+    """Returns the compiled XPath for a css or xpath selector. Every selector is only ever compiled once.
+    """
+    key = (by, selector)
+    if key not in _compiled:
+        expr = _translator.css_to_xpath(selector, prefix='descendant::') if by == 'css' else selector
+        _compiled[key] = etree.XPath(expr)
+    return _compiled[key]
+
+
+def _compile_fields(fields):
+    for f in fields.values():
+        if f['by'] in ('css', 'xpath'):
+            for s in f['selector'] if isinstance(f['selector'], list) else [f['selector']]:
+                compile_selector(s, f['by'])
+
+
+"""For each section: the item selector, whether it's xpath, the fields to extract from each item,
+and the fields in the order the crawl_* callbacks receive them (the count is added at the end).
+Fields which aren't extracted from the items are passed as None.
+"""
+sections = {
+    'posts': (css_selectors['user_posts'], False, post_fields, ['time', 'text', 'link', 'translation']),
+    'likes': (xpath_selectors['likes_selector'], True, link_fields, ['name', 'url']),
+    'friends': (css_selectors['friends_selector'], False, friend_fields, ['name', 'url', 'imgurl']),
+    'photos': (css_selectors['photo_selector'], False, photo_fields, ['source', 'description', 'permalink']),
+    'albums': (css_selectors['indiv_albums'], False, link_fields, ['name', 'url']),
+    'one_album': (css_selectors['album_photo'], False, album_photo_fields, ['source', 'permalink']),
+    'groups': (css_selectors['groups'], False, link_fields, ['name', 'url']),
+    'checkins': (css_selectors['checkins'], False, link_fields, ['name', 'url']),
+    'search_results': (css_selectors['search_results'], False, search_result_fields, ['name', 'url', 'imageurl']),
+    # the response (e.g. going) comes from the tab the guests are listed under, which isn't in the items
+    'event_guests': (css_selectors['guest_list'], False, event_guest_fields, ['response', 'name', 'url', 'imgurl']),
+}
+
+# compile everything up front
+for _sel in css_selectors.values():
+    compile_selector(_sel)
+for _sel in xpath_selectors.values():
+    compile_selector(_sel, 'xpath')
+for _selector, _xpath, _fields, _ in sections.values():
+    compile_selector(_selector, 'xpath' if _xpath else 'css')
+    _compile_fields(_fields)
+
+
+def uncomment(doc):
+    """Facebook sends a lot of the page as HTML comments inside <code> elements and only renders them
+    with Javascript. Parse the comments and put the contents into the page in place of the <code> elements.
+    """
+    for code in doc.xpath('//code[comment()]'):
+        markup = ''.join(c.text for c in code.xpath('comment()') if c.text)
+        parent = code.getparent()
+        index = parent.index(code)
+        parent.remove(code)
+        # leading text comes back as a string, skip it since it isn't part of any element
+        elements = [el for el in html.fragments_fromstring(markup) if hasattr(el, 'tag')]
+        for i, el in enumerate(elements):
+            parent.insert(index + i, el)
+    return doc
+
+
+def parse(page_source, base_url=''):
+    """Parses a page source into a document ready for extraction.
+    """
+    return uncomment(html.document_fromstring(page_source, base_url=base_url))
+
+
+def select(el, by, selector):
+    """The python equivalent of select() in base.EXTRACT_ITEMS_JS.
+    """
+    if by == 'self':
+        return [el]
+    if by == 'link':
+        return [a for a in el.iter('a') if a.text_content().strip() == selector]
+    for s in selector if isinstance(selector, list) else [selector]:
+        result = compile_selector(s, by)(el)
+        if result:
+            return result
+    return []
+
+
+def value(el, attr, base_url=''):
+    """The python equivalent of value() in base.EXTRACT_ITEMS_JS.
+    """
+    if attr == 'exists':
+        return el is not None
+    if el is None:
+        return None
+    if attr == 'element':
+        return el
+    if attr == 'text':
+        return el.text_content().strip()
+    if attr == 'bg':
+        match = re.search(r'background-image:\s*url\(["\']?(.*?)["\']?\)', el.get('style', ''))
+        return match.group(1) if match else None
+    result = el.get(attr)
+    if result is not None and attr in ('href', 'src'):
+        # webdriver gives back absolute urls
+        result = urljoin(base_url, result)
+    return result
+
+
+def extract(el, fields, base_url=''):
+    """Returns a dict of the fields (see base.field) extracted from el.
+    """
+    res = {}
+    for name, f in fields.items():
+        matches = select(el, f['by'], f['selector'])
+        res[name] = value(matches[f['index']] if len(matches) > f['index'] else None, f['attr'], base_url)
+    return res
+
+
+def extract_items(doc, selector, fields, xpath=False):
+    """Returns a list of dicts with the fields of every item matching selector in doc.
+    """
+    items = compile_selector(selector, 'xpath' if xpath else 'css')(doc)
+    return [extract(i, fields, doc.base_url or '') for i in items]
+
+
+def crawl(section, page_source, callback, base_url=''):
+    """Executes callback for every item of section found in page_source, with the same arguments as the
+    callback of the matching crawl_<section> method of FBCrawler. Returns the number of items found.
+    Things that need clicking in the browser, like post translations, are left empty.
+    """
+    selector, xpath, fields, keys = sections[section]
+    count = 0
+    for item in extract_items(parse(page_source, base_url), selector, fields, xpath):
+        count += 1
+        callback(*([item.get(k) for k in keys] + [count]))
+    return count
+
+
+def main(args):
+    keys = sections[args.section][3]
+    if args.section in record.SECTIONS:
+        # the same columns as the records written while scraping
+        schema, make_record = record.SECTIONS[args.section]
+    else:
+        # nothing is recorded for these while scraping so write the fields as they are
+        schema, make_record = keys, lambda *values: dict(zip(keys, values))
+    rec = record.Record(args.output, schema) if args.output else None
+    total = 0
+    for filename in args.files:
+        with open(filename, 'rb') as f:
+            page_source = f.read()
+
+        def callback(*values):
+            if rec:
+                rec.add_record(make_record(*values[:-1]))
+
+        total += crawl(args.section, page_source, callback, args.url)
+    if rec:
+        rec.close()
+    print('Extracted {} {} from {} files'.format(total, args.section, len(args.files)))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Extract scraped data from saved Facebook pages.')
+    parser.add_argument('section', choices=sorted(sections.keys()),
+                        help='the type of items to extract')
+    parser.add_argument('files', nargs='+',
+                        help='the saved page sources to extract from')
+    parser.add_argument('--output', '-o', dest='output', required=False,
+                        help='the record file to write the items to (without the .csv extension)')
+    parser.add_argument('--url', '-u', dest='url', default='https://www.facebook.com/',
+                        help='the url the pages were saved from, used to make links absolute')
+    main(parser.parse_args())
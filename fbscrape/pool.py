@@ -0,0 +1,99 @@
+import logging as log
+
+from threading import Thread
+
+try:
+    from Queue import Queue, Empty
+except ImportError:
+    from queue import Queue, Empty
+
+# local imports
+from metrics import registry as metrics
+from scraper import FBScraper
+
+
+def _join(threads):
+    """Waits for every thread to finish. Joins with a timeout so Ctrl-C still gets through on Python 2,
+    where a bare join() can't be interrupted.
+    """
+    for t in threads:
+        while t.is_alive():
+            t.join(0.5)
+
+
+class ScraperPool(object):
+
+    def __init__(self, size, factory=FBScraper):
+        """Manages <size> browser sessions which share a list of targets between them.
+        <factory> is called with no arguments to create each FBScraper, use it to configure the scrapers
+        (e.g. output directory and settings) before they start.
+        """
+        self.scrapers = [factory() for _ in range(size)]
+        self.queue = Queue()
+        # kept for logging back in after relaunching a crashed browser
+        self.credentials = None
+
+    def login(self, user, password):
+        """Logs every session in at the same time. Returns True if all of them logged in successfully.
+        """
+        self.credentials = (user, password)
+        results = [False] * len(self.scrapers)
+
+        def do_login(i, scraper):
+            results[i] = scraper.login(user, password)
+
+        workers = [Thread(target=do_login, args=(i, s)) for i, s in enumerate(self.scrapers)]
+        for w in workers:
+            w.start()
+        _join(workers)
+        return all(results)
+
+    def _worker(self, scraper):
+        while not scraper.stop_request:
+            try:
+                target = self.queue.get_nowait()
+            except Empty:
+                return
+            metrics.set('fbscrape_queue_depth', self.queue.qsize())
+            try:
+                scraper.scrape(target)
+            except Exception:
+                # don't let one broken target take the whole session down with it
+                log.exception('Failed to scrape %s', target)
+                if not scraper.browser_alive():
+                    self._relaunch(scraper)
+            finally:
+                self.queue.task_done()
+
+    def _relaunch(self, scraper):
+        """Replaces the crashed browser of scraper with a new one and logs it back in.
+        """
+        log.warning('The browser crashed, relaunching it')
+        scraper.relaunch()
+        if self.credentials and not scraper.login(*self.credentials):
+            log.error('Failed to log back in after relaunching the browser')
+
+    def scrape(self, targets):
+        """Scrapes every target in targets, sharing them between the sessions as each one becomes free.
+        Each target is scraped in full by a single session, exactly like FBScraper.scrape.
+        Blocks until all the targets have been scraped or the pool has been interrupted.
+        """
+        for t in targets:
+            self.queue.put(t)
+        metrics.set('fbscrape_queue_depth', self.queue.qsize())
+        workers = [Thread(target=self._worker, args=(s,), name='worker-{}'.format(i + 1))
+                   for i, s in enumerate(self.scrapers)]
+        for w in workers:
+            w.start()
+        _join(workers)
+
+    def interrupt(self):
+        """Stops every session after its current item.
+        """
+        for s in self.scrapers:
+            s.interrupt()
+
+    def quit(self):
+        for s in self.scrapers:
+            s.close()
+            s.driver.quit()
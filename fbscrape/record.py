@@ -1,24 +1,39 @@
 import logging as log
 import os
 import errno
+import gzip
+import io
+import zlib
 
-from threading import Thread
+from threading import Condition
+from time import time
 
 try:
-    from urllib import urlopen
     from urlparse import urlparse
     import unicodecsv as csv
+    # unicodecsv reads and writes bytes
+    _read_mode = 'rb'
+    _bytes_csv = True
 except ImportError:
-    from urllib.request import urlopen
     from urllib.parse import urlparse
     import csv
+    _read_mode = 'r'
+    _bytes_csv = False
 
+try:
+    import zstandard
+except ImportError:
+    # zstandard is only needed for zstd compressed records
+    zstandard = None
 
-class FolderCreationError(Exception):
-    pass
+# local imports
+import tracing
 
+from download import shared_engine
+from helpers import strip_query, timestring
 
-class BrokenImageError(Exception):
+
+class FolderCreationError(Exception):
     pass
 
 
@@ -33,58 +48,355 @@ def make_path(path):
             raise FolderCreationError('Failed to create folder <{}>'.format(path))
 
 
-class Record(object):
+def image_filename(url):
+    """Returns the name the image at url is saved under in its album, the last part of the url's path.
+    """
+    return urlparse(url).path.split('/')[-1]
 
-    def __init__(self, filename, schema):
-        self.filename = filename + '.csv'
+
+"""For each section: the columns of its record and a function which turns the arguments of the crawl_<section>
+callback (without the count at the end) into a record, so the records made from saved pages by offline.py are
+the same as the ones made while scraping.
+"""
+SECTIONS = {
+    'posts': (['date', 'post', 'translation', 'permalink'],
+              lambda p_time, text, link, translation: {'date': timestring(p_time), 'post': text,
+                                                       'translation': translation, 'permalink': link}),
+    'likes': (['name', 'url'], lambda name, url: {'name': name, 'url': url}),
+    'friends': (['name', 'profile'], lambda name, url, imgurl: {'name': name, 'profile': strip_query(url)}),
+    'photos': (['filename', 'description', 'permalink'],
+               lambda source, description, perma: {'filename': image_filename(source), 'description': description,
+                                                   'permalink': perma}),
+    'one_album': (['filename', 'description', 'permalink'],
+                  lambda source, perma: {'filename': image_filename(source), 'description': '', 'permalink': perma}),
+    'about': (['section', 'text'], lambda section, content: {'section': section, 'text': content}),
+    'groups': (['name', 'url'], lambda name, url: {'name': name, 'url': url}),
+    'checkins': (['name', 'url'], lambda name, url: {'name': name, 'url': url}),
+    'event_guests': (['response', 'name', 'profile'],
+                     lambda label, name, url, imgurl: {'response': label, 'name': name, 'profile': url}),
+}
+
+
+"""The extension of the record files for each type of compression.
+"""
+EXTENSIONS = {
+    None: '.csv',
+    'gzip': '.csv.gz',
+    'zstd': '.csv.zst',
+}
+
+
+def _compression(filename):
+    for compression, extension in EXTENSIONS.items():
+        if compression and filename.endswith(extension):
+            return compression
+    return None
+
+
+def _open_compressed(filename, mode, compression, level=None):
+    """Opens the file <filename> compressed with <compression> as a binary stream, for reading if mode is 'r'
+    or writing if it's 'w' or 'a'. Appending adds a new gzip member or zstd frame, which are read as one.
+    """
+    if compression == 'gzip':
+        return gzip.open(filename, mode + 'b', level if level is not None else 6)
+    if zstandard is None:
+        raise ImportError('zstd compressed records need zstandard, install it with: pip install zstandard')
+    if mode == 'r':
+        # the buffer lets the records be read a line at a time
+        f = open(filename, 'rb')
+        return io.BufferedReader(zstandard.ZstdDecompressor().stream_reader(f, read_across_frames=True))
+    # the compressor does the buffering, and older versions of zstandard don't flush the file when they're flushed
+    f = open(filename, mode + 'b', 0)
+    return zstandard.ZstdCompressor(level=level if level is not None else 3).stream_writer(f)
+
+
+def _csv_stream(stream):
+    # the csv module of python 3 works with text while unicodecsv works with the bytes directly
+    if _bytes_csv:
+        return stream
+    return io.TextIOWrapper(stream, encoding='utf-8', newline='')
+
+
+# what reading a compressed file which was cut short raises
+_truncated = (EOFError, IOError, zlib.error) + ((zstandard.ZstdError,) if zstandard else ())
+
+
+def _complete_records(f, filename):
+    """Yields the lines of the record file f up to the end of the last complete record, so a file which was
+    cut short by a crash can still be read. Every field is quoted, so a record ends at the end of a line with
+    an even number of quotes in the file so far.
+    """
+    record = []
+    quotes = 0
+    try:
+        for line in f:
+            record.append(line)
+            quotes += line.count('"')
+            if quotes % 2 == 0 and line.endswith('\n'):
+                for l in record:
+                    yield l
+                record = []
+    except _truncated as e:
+        log.warning('%s was cut short (%s), only reading it up to the last complete record', filename, e)
+        return
+    if record:
+        log.warning('%s ends with an incomplete record, skipping it', filename)
+
+
+class CSVFile(object):
+
+    def __init__(self, filename, schema, append=False, compression=None, level=None, flush_every=100):
+        """Creates the record file <filename>.csv with the columns in schema.
+        If append is True and the file already exists, new records are added to the end of it instead.
+        <compression> can be 'gzip' or 'zstd' to compress the file as it's written (with the extension
+        .csv.gz or .csv.zst), at the compression <level>. Compressed files are flushed every <flush_every>
+        records so a crash loses at most that many.
+        """
+        self.filename = filename + EXTENSIONS[compression]
         # if there's a folder in the filename make sure it exists
         if (os.path.dirname(self.filename)):
             make_path(os.path.dirname(self.filename))
-        self.file = open(self.filename, 'w')
+        existing = append and os.path.isfile(self.filename)
+        # whether records are being added to an existing file
+        self.appended = existing
+        mode = 'a' if existing else 'w'
+        if compression:
+            self.file = _csv_stream(_open_compressed(self.filename, mode, compression, level))
+        else:
+            self.file = open(self.filename, mode)
+        self.flush_every = flush_every if compression else None
+        self.unflushed = 0
         self.writer = csv.DictWriter(self.file, fieldnames=schema, quoting=csv.QUOTE_ALL, strict=True)
-        self.writer.writeheader()
-        log.info('Created a new record file at: %s', self.filename)
+        if existing:
+            log.info('Appending to the record file at: %s', self.filename)
+        else:
+            self.writer.writeheader()
+            log.info('Created a new record file at: %s', self.filename)
 
-    def __del__(self):
+    def write(self, data):
+        self.writer.writerow(data)
+        if self.flush_every:
+            self.unflushed += 1
+            if self.unflushed >= self.flush_every:
+                self.flush()
+
+    def flush(self):
+        # ends the compressed block so everything written so far can be read back
+        self.file.flush()
+        self.unflushed = 0
+
+    def close(self):
         self.file.close()
 
-    def add_record(self, data):
-        self.writer.writerow(data)
+
+class CSVSink(object):
+    """The default sink, which writes the records of each section of each target to their own CSV file,
+    optionally compressed (see CSVFile).
+
+    A sink is what a Record writes to. open() is called once for every Record and returns the object the
+    records get written to, which must have the attributes filename and appended (whether it's adding to
+    the records of an earlier run) and the methods write(data), flush() and close(). The extension attribute
+    of a sink is the extension of the record files, or None if it doesn't write a file for each record.
+    """
+
+    def __init__(self, compression=None, level=None, flush_every=100):
+        if compression == 'zstd' and zstandard is None:
+            raise ImportError('zstd compressed records need zstandard, install it with: pip install zstandard')
+        self.compression = compression
+        self.level = level
+        self.flush_every = flush_every
+        self.extension = EXTENSIONS[compression]
+
+    def open(self, filename, schema, append=False, target=None, section=None):
+        return CSVFile(filename, schema, append, self.compression, self.level, self.flush_every)
+
+    def close(self):
+        pass
+
+
+class Record(object):
+
+    def __init__(self, filename, schema, append=False, seen=None, key=None, sink=None, target=None, section=None,
+                 writer=None):
+        """Creates a record of the columns in schema, by default the CSV file <filename>.csv.
+        If append is True and the file already exists, new records are added to the end of it instead.
+        <seen> is an optional collection of the items already scraped (see index.SeenItems), keyed by the
+        column <key>. Records whose key is in it are dropped and the others are added to it.
+        <sink> is what the records are written to (CSVSink by default), which might need to know the <target>
+        and <section> the records are from.
+        <writer> is an optional writer.RecordWriter to write the records from in the background. Call close()
+        once all the records have been added to make sure they've been written.
+        """
+        # stays closed if opening fails so __del__ has nothing to do
+        self.closed = True
+        self.out = (sink or CSVSink()).open(filename, schema, append, target, section)
+        self.closed = False
+        self.filename = self.out.filename
+        self.appended = self.out.appended
+        self.seen = seen
+        self.key = key
+        self.writer = writer
+
+    def __del__(self):
+        # nothing can be waiting in the writer for a record which is being deleted, so close it straight away
+        self._close()
+
+    def _flush(self):
+        self.out.flush()
+        if self.seen is not None:
+            self.seen.commit()
+
+    def _close(self):
+        if not self.closed:
+            self.closed = True
+            self._flush()
+            self.out.close()
+
+    def flush(self):
+        """Waits for the records added so far to be written and flushes them to disk.
+        """
+        if self.writer:
+            self.writer.call(self._flush)
+        else:
+            self._flush()
+
+    def close(self):
+        """Waits for the records added so far to be written and closes the record.
+        """
+        if self.writer:
+            self.writer.call(self._close)
+        else:
+            self._close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+        return False
+
+    def _add(self, data, message, args, tags=None):
+        key = data.get(self.key) if self.seen is not None else None
+        if key and key in self.seen:
+            return False
+        # tags are the tracing tags of the thread which added the record, it's written from the writer thread
+        with tracing.tags(**(tags or {})), tracing.span('record', file=self.filename):
+            self.out.write(data)
+        if key:
+            self.seen.add(key)
+        if message:
+            log.info(message, *args)
+        return True
+
+    def add_record(self, data, message=None, *args):
+        """Writes data to the record file and then logs message with args, if there is one.
+        Records which have been seen before are dropped without being logged, in which case False is returned.
+        With a writer the record is only queued to be written and None is returned.
+        """
+        if self.writer:
+            self.writer.put(self._add, data, message, args, tracing.current_tags())
+            return None
+        return self._add(data, message, args)
+
+
+def read_records(filename):
+    """Yields every record in the record file <filename> (including the extension) as a dict.
+    Compressed files are decompressed as they're read. If the file was cut short, e.g. by a crash while it was
+    being written, the records up to the last complete one are read.
+    """
+    compression = _compression(filename)
+    if compression:
+        f = _csv_stream(_open_compressed(filename, 'r', compression))
+    else:
+        f = open(filename, _read_mode)
+    with f:
+        for row in csv.DictReader(_complete_records(f, filename)):
+            yield row
 
 
 class Album(object):
 
-    def __init__(self, name, descriptions=False):
+    def __init__(self, name, descriptions=False, seen=None, sink=None, target=None, section=None, writer=None,
+                 downloads=None):
+        """<seen> is an optional collection of the image filenames already downloaded (see index.SeenItems),
+        images in it aren't downloaded again. The descriptions are written to <sink> with <writer> (see Record).
+        The images are downloaded in the background by <downloads>, the shared download.DownloadEngine by
+        default. Call close() once all the images have been added to wait for them.
+        """
         make_path(name)
         self.name = name
         self.record = None
+        self.seen = seen
+        self.downloads = downloads or shared_engine()
+        self.pending = 0  # images still being downloaded
+        self.failed = []  # (url, error) of the images which failed to download
+        self._done = Condition()
         if descriptions:
-            self.record = Record(name, ['filename', 'description', 'permalink'])
+            self.record = Record(name, SECTIONS['photos'][0], sink=sink, target=target, section=section,
+                                 writer=writer)
+
+    def flush(self):
+        if self.record:
+            self.record.flush()
+        if self.seen is not None:
+            self.seen.commit()
+
+    def wait(self, timeout=None):
+        """Waits until every image added has been downloaded, or failed to, or <timeout> seconds have passed.
+        Gives up if the download threads have died. Returns True if every image is done.
+        """
+        end = time() + timeout if timeout is not None else None
+        with self._done:
+            while self.pending:
+                if not self.downloads.alive():
+                    log.error('The download threads have stopped with %d images of %s left', self.pending, self.name)
+                    return False
+                remaining = end - time() if end is not None else 1.0
+                if remaining <= 0:
+                    log.error('Gave up waiting for %d images of %s to download', self.pending, self.name)
+                    return False
+                # wake up every now and then to check the download threads are still going
+                self._done.wait(min(remaining, 1.0))
+        return True
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+        return False
+
+    def close(self):
+        self.wait()
+        if self.failed:
+            log.warning('Failed to download %d images into %s', len(self.failed), self.name)
+        if self.record:
+            self.record.close()
+        if self.seen is not None:
+            self.seen.commit()
 
     def add_image(self, url):
-        Thread(target=self._image_dl(url), args=(url)).start()
-
-    def _image_dl(self, url):
-        try:
-            img_bin = urlopen(url).read()
-            if img_bin:
-                filename = urlparse(url).path.split('/')[-1]
-                fullpath = os.path.join(self.name, filename)
-                with open(fullpath, 'wb') as f:
-                    f.write(img_bin)
-            return
-        except IOError:
-            # there was some issue with the connection
-            # raise the Broken Image Error
-            pass
-        raise BrokenImageError
+        """Queues the image at url to be downloaded into the album and returns straight away.
+        Returns False if it was downloaded before.
+        """
+        filename = image_filename(url)
+        if self.seen is not None and filename in self.seen:
+            return False
+        with self._done:
+            self.pending += 1
+        self.downloads.download(url, os.path.join(self.name, filename), self._downloaded)
+        return True
 
+    def _downloaded(self, url, path, error):
+        # called from the download thread
+        if error is None and self.seen is not None:
+            self.seen.add(os.path.basename(path))
+        with self._done:
+            if error is not None:
+                self.failed.append((url, error))
+            self.pending -= 1
+            self._done.notify_all()
 
     def add_description(self, imgurl, desc, perma):
         if self.record:
-            filename = urlparse(imgurl).path.split('/')[-1]
-            self.record.add_record({
-                'filename': filename,
-                'description': desc,
-                'permalink': perma,
-            })
+            self.record.add_record(SECTIONS['photos'][1](imgurl, desc, perma))
@@ -1,19 +1,32 @@
 import logging as log
 import os
 
+from glob import glob
 from urlparse import urlparse
 
 # local imports
 import record
 
 from crawler import FBCrawler
+from metrics import registry as metrics
+from writer import RecordWriter
+try:
+    from lite import LiteCrawler, NeedsBrowser
+except ImportError:
+    # requests or lxml aren't installed so everything will be crawled with the browser
+    LiteCrawler = None
 from helpers import strip_query, timestring, path_safe, get_target, get_targeturl
 
 
+# in delta mode, stop going down the timeline after this many posts in a row which were already scraped
+# (a single old post can show up at the top if it's pinned)
+DELTA_STOP_AFTER = 3
+
+
 class FBScraper(FBCrawler):
 
-    def __init__(self, output_dir=None):
-        FBCrawler.__init__(self)
+    def __init__(self, output_dir=None, profile=None, latency=None, driver=None):
+        FBCrawler.__init__(self, profile, latency, driver)
         # store in the current directory by default
         self.output_dir = output_dir if output_dir else ''
         self.def_foldername = '%TARGET%'
@@ -21,6 +34,9 @@ class FBScraper(FBCrawler):
         self.foldernaming = self.def_foldername
         self.filenaming = self.def_filename
         self.post_range = []  # a list of years of posts to scrape
+        # only scrape the posts between these unix times (from the most recent posts, not by year)
+        self.post_since = None
+        self.post_until = None
 
         self.mapping = {
             'posts': self.scrape_posts,
@@ -33,6 +49,24 @@ class FBScraper(FBCrawler):
             'checkins': self.scrape_checkins,
         }
         self.settings = self._def_settings()
+        # sections to try crawling over plain HTTP before falling back to the browser
+        # only friends, likes, groups, checkins and about can be crawled this way
+        self.lite_sections = set()
+        self.lite = None
+        # a Checkpoint to save the progress to and resume from, if any
+        self.checkpoint = None
+        # only record what's new since the last time each target was scraped, adding it to the previous files
+        # (so only with a sink which writes a file for each record, like the default one)
+        self.delta = False
+        # an index.SeenIndex of the items scraped by every run, which aren't recorded again
+        self.index = None
+        # what the records are written to, a CSV file for each section of each target by default
+        # (see record.CSVSink and sinks)
+        self.sink = None
+        # writes the records and logs them in the background so the crawl only has to queue them
+        self.writer = RecordWriter()
+        # the download.DownloadEngine the album images are downloaded with, the shared one by default
+        self.downloads = None
 
     def _def_settings(self):
         s = {}
@@ -49,17 +83,128 @@ class FBScraper(FBCrawler):
     def reset_filename(self):
         self.filenaming = self.def_filename
 
-    def _naming_keywords(self, orig, target, name):
+    def _naming_keywords(self, orig, target, name, timestamp=None):
         result = orig.replace('%TARGET%', target)
         result = result.replace('%TYPE%', name)
-        result = result.replace('%TIMESTAMP%', timestring())
+        result = result.replace('%TIMESTAMP%', timestamp if timestamp is not None else timestring())
         return result
 
-    def _output_file(self, target, name):
-        folder = self._naming_keywords(self.foldernaming, target, name)
-        filename = self._naming_keywords(self.filenaming, target, name)
+    def _output_file(self, target, name, timestamp=None):
+        folder = self._naming_keywords(self.foldernaming, target, name, timestamp)
+        filename = self._naming_keywords(self.filenaming, target, name, timestamp)
         return os.path.join(self.output_dir, folder, filename)
 
+    def _previous_file(self, target, name):
+        """Returns the most recently written record file (without the extension) of section <name> of target
+        from an earlier run, or None if there isn't one. Always None if the sink doesn't write a file per record.
+        """
+        extension = (self.sink or record.CSVSink()).extension
+        if not extension:
+            return None
+        files = glob(self._output_file(target, name, timestamp='*') + extension)
+        if not files:
+            return None
+        return max(files, key=os.path.getmtime)[:-len(extension)]
+
+    def _seen(self, target, kind):
+        """Returns the items of <kind> already scraped from target according to the index, or None.
+        """
+        return self.index.items(target, kind) if self.index else None
+
+    def _record(self, target, name, schema, key=None, kind=None):
+        """Returns the record to write section <name> of target to. If the checkpoint has a record file for
+        the section from an interrupted run, or in delta mode there's one from an earlier run, it's appended to.
+        Otherwise a new one is created.
+        If there's an index, records whose column <key> is already in it under <kind> (the section name
+        by default) are dropped.
+        """
+        filename = self.checkpoint.record_file(target, name) if self.checkpoint else None
+        if not filename and self.delta:
+            filename = self._previous_file(target, name)
+        append = filename is not None
+        if not append:
+            filename = self._output_file(target, name)
+        if self.checkpoint:
+            self.checkpoint.set_record_file(target, name, filename)
+        seen = self._seen(target, kind or name) if key else None
+        return record.Record(filename, schema, append, seen, key, self.sink, target, name, self.writer)
+
+    def _known(self, rec, column):
+        """In delta mode, returns the set of values of column already in the record file being added to.
+        Otherwise returns an empty set.
+        """
+        if not (self.delta and rec.appended):
+            return set()
+        known = set(r[column] for r in record.read_records(rec.filename))
+        log.info('Found %d records in %s, only recording new ones', len(known), rec.filename)
+        return known
+
+    def _new_only(self, rec, column, callback, key):
+        """In delta mode, wraps the callback of a list so only the items whose key isn't in column of
+        the record file already get recorded.
+        """
+        known = self._known(rec, column)
+        if not known:
+            return callback
+
+        def new_only(*args):
+            if key(*args) not in known:
+                callback(*args)
+        return new_only
+
+    def _section_done(self, target, name):
+        """Returns True if the checkpoint says section <name> of target has already been scraped.
+        """
+        if self.checkpoint and self.checkpoint.section_done(target, name):
+            log.info('Already scraped %s of %s, skipping it', name, target)
+            return True
+        return False
+
+    def _finish_section(self, target, name):
+        """Saves the progress of section <name> of target to the checkpoint once its record (or album) has been
+        closed. It's only marked as done if the scrape wasn't stopped halfway through.
+        """
+        if not self.checkpoint:
+            return
+        if self.stop_request:
+            self.checkpoint.save()
+        else:
+            self.checkpoint.finish_section(target, name)
+
+    def _resumable(self, target, name, rec, callback, key):
+        """Wraps the callback of a list so the items up to and including the last one recorded by an earlier
+        run are skipped, and the last item recorded is kept up to date in the checkpoint.
+        <key> takes the arguments of the callback and returns the key of the item, e.g. its url.
+        If the last item recorded never shows up (the list has changed since) the skipped items are
+        recorded once the list is done so nothing is lost. Call finish() on the result once the list is done.
+        """
+        if not self.checkpoint:
+            callback.finish = lambda: None
+            return callback
+        last = self.checkpoint.last_item(target, name)
+        state = {'skipping': last is not None, 'skipped': []}
+
+        def record_item(*args):
+            callback(*args)
+            self.checkpoint.set_last_item(target, name, key(*args), rec.flush)
+
+        def resumed(*args):
+            if not state['skipping']:
+                return record_item(*args)
+            state['skipped'].append(args)
+            if key(*args) == last:
+                state['skipping'] = False
+                state['skipped'] = []
+
+        def finish():
+            if state['skipping'] and state['skipped'] and not self.stop_request:
+                log.warning('Couldn\'t find where the last run stopped in %s of %s, recording all of it', name, target)
+                for args in state['skipped']:
+                    record_item(*args)
+
+        resumed.finish = finish
+        return resumed
+
     def autotarget(func):
         """This decorator converts the target into a target url and ensures it's a legit page.
         """
@@ -80,8 +225,39 @@ class FBScraper(FBCrawler):
     def selective_scrape(self, settings):
         self.settings = settings
 
+    def _crawl(self, section, *args):
+        """Crawls section with the lightweight HTTP crawler if it's enabled in self.lite_sections,
+        falling back to the browser if the page needs it.
+        """
+        if section in self.lite_sections and LiteCrawler is not None:
+            if self.lite is None:
+                # share the browser's login with the http crawler
+                self.lite = LiteCrawler(self.driver.get_cookies(), lambda: self.stop_request)
+            # the lite crawler doesn't count its items so count them here
+            lite_args = [metrics.counted('crawl_' + section, a) if callable(a) else a for a in args]
+            try:
+                return getattr(self.lite, 'crawl_' + section)(*lite_args)
+            except NeedsBrowser as e:
+                log.info('Crawling %s with the browser: %s', section, e)
+        return getattr(self, 'crawl_' + section)(*args)
+
+    def scrape(self, target):
+        """Scrapes every section of target enabled in self.settings.
+        Does nothing if the checkpoint says the target has already been scraped.
+        """
+        if self.checkpoint and self.checkpoint.target_done(get_target(get_targeturl(target))):
+            log.info('Already scraped %s, skipping it', target)
+            return None
+        return self._scrape(target)
+
+    def close(self):
+        """Waits for the records which are still queued to be written and stops the writer thread.
+        Call it once the scraper is done with, or whatever is still queued is lost when the program exits.
+        """
+        self.writer.close()
+
     @autotarget
-    def scrape(self, targeturl):
+    def _scrape(self, targeturl):
         target = get_target(targeturl)
         log.info('Scraping user %s at URL: %s', target, targeturl)
         # do posts first because we're already on the timeline
@@ -91,67 +267,115 @@ class FBScraper(FBCrawler):
             if value and key is not 'posts':
                 self.mapping[key](targeturl)
         log.info('Finished scraping user %s', target)
+        if self.checkpoint and not self.stop_request:
+            self.checkpoint.finish_target(target)
+        metrics.inc('fbscrape_targets_total')
+        self.stats.log_summary(targeturl)
 
     @autotarget
-    def scrape_posts(self, targeturl):
-        if len(self.post_range) == 0:
+    def scrape_posts(self, targeturl, since=None, until=None):
+        """Scrapes the posts between the unix times since and until (self.post_since and self.post_until by default)
+        if either is given, otherwise every year in self.post_range or all of the posts.
+        """
+        since = since if since is not None else self.post_since
+        until = until if until is not None else self.post_until
+        if since is not None or until is not None:
+            self.scrape_posts_by_year(targeturl, None, since, until)
+        elif len(self.post_range) == 0:
             self.scrape_posts_by_year(targeturl)
         else:
             for y in self.post_range:
                 self.scrape_posts_by_year(targeturl, y)
 
     @autotarget
-    def scrape_posts_by_year(self, targeturl, year=None):
+    def scrape_posts_by_year(self, targeturl, year=None, since=None, until=None):
         target = get_target(targeturl)
         rec_name = 'posts'
         if year:
             rec_name += '_' + str(year)
-        rec = record.Record(self._output_file(target, rec_name), ['date', 'post', 'translation', 'permalink'])
-        log.info('Scraping posts into %s', rec.filename)
-
-        def callback(p_time, post_text, p_link, translation, i):
-            rec.add_record({
-                'date': timestring(p_time),
-                'post': post_text,
-                'translation': translation,
-                'permalink': p_link,
-            })
-
-            # keep translation as a unicode string while merging
-            if translation:
-                translation = u'==== TRANSLATION ====\n{}\n'.format(translation)
-            log.info(('Scraped post %d\n\n#### START POST ####\n%s\n%s'
-                      '####  END POST  ####\n'), i, post_text, translation)
-
-        posts_scraped = self.crawl_posts(targeturl, callback, year)
-        log.info('Scraped %d posts into %s', posts_scraped, rec.filename)
+        if self._section_done(target, rec_name):
+            return
+        # posts of every year are indexed together so overlapping year ranges don't record a post twice
+        schema, make_record = record.SECTIONS['posts']
+        with self._record(target, rec_name, schema, 'permalink', 'posts') as rec:
+            log.info('Scraping posts into %s', rec.filename)
+
+            last = self.checkpoint.last_item(target, rec_name) if self.checkpoint else None
+            # in delta mode the new posts go after the ones from the last run, so the file isn't newest first anymore
+            known = self._known(rec, 'permalink')
+            streak = {'known': 0}
+
+            def skip(p_time, p_link):
+                # don't bother expanding posts which have been recorded before
+                if p_link in known or (p_link and rec.seen is not None and p_link in rec.seen):
+                    return True
+                # the timeline goes from newest to oldest so anything newer than the last post recorded is done
+                if last is None or p_time is None:
+                    return False
+                return int(p_time) > int(last[0]) or [p_time, p_link] == last
+
+            def stop(p_time, p_link):
+                # everything further down has already been scraped once we're into the posts we know about
+                if p_link not in known:
+                    streak['known'] = 0
+                    return False
+                streak['known'] += 1
+                return streak['known'] >= DELTA_STOP_AFTER
+
+            def callback(p_time, post_text, p_link, translation, i):
+                data = make_record(p_time, post_text, p_link, translation)
+                # the post only gets formatted into the log once it's been written
+                if translation:
+                    rec.add_record(data, ('Scraped post %d\n\n#### START POST ####\n%s\n'
+                                          '==== TRANSLATION ====\n%s\n####  END POST  ####\n'),
+                                   i, post_text, translation)
+                else:
+                    rec.add_record(data, 'Scraped post %d\n\n#### START POST ####\n%s\n####  END POST  ####\n',
+                                   i, post_text)
+                if self.checkpoint:
+                    self.checkpoint.set_last_item(target, rec_name, [p_time, p_link], rec.flush)
+
+            posts_scraped = self.crawl_posts(targeturl, callback, year, skip, stop if known else None, since, until)
+            log.info('Scraped %d posts into %s', posts_scraped, rec.filename)
+        self._finish_section(target, rec_name)
 
     @autotarget
     def scrape_likes(self, targeturl):
         target = get_target(targeturl)
-        rec = record.Record(self._output_file(target, 'likes'), ['name', 'url'])
-        log.info('Scraping likes into %s', rec.filename)
-
-        def callback(name, page_url, i):
-            rec.add_record({'name': name, 'url': page_url})
-            log.info('Scraped like %d: %s', i, name)
-
-        likes_scraped = self.crawl_likes(targeturl, callback)
-        log.info('Scraped %d likes into %s', likes_scraped, rec.filename)
+        if self._section_done(target, 'likes'):
+            return
+        schema, make_record = record.SECTIONS['likes']
+        with self._record(target, 'likes', schema, 'url') as rec:
+            log.info('Scraping likes into %s', rec.filename)
+
+            def callback(name, page_url, i):
+                rec.add_record(make_record(name, page_url), 'Scraped like %d: %s', i, name)
+
+            key = lambda name, page_url, i: page_url
+            resumed = self._resumable(target, 'likes', rec, self._new_only(rec, 'url', callback, key), key)
+            likes_scraped = self._crawl('likes', targeturl, resumed)
+            resumed.finish()
+            log.info('Scraped %d likes into %s', likes_scraped, rec.filename)
+        self._finish_section(target, 'likes')
 
     @autotarget
     def scrape_friends(self, targeturl):
         target = get_target(targeturl)
-        rec = record.Record(self._output_file(target, 'friends'), ['name', 'profile'])
-        log.info('Scraping friends into %s', rec.filename)
-
-        def callback(name, url, imgurl, i):
-            friend_url = strip_query(url)
-            rec.add_record({'name': name, 'profile': friend_url})
-            log.info('Scraped friend %d: %s', i, name)
-
-        friends_scraped = self.crawl_friends(targeturl, callback)
-        log.info('Scraped %d friends into %s', friends_scraped, rec.filename)
+        if self._section_done(target, 'friends'):
+            return
+        schema, make_record = record.SECTIONS['friends']
+        with self._record(target, 'friends', schema, 'profile') as rec:
+            log.info('Scraping friends into %s', rec.filename)
+
+            def callback(name, url, imgurl, i):
+                rec.add_record(make_record(name, url, imgurl), 'Scraped friend %d: %s', i, name)
+
+            key = lambda name, url, imgurl, i: strip_query(url)
+            resumed = self._resumable(target, 'friends', rec, self._new_only(rec, 'profile', callback, key), key)
+            friends_scraped = self._crawl('friends', targeturl, resumed)
+            resumed.finish()
+            log.info('Scraped %d friends into %s', friends_scraped, rec.filename)
+        self._finish_section(target, 'friends')
 
     @autotarget
     def scrape_photos(self, targeturl):
@@ -159,14 +383,17 @@ class FBScraper(FBCrawler):
         Photos in albums are not scraped.
         """
         target = get_target(targeturl)
+        if self._section_done(target, 'photos'):
+            return
         # scrape main photos
-        photo_album = record.Album(self._output_file(target, 'photos'), True)
-
-        def photo_cb(photourl, description, perma, _):
-            self._save_to_album(photourl, description, perma, photo_album)
+        with record.Album(self._output_file(target, 'photos'), True, self._seen(target, 'photos'), self.sink,
+                          target, 'photos', self.writer, self.downloads) as photo_album:
+            def photo_cb(photourl, description, perma, _):
+                self._save_to_album(photourl, description, perma, photo_album)
 
-        photos_scraped = self.crawl_photos(targeturl, photo_cb)
-        log.info('Scraped %d photos into %s', photos_scraped, photo_album.name)
+            photos_scraped = self.crawl_photos(targeturl, photo_cb)
+            log.info('Scraped %d photos into %s', photos_scraped, photo_album.name)
+        self._finish_section(target, 'photos')
 
     @autotarget
     def scrape_all_albums(self, targeturl):
@@ -176,75 +403,96 @@ class FBScraper(FBCrawler):
             """What to do for each album.
             """
             album_name = 'album-' + path_safe(name)
-            album = record.Album(self._output_file(target, album_name), True)
-
-            def album_download_cb(photourl, perma, _):
-                self._save_to_album(photourl, '', perma, album)
-
-            scraped = self.crawl_one_album(url, album_download_cb)
-            log.info('Scraped %d photos into %s', scraped, album.name)
-
+            if self._section_done(target, album_name):
+                return
+            # photos in albums are often on the photos page too so they share the index
+            with record.Album(self._output_file(target, album_name), True, self._seen(target, 'photos'), self.sink,
+                              target, album_name, self.writer, self.downloads) as album:
+                def album_download_cb(photourl, perma, _):
+                    self._save_to_album(photourl, '', perma, album)
+
+                scraped = self.crawl_one_album(url, album_download_cb)
+                log.info('Scraped %d photos into %s', scraped, album.name)
+            self._finish_section(target, album_name)
+
+        if self._section_done(target, 'albums'):
+            return
         self.crawl_albums(targeturl, album_cb)
+        self._finish_section(target, 'albums')
 
 
     def _save_to_album(self, photourl, description, perma, album):
-        try:
-            # download the image
-            album.add_image(photourl)
-            # save the descriptions
-            album.add_description(photourl, description, perma)
-            log.info('Scraped photo: %s', photourl)
-        except record.BrokenImageError:
-            log.error('Failed to download image: %s', photourl)
+        # the image is downloaded in the background, failures are logged and kept in album.failed
+        if not album.add_image(photourl):
+            log.info('Already scraped photo: %s', photourl)
+            return
+        # save the descriptions
+        album.add_description(photourl, description, perma)
+        log.info('Scraped photo: %s', photourl)
 
 
     @autotarget
     def scrape_about(self, targeturl):
         target = get_target(targeturl)
-        rec = record.Record(self._output_file(target, 'about'), ['section', 'text'])
-
-        def callback(section, content):
-            rec.add_record({'section': section, 'text': content})
-            log.info('Scraped section %s with the following text:\n#### START ####\n%s\n####  END  ####',
-                     section, content)
+        if self._section_done(target, 'about'):
+            return
+        # the about page is short so it's always scraped again from the start
+        schema, make_record = record.SECTIONS['about']
+        with record.Record(self._output_file(target, 'about'), schema, sink=self.sink, target=target,
+                           section='about', writer=self.writer) as rec:
+            def callback(section, content):
+                rec.add_record(make_record(section, content),
+                               'Scraped section %s with the following text:\n#### START ####\n%s\n####  END  ####',
+                               section, content)
 
-        self.crawl_about(targeturl, callback)
+            self._crawl('about', targeturl, callback)
+        self._finish_section(target, 'about')
 
 
     @autotarget
     def scrape_groups(self, targeturl):
         target = get_target(targeturl)
-        rec = record.Record(self._output_file(target, 'groups'), ['name', 'url'])
+        if self._section_done(target, 'groups'):
+            return
+        schema, make_record = record.SECTIONS['groups']
+        with self._record(target, 'groups', schema, 'url') as rec:
+            def callback(name, url, i):
+                rec.add_record(make_record(name, url), 'Scraped group %d: %s', i, name)
 
-        def callback(name, url, i):
-            rec.add_record({'name': name, 'url': url})
-            log.info('Scraped group %d: %s', i, name)
-
-        scraped = self.crawl_groups(targeturl, callback)
-        log.info('Scraped %d groups into %s', scraped, rec.filename)
+            key = lambda name, url, i: url
+            resumed = self._resumable(target, 'groups', rec, self._new_only(rec, 'url', callback, key), key)
+            scraped = self._crawl('groups', targeturl, resumed)
+            resumed.finish()
+            log.info('Scraped %d groups into %s', scraped, rec.filename)
+        self._finish_section(target, 'groups')
 
 
     @autotarget
     def scrape_checkins(self, targeturl):
         target = get_target(targeturl)
-        rec = record.Record(self._output_file(target, 'checkins'), ['name', 'url'])
-
-        def callback(name, url, i):
-            rec.add_record({'name': name, 'url': url})
-            log.info('Scraped check in %d: %s', i, name)
+        if self._section_done(target, 'checkins'):
+            return
+        schema, make_record = record.SECTIONS['checkins']
+        with self._record(target, 'checkins', schema, 'url') as rec:
+            def callback(name, url, i):
+                rec.add_record(make_record(name, url), 'Scraped check in %d: %s', i, name)
 
-        scraped = self.crawl_checkins(targeturl, callback)
-        log.info('Scraped %d checkins into %s', scraped, rec.filename)
+            key = lambda name, url, i: url
+            resumed = self._resumable(target, 'checkins', rec, self._new_only(rec, 'url', callback, key), key)
+            scraped = self._crawl('checkins', targeturl, resumed)
+            resumed.finish()
+            log.info('Scraped %d checkins into %s', scraped, rec.filename)
+        self._finish_section(target, 'checkins')
 
 
     def scrape_event_guests(self, eventurl, guest_filter=None):
         rec_name = path_safe(urlparse(eventurl).path)
         rec_name = os.path.join(self.output_dir, rec_name)
-        rec = record.Record(rec_name, ['response', 'name', 'profile'])
-
-        def callback(label, name, url, imgurl, i):
-            rec.add_record({'response': label, 'name': name, 'profile': url})
-            log.info('%s is %s', name, label)
+        schema, make_record = record.SECTIONS['event_guests']
+        with record.Record(rec_name, schema, sink=self.sink, target=eventurl, section='event_guests',
+                           writer=self.writer) as rec:
+            def callback(label, name, url, imgurl, i):
+                rec.add_record(make_record(label, name, url, imgurl), '%s is %s', name, label)
 
-        scraped = self.crawl_event_guests(eventurl, callback, guest_filter)
+            scraped = self.crawl_event_guests(eventurl, callback, guest_filter)
         log.info('Scraped %d invitees for event %s', scraped, eventurl)
@@ -0,0 +1,267 @@
+"""Sinks which write the records somewhere other than a CSV file per section of each target: a SQLite database
+for the whole run or a Parquet dataset. See record.CSVSink for the interface every sink has.
+"""
+
+import logging as log
+import os
+import sqlite3
+
+from threading import Event, Thread
+
+try:
+    from Queue import Queue, Empty
+except ImportError:
+    from queue import Queue, Empty
+
+try:
+    import pyarrow
+    import pyarrow.parquet as parquet
+except ImportError:
+    # pyarrow is only needed for ParquetSink
+    pyarrow = None
+
+# local imports
+from helpers import parse_timestring, path_safe
+from record import make_path
+
+
+"""The columns of each table besides the target, named after the columns of the record schemas.
+album is the section the photo was scraped from, e.g. photos or album-holidays.
+"""
+TABLES = {
+    'posts': [('date', 'INTEGER'), ('post', 'TEXT'), ('translation', 'TEXT'), ('permalink', 'TEXT')],
+    'friends': [('name', 'TEXT'), ('profile', 'TEXT')],
+    'likes': [('name', 'TEXT'), ('url', 'TEXT')],
+    'photos': [('album', 'TEXT'), ('filename', 'TEXT'), ('description', 'TEXT'), ('permalink', 'TEXT')],
+    'about': [('section', 'TEXT'), ('text', 'TEXT')],
+    'groups': [('name', 'TEXT'), ('url', 'TEXT')],
+    'checkins': [('name', 'TEXT'), ('url', 'TEXT')],
+    'event_guests': [('response', 'TEXT'), ('name', 'TEXT'), ('profile', 'TEXT')],
+}
+
+
+def table_name(section):
+    """Returns the table the records of a section go into, e.g. posts for posts_2017.
+    """
+    if section.startswith('posts'):
+        return 'posts'
+    if section == 'photos' or section.startswith('album-'):
+        return 'photos'
+    if section in TABLES:
+        return section
+    raise ValueError('No table for the section {}'.format(section))
+
+
+def row_values(table, section, data):
+    """Returns the values of a record in the order of the columns of its table, with the dates as unix times.
+    """
+    values = []
+    for column, _ in TABLES[table]:
+        if column == 'album':
+            values.append(section)
+        elif column == 'date':
+            values.append(parse_timestring(data.get('date')))
+        else:
+            values.append(data.get(column))
+    return values
+
+
+class SQLiteSink(object):
+
+    def __init__(self, filename, batch_size=500, queue_size=10000):
+        """Writes the records of every target into the SQLite database <filename>, with a table for each type
+        of record and the targets in a table of their own.
+        The records are written by a background thread so the crawl doesn't wait on the disk. Whatever is
+        waiting is inserted in one transaction of up to <batch_size> records, and at most <queue_size> records
+        wait before adding more blocks. Can be shared between scrapers.
+        """
+        if os.path.dirname(filename):
+            make_path(os.path.dirname(filename))
+        self.filename = filename
+        self.extension = None
+        self.batch_size = batch_size
+        self.queue = Queue(queue_size)
+        self.ready = Event()
+        self.error = None
+        self.thread = Thread(target=self._writer, name='sqlite-writer')
+        self.thread.daemon = True
+        self.thread.start()
+        # wait for the tables to be created so errors show up straight away
+        self.ready.wait()
+        if self.error:
+            raise self.error
+        log.info('Writing the records to the database at: %s', filename)
+
+    def _create(self, db):
+        db.execute('CREATE TABLE IF NOT EXISTS targets (id INTEGER PRIMARY KEY, name TEXT NOT NULL UNIQUE)')
+        for table, columns in TABLES.items():
+            db.execute('CREATE TABLE IF NOT EXISTS {} (target_id INTEGER NOT NULL REFERENCES targets (id), {})'
+                       .format(table, ', '.join('{} {}'.format(c, t) for c, t in columns)))
+            db.execute('CREATE INDEX IF NOT EXISTS {0}_target ON {0} (target_id)'.format(table))
+        db.execute('CREATE INDEX IF NOT EXISTS posts_date ON posts (date)')
+        db.commit()
+
+    def _target_id(self, db, targets, target):
+        if target not in targets:
+            db.execute('INSERT OR IGNORE INTO targets (name) VALUES (?)', (target,))
+            targets[target] = db.execute('SELECT id FROM targets WHERE name = ?', (target,)).fetchone()[0]
+        return targets[target]
+
+    def _writer(self):
+        # the connection is only ever used by this thread
+        try:
+            db = sqlite3.connect(self.filename)
+            self._create(db)
+        except sqlite3.Error as e:
+            self.error = e
+            self.ready.set()
+            return
+        self.ready.set()
+        targets = {}  # name -> id
+        done = False
+        while not done:
+            # wait for something to do then take whatever else is waiting, up to a batch
+            batch = [self.queue.get()]
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self.queue.get_nowait())
+                except Empty:
+                    break
+            rows = {}  # table -> rows, in the order they came
+            flushed = []  # the events of the flushes waiting for this batch
+            for item in batch:
+                if item is None:
+                    done = True
+                    continue
+                table, target, values = item
+                if table is None:
+                    flushed.append(values)
+                else:
+                    rows.setdefault(table, []).append([self._target_id(db, targets, target)] + values)
+            try:
+                for table, values in rows.items():
+                    db.executemany('INSERT INTO {} VALUES ({})'.format(table, ', '.join('?' * len(values[0]))),
+                                   values)
+                db.commit()
+            except sqlite3.Error:
+                log.exception('Failed to write %d records to %s', sum(len(v) for v in rows.values()), self.filename)
+                db.rollback()
+            for event in flushed:
+                event.set()
+        db.close()
+
+    def put(self, table, target, values):
+        self.queue.put((table, target, values))
+
+    def flush(self):
+        """Waits until everything added so far is in the database.
+        """
+        if not self.thread.is_alive():
+            return
+        event = Event()
+        self.queue.put((None, None, event))
+        event.wait()
+
+    def open(self, filename, schema, append=False, target=None, section=None):
+        return SQLiteTable(self, target, section)
+
+    def close(self):
+        """Writes whatever is left and closes the database.
+        """
+        if self.thread.is_alive():
+            self.queue.put(None)
+            self.thread.join()
+
+
+class SQLiteTable(object):
+
+    def __init__(self, sink, target, section):
+        """The records of one section of a target, which get written to the table for that type of record.
+        """
+        self.sink = sink
+        self.target = target
+        self.section = section
+        self.table = table_name(section)
+        self.filename = '{} ({} of {})'.format(sink.filename, section, target)
+        # every run gets a database of its own
+        self.appended = False
+
+    def write(self, data):
+        self.sink.put(self.table, self.target, row_values(self.table, self.section, data))
+
+    def flush(self):
+        self.sink.flush()
+
+    def close(self):
+        pass
+
+
+def arrow_schema(table):
+    """Returns the pyarrow schema of a table, with the dates as timestamps.
+    """
+    return pyarrow.schema([pyarrow.field(column, pyarrow.timestamp('s') if kind == 'INTEGER' else pyarrow.string())
+                           for column, kind in TABLES[table]])
+
+
+class ParquetSink(object):
+
+    def __init__(self, directory, row_group_size=10000):
+        """Writes the records into Parquet files in <directory>, partitioned by section and target so they
+        can be loaded as one dataset, e.g. <directory>/section=posts/target=zuck/<timestamp>-posts.parquet.
+        The columns are the same as the tables of SQLiteSink without the target, with the dates as timestamps.
+        Rows are kept in memory until there's <row_group_size> of them and then written as a row group, so
+        memory use stays bounded however long a list is. Needs pyarrow.
+        """
+        if pyarrow is None:
+            raise ImportError('Writing Parquet files needs pyarrow, install it with: pip install pyarrow')
+        make_path(directory)
+        self.directory = directory
+        self.extension = None
+        self.row_group_size = row_group_size
+        log.info('Writing the records as Parquet files into: %s', directory)
+
+    def open(self, filename, schema, append=False, target=None, section=None):
+        return ParquetFile(self, filename, target, section)
+
+    def close(self):
+        pass
+
+
+class ParquetFile(object):
+
+    def __init__(self, sink, filename, target, section):
+        """The records of one section of a target, written to a file in the partition of the target and section.
+        Parquet files can only be read once they've been closed.
+        """
+        self.section = section
+        self.table = table_name(section)
+        self.schema = arrow_schema(self.table)
+        folder = os.path.join(sink.directory, 'section=' + self.table, 'target=' + path_safe(target))
+        make_path(folder)
+        self.filename = os.path.join(folder, os.path.basename(filename) + '.parquet')
+        self.appended = False
+        self.row_group_size = sink.row_group_size
+        self.rows = []
+        self.writer = parquet.ParquetWriter(self.filename, self.schema)
+        log.info('Created a new record file at: %s', self.filename)
+
+    def _write_rows(self):
+        if not self.rows:
+            return
+        columns = [pyarrow.array(list(c), type=f.type) for c, f in zip(zip(*self.rows), self.schema)]
+        self.writer.write_table(pyarrow.Table.from_arrays(columns, schema=self.schema))
+        self.rows = []
+
+    def write(self, data):
+        self.rows.append(row_values(self.table, self.section, data))
+        if len(self.rows) >= self.row_group_size:
+            self._write_rows()
+
+    def flush(self):
+        # writing out every few rows would make lots of tiny row groups, and the file can't be read
+        # until it's closed anyway
+        pass
+
+    def close(self):
+        self._write_rows()
+        self.writer.close()
@@ -0,0 +1,112 @@
+import logging as log
+
+from threading import Lock
+from time import time
+
+
+CATEGORIES = ['get', 'find', 'text', 'attribute', 'click', 'script', 'other']
+
+
+def category(command):
+    """Returns the type of a selenium command, one of CATEGORIES.
+    """
+    lower = command.lower()
+    if 'find' in lower:
+        return 'find'
+    if command == 'getElementText':
+        return 'text'
+    if command.startswith('getElement'):
+        return 'attribute'
+    if 'click' in lower:
+        return 'click'
+    if 'script' in lower and 'timeout' not in lower:
+        return 'script'
+    if command in ('get', 'refresh', 'getCurrentUrl', 'getPageSource'):
+        return 'get'
+    return 'other'
+
+
+class CrawlStats(object):
+
+    def __init__(self):
+        """Counts and times every command sent to the browser and the time spent sleeping in delay(),
+        separately for each section (the crawl_* method running at the time) and target.
+        Commands sent outside of a crawl are counted under the section None.
+        """
+        self.commands = {}  # (section, target) -> category -> [count, seconds]
+        self.sleeps = {}  # (section, target) -> [count, seconds]
+        self._lock = Lock()
+
+    def add(self, section, target, cat, seconds):
+        with self._lock:
+            cats = self.commands.setdefault((section, target), {})
+            entry = cats.setdefault(cat, [0, 0.0])
+            entry[0] += 1
+            entry[1] += seconds
+
+    def add_sleep(self, section, target, seconds):
+        with self._lock:
+            entry = self.sleeps.setdefault((section, target), [0, 0.0])
+            entry[0] += 1
+            entry[1] += seconds
+
+    def instrument(self, driver, where):
+        """Wraps driver.execute so every command sent by the driver and its WebElements gets counted.
+        <where> is a function returning the current (section, target).
+        """
+        execute = driver.execute
+
+        def timed_execute(command, params=None):
+            start = time()
+            try:
+                return execute(command, params)
+            finally:
+                section, target = where()
+                self.add(section, target, category(command), time() - start)
+
+        driver.execute = timed_execute
+
+    def summary(self, target=None):
+        """Returns the totals for each section, of every target or only of <target>:
+        {section: {'commands': {category: {'count': n, 'seconds': s}}, 'sleep': {'count': n, 'seconds': s}}}
+        """
+        result = {}
+        with self._lock:
+            for (section, t), cats in self.commands.items():
+                if target is not None and t != target:
+                    continue
+                totals = result.setdefault(section, {'commands': {}, 'sleep': {'count': 0, 'seconds': 0.0}})
+                for cat, (count, seconds) in cats.items():
+                    total = totals['commands'].setdefault(cat, {'count': 0, 'seconds': 0.0})
+                    total['count'] += count
+                    total['seconds'] += seconds
+            for (section, t), (count, seconds) in self.sleeps.items():
+                if target is not None and t != target:
+                    continue
+                totals = result.setdefault(section, {'commands': {}, 'sleep': {'count': 0, 'seconds': 0.0}})
+                totals['sleep']['count'] += count
+                totals['sleep']['seconds'] += seconds
+        return result
+
+    def total(self, target=None):
+        """Returns the total number of commands sent, for every target or only for <target>.
+        """
+        return sum(c['count'] for s in self.summary(target).values() for c in s['commands'].values())
+
+    def log_summary(self, target=None):
+        """Logs a line for every section with the number of commands of each type and the time they took,
+        as well as the time spent sleeping.
+        """
+        for section, totals in sorted(self.summary(target).items(), key=lambda s: str(s[0])):
+            cmds = totals['commands']
+            count = sum(c['count'] for c in cmds.values())
+            secs = sum(c['seconds'] for c in cmds.values())
+            parts = ', '.join('{} {} in {:.2f}s'.format(cmds[c]['count'], c, cmds[c]['seconds'])
+                              for c in CATEGORIES if c in cmds)
+            log.info('%s: %d commands in %.2fs (%s), slept %.2fs in %d delays', section or 'other', count, secs,
+                     parts or 'none', totals['sleep']['seconds'], totals['sleep']['count'])
+
+    def reset(self):
+        with self._lock:
+            self.commands = {}
+            self.sleeps = {}
@@ -0,0 +1,187 @@
+"""Records a timeline of a scraping session in the Chrome trace-event format, which can be opened with
+chrome://tracing or https://ui.perfetto.dev to see where the time went for each target.
+
+Tracing is off unless enable() is called. While it's off span() and tags() hand back a shared object which
+does nothing and wrap() returns the function it's given, so the instrumentation costs next to nothing.
+"""
+
+import json
+import os
+
+from threading import Lock, current_thread, local
+from time import time
+
+
+class _NullSpan(object):
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        return False
+
+
+_null_span = _NullSpan()
+_tracer = None
+
+
+class _Span(object):
+
+    def __init__(self, tracer, name, args):
+        self.tracer = tracer
+        self.name = name
+        self.args = args
+
+    def __enter__(self):
+        self.start = time()
+        return self
+
+    def __exit__(self, *args):
+        self.tracer.complete(self.name, self.start, time(), self.args)
+        return False
+
+
+class _Tags(object):
+
+    def __init__(self, tracer, tags):
+        self.tracer = tracer
+        self.tags = tags
+
+    def __enter__(self):
+        self.tracer.push(self.tags)
+        return self
+
+    def __exit__(self, *args):
+        self.tracer.pop()
+        return False
+
+
+class Tracer(object):
+
+    def __init__(self, filename):
+        """Writes the events to filename as they happen so nothing is lost if the program crashes.
+        """
+        self.filename = filename
+        self.file = open(filename, 'w')
+        self.file.write('[\n')
+        self.first = True
+        self.start = time()
+        self.pid = os.getpid()
+        self.threads = {}
+        self._local = local()
+        self._lock = Lock()
+
+    def _tags(self):
+        if not hasattr(self._local, 'tags'):
+            self._local.tags = [{}]
+        return self._local.tags
+
+    def push(self, tags):
+        current = self._tags()
+        merged = dict(current[-1])
+        merged.update(tags)
+        current.append(merged)
+
+    def pop(self):
+        self._tags().pop()
+
+    def _write(self, event):
+        # only called while holding the lock
+        if not self.first:
+            self.file.write(',\n')
+        self.first = False
+        self.file.write(json.dumps(event))
+
+    def _tid(self):
+        # number the threads in the order they show up and name them so the pool workers can be told apart
+        thread = current_thread()
+        if thread.ident not in self.threads:
+            self.threads[thread.ident] = len(self.threads) + 1
+            self._write({'name': 'thread_name', 'ph': 'M', 'pid': self.pid, 'tid': self.threads[thread.ident],
+                         'args': {'name': thread.name}})
+        return self.threads[thread.ident]
+
+    def complete(self, name, start, end, args):
+        """Records a span which started at <start> and ended at <end> (in seconds since the epoch).
+        The span is tagged with the current tags of the thread as well as <args>.
+        """
+        event_args = dict(self._tags()[-1])
+        event_args.update(args)
+        with self._lock:
+            if self.file is None:
+                return
+            self._write({
+                'name': name,
+                'cat': event_args.get('section') or 'fbscrape',
+                'ph': 'X',
+                'ts': int((start - self.start) * 1000000),
+                'dur': int((end - start) * 1000000),
+                'pid': self.pid,
+                'tid': self._tid(),
+                'args': event_args,
+            })
+
+    def close(self):
+        with self._lock:
+            if self.file is not None:
+                self.file.write('\n]\n')
+                self.file.close()
+                self.file = None
+
+
+def enable(filename):
+    """Starts tracing into filename. Returns the Tracer.
+    """
+    global _tracer
+    disable()
+    _tracer = Tracer(filename)
+    return _tracer
+
+
+def disable():
+    """Stops tracing and finishes writing the trace file.
+    """
+    global _tracer
+    tracer, _tracer = _tracer, None
+    if tracer is not None:
+        tracer.close()
+
+
+def enabled():
+    return _tracer is not None
+
+
+def span(name, **args):
+    """Returns a context manager which records the time spent inside of it as a span called name.
+    """
+    if _tracer is None:
+        return _null_span
+    return _Span(_tracer, name, args)
+
+
+def tags(**tags):
+    """Returns a context manager which adds tags (e.g. target and section) to every span of this thread inside of it.
+    """
+    if _tracer is None:
+        return _null_span
+    return _Tags(_tracer, tags)
+
+
+def current_tags():
+    """Returns the tags of this thread, for handing work to another thread with tags(**current_tags()).
+    """
+    if _tracer is None:
+        return {}
+    return dict(_tracer._tags()[-1])
+
+
+def wrap(name, func):
+    """Returns func wrapped so every call is recorded as a span called name, or func itself if tracing is off.
+    """
+    if _tracer is None:
+        return func
+
+    def traced(*args, **kwargs):
+        with span(name):
+            return func(*args, **kwargs)
+    return traced
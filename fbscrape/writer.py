@@ -0,0 +1,72 @@
+import logging as log
+
+from threading import Event, Thread, current_thread
+
+try:
+    from Queue import Queue, Empty
+except ImportError:
+    from queue import Queue, Empty
+
+# local imports
+from metrics import registry as metrics
+
+
+class RecordWriter(object):
+
+    def __init__(self, size=1000):
+        """Writes records from a thread of its own so the crawl doesn't wait on encoding, compressing and writing
+        them to disk, or on logging them. Everything is done in the order it was added.
+        At most <size> records can be waiting, after which adding more blocks until the writer catches up so
+        memory doesn't run away when the disk can't keep up.
+        """
+        self.queue = Queue(size)
+        self.thread = Thread(target=self._run, name='record-writer')
+        self.thread.daemon = True
+        self.thread.start()
+
+    def _run(self):
+        closing = False
+        while True:
+            if closing:
+                # write anything which was added while closing, e.g. by a scrape which is still finishing
+                try:
+                    item = self.queue.get_nowait()
+                except Empty:
+                    return
+            else:
+                item = self.queue.get()
+            if item is None:
+                closing = True
+                continue
+            func, args = item
+            try:
+                func(*args)
+            except Exception:
+                log.exception('Failed to write a record')
+            metrics.set('fbscrape_write_queue_depth', self.queue.qsize())
+
+    def put(self, func, *args):
+        """Calls func(*args) from the writer thread once everything added before it is done.
+        """
+        if current_thread() is self.thread or not self.thread.is_alive():
+            func(*args)
+            return
+        self.queue.put((func, args))
+
+    def call(self, func, *args):
+        """Calls func(*args) from the writer thread like put() but waits until it's been called.
+        """
+        if current_thread() is self.thread or not self.thread.is_alive():
+            func(*args)
+            return
+        done = Event()
+        self.queue.put((func, args))
+        self.queue.put((done.set, ()))
+        done.wait()
+
+    def close(self):
+        """Writes whatever is waiting and stops the writer thread.
+        """
+        if self.thread.is_alive():
+            self.queue.put(None)
+            self.thread.join()
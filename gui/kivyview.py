@@ -257,8 +257,8 @@ class Logging(Screen):
         self.ids.pause.disabled = True
         fbs = App.get_running_app().controller
         fbs.pause()  # send in a pause request
-        while not fbs.status == 'paused':
-            pass
+        # the crawl can finish or be stopped before it gets to pause, the request then applies to the next one
+        fbs.wait_for_status(('paused', 'ready', 'stopped'))
         # we are paused now
         self.ids.pause.text = 'Unpause'
         self.ids.pause.disabled = False
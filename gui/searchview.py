@@ -68,7 +68,7 @@ class ResultItem(BoxLayout):
     @background
     @interrupt
     def show_profile(self):
-        App.get_running_app().controller.load(self.url, scroll=False)
+        App.get_running_app().controller.load(self.url, scroll=False, page_type='posts')
 
     def on_checkbox_active(self, checkbox, value):
         """Keep track of how many check boxes have been checked
@@ -128,8 +128,8 @@ class SearchResults(FloatLayout):
         self.ids.pause.disabled = True
         fbs = App.get_running_app().controller
         fbs.pause()  # send in a pause request
-        while fbs.status != 'paused':
-            pass
+        # the crawl can finish or be stopped before it gets to pause, the request then applies to the next one
+        fbs.wait_for_status(('paused', 'ready', 'stopped'))
         # we are paused now
         self.ids.pause.text = 'Unpause'
         self.ids.pause.disabled = False
@@ -13,29 +13,127 @@ except NameError:
 
 import argparse
 import logging
+import os
 
 from builtins import input
 from getpass import getpass
 
 # local imports
-from fbscrape import FBScraper
+from fbscrape import (BrowserProfile, Checkpoint, CSVSink, FBScraper, LatencyModel, ParquetSink, ScraperPool, SeenIndex,
+                      SnapshotRecorder, SQLiteSink, metrics, tracing)
+from fbscrape.helpers import timestring, unixtime
 
 
-def main(args):
+def make_scraper(args, latency, snapshots=None, checkpoint=None, index=None, sink=None):
+    output_dir = args.outputdir if args.outputdir else ''
+    if args.lightweight:
+        profile = BrowserProfile.lightweight(args.headless)
+    else:
+        profile = BrowserProfile(headless=args.headless)
+    fbs = FBScraper(output_dir, profile, latency)
+    fbs.prune = args.prune
+    fbs.snapshots = snapshots
+    fbs.checkpoint = checkpoint
+    fbs.delta = args.delta
+    fbs.index = index
+    fbs.sink = sink
+    if args.since:
+        fbs.post_since = unixtime(args.since)
+    if args.until:
+        fbs.post_until = unixtime(args.until, end_of_day=True)
+    if args.lite:
+        fbs.lite_sections = set(x.strip() for x in args.lite.split(','))
+    return fbs
+
+
+def make_sink(args):
+    """Returns the sink to write all of the records of the run to, or None to write them to CSV files.
+    """
     output_dir = args.outputdir if args.outputdir else ''
+    if args.format == 'sqlite':
+        return SQLiteSink(os.path.join(output_dir, timestring() + '.sqlite'))
+    if args.format == 'parquet':
+        return ParquetSink(os.path.join(output_dir, 'parquet'))
+    if args.compress:
+        return CSVSink(args.compress, args.compresslevel)
+    return None
+
+
+def read_targets(infile):
+    """Returns all the targets in infile, or reads them from stdin if there's no input file.
+    """
+    if infile:
+        with open(infile, 'r') as input_f:
+            return [line.strip() for line in input_f if line.strip()]
+    print('Enter the Facebook IDs, Usernames, or URLs to scrape, one per line, followed by an empty line.')
+    targets = []
+    while True:
+        line = sys.stdin.readline().strip()
+        if not line:
+            return targets
+        targets.append(line)
+
+
+def configure_logging(args):
+    """Logs INFO and up to the console, with the name of the worker thread when scraping with several browsers.
+    """
+    if args.workers > 1:
+        logging.basicConfig(format='%(levelname)s:%(threadName)s:%(message)s', level=logging.INFO)
+    else:
+        logging.basicConfig(format='%(levelname)s:%(message)s', level=logging.INFO)
+
+
+def main(args):
+    # set up logging before anything adds a handler to the root logger, basicConfig does nothing after that
+    if args.nogui:
+        configure_logging(args)
+    if args.checkpoint and args.format != 'csv':
+        # a new database or dataset is started every run, so the sections cut short would never be finished
+        sys.exit('--checkpoint only works together with --format csv')
+    if args.delta and args.format != 'csv':
+        # there are no files from the last run to add to, everything would be scraped again
+        sys.exit('--delta only works together with --format csv')
+    # start with the page load times from the last run so the delays are right from the beginning
+    latency = LatencyModel()
+    if args.latencyfile and os.path.isfile(args.latencyfile):
+        latency = LatencyModel.load(args.latencyfile)
+    if args.tracefile:
+        tracing.enable(args.tracefile)
+    if args.metricsport:
+        if not args.nogui:
+            sys.exit('--metrics-port only works together with --nogui')
+        metrics.serve(args.metricsport)
+    sink = make_sink(args)
+    try:
+        return run(args, latency, sink)
+    finally:
+        if sink:
+            sink.close()
+        if args.latencyfile:
+            latency.save(args.latencyfile)
+        tracing.disable()
+
+
+def run(args, latency, sink=None):
     loginfile = args.loginfile if args.loginfile else 'login.txt'
     infile = args.inputfile if args.inputfile else ''
-    fbs = FBScraper(output_dir)
+    snapshots = SnapshotRecorder(args.archive) if args.archive else None
+    checkpoint = Checkpoint(args.checkpoint) if args.checkpoint else None
+    index = SeenIndex(args.index) if args.index else None
+    if args.workers > 1 and args.nogui:
+        return main_pool(args, loginfile, infile, latency, snapshots, checkpoint, index, sink)
+    fbs = make_scraper(args, latency, snapshots, checkpoint, index, sink)
 
     # run the gui version if there's no --nogui flag
     if not args.nogui:
         # hide the current arguments from kivy
         sys.argv = [sys.argv[0]]
         from gui import FBScraperApp
-        return FBScraperApp(fbs, infile).run()
+        try:
+            return FBScraperApp(fbs, infile).run()
+        finally:
+            fbs.close()
 
-    # configure logging level
-    logging.basicConfig(format='%(levelname)s:%(message)s', level=logging.INFO)
     log = logging.getLogger('fbscraper')
 
     # not running the gui version
@@ -51,23 +149,51 @@ def main(args):
         fb_user = input('Enter your Facebook login email: ')
         fb_pass = getpass('Enter your Facebook password:  ')
     if not fbs.login(fb_user, fb_pass):
+        fbs.close()
         sys.exit('Failed to log into Facebook. Check your credentials and try again.')
 
     # login successful
-    if infile:
-        with open(infile, 'r') as input_f:
-            for line in input_f:
-                fbs.scrape(line.strip())
-    else:
-        log.info('No input file specified. Reading input from stdin.')
-        print('Enter the Facebook ID, Username, or URL to scrape followed by the <Enter> key.')
-        while True:
-            line = sys.stdin.readline().strip()
-            if not line:
-                break
-            fbs.scrape(line)
-            print('Scrape complete. Enter another Facebook ID, Username, or URL followed by the <Enter> key.')
-        print('Exiting...')
+    try:
+        if infile:
+            with open(infile, 'r') as input_f:
+                for line in input_f:
+                    fbs.scrape(line.strip())
+        else:
+            log.info('No input file specified. Reading input from stdin.')
+            print('Enter the Facebook ID, Username, or URL to scrape followed by the <Enter> key.')
+            while True:
+                line = sys.stdin.readline().strip()
+                if not line:
+                    break
+                fbs.scrape(line)
+                print('Scrape complete. Enter another Facebook ID, Username, or URL followed by the <Enter> key.')
+    finally:
+        # write whatever records are still queued before the sink is closed
+        fbs.close()
+    print('Exiting...')
+
+
+def main_pool(args, loginfile, infile, latency, snapshots, checkpoint, index, sink):
+    """Scrapes the targets using several browsers at once.
+    """
+    targets = read_targets(infile)
+    with open(loginfile, 'r') as f:
+        lines = f.readlines()
+        fb_user = lines[0].strip()
+        fb_pass = lines[1].strip()
+
+    pool = ScraperPool(args.workers, lambda: make_scraper(args, latency, snapshots, checkpoint, index, sink))
+    try:
+        if not pool.login(fb_user, fb_pass):
+            sys.exit('Failed to log into Facebook. Check your credentials and try again.')
+        try:
+            pool.scrape(targets)
+        except KeyboardInterrupt:
+            pool.interrupt()
+    finally:
+        # close the browsers however the scrape ends
+        pool.quit()
+    print('Exiting...')
 
 
 if __name__ == "__main__":
@@ -80,5 +206,39 @@ if __name__ == "__main__":
                         help='the directory to store the scraped files')
     parser.add_argument('--loginfile', '-l', dest='loginfile', required=False,
                         help='the file to read login credentials from (username/email on the first line, and password on the second line)')
+    parser.add_argument('--format', '-f', dest='format', choices=['csv', 'sqlite', 'parquet'], default='csv',
+                        help='write a CSV file for each section of each target, everything into one SQLite database or a Parquet dataset (needs pyarrow)')
+    parser.add_argument('--compress', dest='compress', choices=['gzip', 'zstd'], required=False,
+                        help='compress the CSV files as they\'re written (zstd needs zstandard)')
+    parser.add_argument('--compress-level', dest='compresslevel', type=int, required=False,
+                        help='the compression level, 1-9 for gzip (6 by default) or 1-22 for zstd (3 by default)')
+    parser.add_argument('--prune', '-p', dest='prune', action='store_true', required=False,
+                        help='remove scraped items from the page to keep memory usage down on very long lists')
+    parser.add_argument('--headless', dest='headless', action='store_true', required=False,
+                        help='run the browser without a window')
+    parser.add_argument('--lightweight', dest='lightweight', action='store_true', required=False,
+                        help='block images, video and fonts and disable animations in the browser')
+    parser.add_argument('--workers', '-w', dest='workers', type=int, default=1,
+                        help='the number of browsers to scrape with at the same time (only used with --nogui)')
+    parser.add_argument('--lite', dest='lite', required=False,
+                        help='comma separated sections to try fetching without the browser (friends,likes,groups,checkins,about)')
+    parser.add_argument('--archive', '-a', dest='archive', required=False,
+                        help='a directory to save compressed snapshots of every page and scroll to')
+    parser.add_argument('--since', dest='since', required=False,
+                        help='only scrape posts from this date onwards (YYYY-MM-DD)')
+    parser.add_argument('--until', dest='until', required=False,
+                        help='only scrape posts up to and including this date (YYYY-MM-DD)')
+    parser.add_argument('--delta', '-d', dest='delta', action='store_true', required=False,
+                        help='only scrape what\'s new since the last run into the same output directory and add it to the end of those files (only with --format csv)')
+    parser.add_argument('--checkpoint', '-c', dest='checkpoint', required=False,
+                        help='a file to save the progress to, run again with the same file to carry on where it stopped (only with --format csv)')
+    parser.add_argument('--index', dest='index', required=False,
+                        help='a database of everything scraped so far, items in it are skipped and not recorded again')
+    parser.add_argument('--latency', dest='latencyfile', required=False,
+                        help='a file to load page load times from at start up and save them to on exit')
+    parser.add_argument('--metrics-port', dest='metricsport', type=int, required=False,
+                        help='serve live metrics in the Prometheus format at http://localhost:PORT/metrics (only used with --nogui)')
+    parser.add_argument('--trace', dest='tracefile', required=False,
+                        help='a file to save a timeline of the session to (open it in chrome://tracing)')
     args = parser.parse_args()
     main(args)
@@ -0,0 +1,41 @@
+import glob
+import os
+
+import pytest
+
+from benchmark.fakedriver import FakeDriver
+from fbscrape import FBScraper
+
+from tests.util import TARGET, FakeDownloads
+
+
+@pytest.fixture
+def make_scraper(tmpdir):
+    """Returns a function creating FBScrapers which crawl the fake profile with a FakeDriver and write into tmpdir.
+    Only the sections given are scraped, other attributes can be set with keyword arguments.
+    """
+    scrapers = []
+
+    def make(sections, pages=None, **attrs):
+        fbs = FBScraper(str(tmpdir), driver=FakeDriver(pages))
+        fbs.min_delay = 0
+        fbs.downloads = FakeDownloads()
+        for name in fbs.settings:
+            fbs.settings[name] = name in sections
+        for name, value in attrs.items():
+            setattr(fbs, name, value)
+        scrapers.append(fbs)
+        return fbs
+
+    yield make
+    for fbs in scrapers:
+        fbs.close()
+
+
+@pytest.fixture
+def output(tmpdir):
+    """Returns a function returning the record files of the fake profile matching a pattern, oldest first.
+    """
+    def files(pattern):
+        return sorted(glob.glob(os.path.join(str(tmpdir), TARGET, pattern)), key=os.path.getmtime)
+    return files
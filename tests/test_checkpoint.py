@@ -0,0 +1,46 @@
+from fbscrape import Checkpoint
+from tests.util import SIZE, TARGET, TARGET_URL, rows
+
+
+def interrupt_after(fbs, section, count):
+    """Makes fbs stop as if it was interrupted once <count> items of section have been crawled.
+    """
+    crawl = getattr(fbs, 'crawl_' + section)
+
+    def interrupted(url, callback, *args):
+        def counting(*items):
+            callback(*items)
+            if items[-1] == count:
+                fbs.stop_request = True
+        return crawl(url, counting, *args)
+    setattr(fbs, 'crawl_' + section, interrupted)
+
+
+def test_resume(make_scraper, output, tmpdir):
+    filename = str(tmpdir.join('checkpoint.json'))
+    first = make_scraper(['friends', 'likes'], checkpoint=Checkpoint(filename, save_every=0))
+    interrupt_after(first, 'friends', 20)
+    first.scrape(TARGET_URL)
+    first.close()
+    assert not Checkpoint(filename).target_done(TARGET)
+    assert len(rows(output('*-friends.csv')[0])) == 20
+
+    checkpoint = Checkpoint(filename, save_every=0)
+    make_scraper(['friends', 'likes'], checkpoint=checkpoint).scrape(TARGET_URL)
+    assert checkpoint.target_done(TARGET)
+    # the second run carries on in the same file without recording anything twice
+    for section in ('friends', 'likes'):
+        files = output('*-{}.csv'.format(section))
+        assert len(files) == 1
+        records = rows(files[0])
+        assert len(records) == SIZE
+        assert len(set(r['name'] for r in records)) == SIZE
+
+
+def test_finished_target_is_skipped(make_scraper, output, tmpdir):
+    filename = str(tmpdir.join('checkpoint.json'))
+    make_scraper(['friends'], checkpoint=Checkpoint(filename, save_every=0)).scrape(TARGET_URL)
+    fbs = make_scraper(['friends'], checkpoint=Checkpoint(filename, save_every=0))
+    fbs.scrape(TARGET_URL)
+    assert fbs.stats.summary() == {}
+    assert len(output('*-friends.csv')) == 1
@@ -0,0 +1,42 @@
+import pytest
+
+from fbscrape import CSVSink
+from fbscrape.record import CSVFile
+from tests.util import SIZE, TARGET_URL, rows
+
+
+@pytest.mark.parametrize('compression, extension', [('gzip', '.csv.gz'), ('zstd', '.csv.zst')])
+def test_compressed_records(make_scraper, output, compression, extension):
+    if compression == 'zstd':
+        pytest.importorskip('zstandard')
+    make_scraper(['posts', 'friends'], sink=CSVSink(compression)).scrape(TARGET_URL)
+    for section in ('posts', 'friends'):
+        files = output('*-{}{}'.format(section, extension))
+        assert len(files) == 1
+        assert len(rows(files[0])) == SIZE
+
+
+def test_delta_appends_to_compressed_records(make_scraper, output):
+    from tests.test_delta import longer_list
+
+    make_scraper(['friends'], sink=CSVSink('gzip')).scrape(TARGET_URL)
+    make_scraper(['friends'], sink=CSVSink('gzip'), pages=longer_list(10), delta=True).scrape(TARGET_URL)
+    files = output('*-friends.csv.gz')
+    assert len(files) == 1
+    assert len(rows(files[0])) == SIZE + 10
+
+
+def test_read_cut_short(tmpdir):
+    f = CSVFile(str(tmpdir.join('records')), ['text'], compression='gzip', flush_every=10)
+    for i in range(100):
+        f.write({'text': 'record {}\nwith two lines'.format(i)})
+    f.flush()
+    data = open(f.filename, 'rb').read()
+    f.close()
+    # as a crash would leave it, part of the way through a record
+    cut = str(tmpdir.join('cut.csv.gz'))
+    with open(cut, 'wb') as out:
+        out.write(data[:len(data) * 2 // 3])
+    records = rows(cut)
+    assert 0 < len(records) < 100
+    assert all(r['text'].endswith('with two lines') for r in records)
@@ -0,0 +1,35 @@
+from threading import Thread
+
+from tests.util import TARGET_URL
+
+
+# what the gui waits for after asking the crawler to pause
+PAUSED_OR_IDLE = ('paused', 'ready', 'stopped')
+
+
+def test_pause_during_crawl(make_scraper):
+    fbs = make_scraper(['friends'])
+    fbs.pause()
+    crawl = Thread(target=fbs.scrape, args=(TARGET_URL,))
+    crawl.start()
+    assert fbs.wait_for_status('paused', timeout=10)
+    assert crawl.is_alive()
+    fbs.unpause()
+    crawl.join(10)
+    assert not crawl.is_alive()
+    assert fbs.status == 'ready'
+
+
+def test_pause_after_crawl(make_scraper):
+    fbs = make_scraper(['friends'])
+    fbs.scrape(TARGET_URL)
+    fbs.pause()
+    assert fbs.wait_for_status(PAUSED_OR_IDLE, timeout=1)
+
+
+def test_pause_after_stop(make_scraper):
+    fbs = make_scraper(['friends'])
+    fbs.interrupt()
+    fbs.pause()
+    assert fbs.wait_for_status(PAUSED_OR_IDLE, timeout=1)
+    assert fbs.status == 'stopped'
@@ -0,0 +1,56 @@
+import pytest
+
+from benchmark import fakedriver
+from fbscrape.base import Cursor, following_xpath
+from fbscrape.custom import xpath_selectors
+from fbscrape.offline import compile_selector, parse
+from tests.util import SIZE, TARGET_URL, rows
+
+
+LIKES = u'''<html><body>
+<ul><li><a data-hovercard="x" href="/outside">Outside</a></li></ul>
+<div id="pagelet_timeline_medley_likes"><ul>{}</ul></div>
+<ul><li><a data-hovercard="x" href="/after">After</a></li></ul>
+</body></html>'''
+
+
+@pytest.mark.parametrize('tagged', [1, 10, 19, 20])
+def test_following_matches_the_same_items(tagged):
+    items = ''.join(u'<li><a data-hovercard="x" href="/{0}">Like {0}</a><a href="/{0}/more"><b>more</b></a></li>'
+                    .format(i) for i in range(20))
+    doc = parse(LIKES.format(items))
+    cursor = Cursor(xpath_selectors['likes_selector'], xpath=True)
+    found = compile_selector(cursor.unseen, 'xpath')(doc)
+    for item in found[:tagged]:
+        item.set(cursor.attribute, cursor.token)
+    following = compile_selector(cursor.following, 'xpath')(found[tagged - 1])
+    assert following == compile_selector(cursor.unseen, 'xpath')(doc)
+    assert [a.get('href') for a in following] == ['/{}'.format(i) for i in range(tagged, 20)]
+
+
+@pytest.mark.parametrize('path, expected', [
+    ('//a', 'following::a'),
+    ('//div[@id="x"]//li/a[@href]', 'following::a[@href][parent::li[ancestor::div[@id="x"]]]'),
+    ('//a[contains(@href, "/b")]', 'following::a[contains(@href, "/b")]'),
+    ('.//a', None),
+    ('/html//a', None),
+    ('//a | //b', None),
+    ('//li[1]/a', None),
+    ('//a/@href', None),
+    ('//a/..', None),
+])
+def test_following_xpath(path, expected):
+    assert following_xpath(path) == expected
+
+
+def test_likes_only_look_after_the_last_item(make_scraper, output, monkeypatch):
+    compiled = []
+
+    def spy(selector, by='css'):
+        compiled.append(selector)
+        return compile_selector(selector, by)
+
+    monkeypatch.setattr(fakedriver, 'compile_selector', spy)
+    make_scraper(['likes'], prune=True).scrape(TARGET_URL)
+    assert len(rows(output('*-likes.csv')[0])) == SIZE
+    assert any(s.startswith('following::') for s in compiled)
@@ -0,0 +1,48 @@
+from benchmark import fixtures
+from tests.util import SIZE, TARGET, TARGET_URL, rows
+
+
+def longer_list(extra):
+    """Returns the pages of the fake profile with <extra> more items at the end of every list.
+    """
+    bigger = 'bench-{}'.format(SIZE + extra)
+    return lambda path, query: fixtures.page(path.replace(TARGET, bigger), query)
+
+
+def test_new_friends_are_added(make_scraper, output):
+    make_scraper(['friends']).scrape(TARGET_URL)
+    make_scraper(['friends'], pages=longer_list(10), delta=True).scrape(TARGET_URL)
+    files = output('*-friends.csv')
+    assert len(files) == 1
+    records = rows(files[0])
+    assert len(records) == SIZE + 10
+    assert len(set(r['profile'] for r in records)) == SIZE + 10
+
+
+def test_posts_stop_at_known_ones(make_scraper, output, monkeypatch):
+    make_scraper(['posts']).scrape(TARGET_URL)
+
+    # five new posts at the top of the timeline
+    post = fixtures.post
+    monkeypatch.setattr(fixtures, 'NEWEST_POST', fixtures.NEWEST_POST + 5 * 3600)
+    new_post = lambda i: post(i).replace('/posts/{}"'.format(i), '/posts/new{}"'.format(i)) if i < 5 else post(i - 5)
+    monkeypatch.setitem(fixtures.lists, 'posts', (new_post,) + fixtures.lists['posts'][1:])
+
+    fbs = make_scraper(['posts'], delta=True)
+    found = []
+    crawl = fbs.crawl_posts
+
+    def counting(url, callback, *args):
+        def count(*post):
+            found.append(post)
+            callback(*post)
+        return crawl(url, count, *args)
+    fbs.crawl_posts = counting
+    fbs.scrape(TARGET_URL)
+
+    records = rows(output('*-posts.csv')[0])
+    assert len(records) == SIZE + 5
+    # the new posts are added after the ones from the first run
+    assert sorted(r['permalink'] for r in records[-5:]) == ['http://fake/bench/posts/new{}'.format(i) for i in range(5)]
+    # only the new posts were expanded before the crawl stopped
+    assert len(found) == 5
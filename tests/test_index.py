@@ -0,0 +1,22 @@
+from fbscrape import SeenIndex
+from tests.util import SIZE, TARGET, TARGET_URL, rows
+
+
+def test_nothing_is_recorded_twice(make_scraper, output, tmpdir):
+    index = SeenIndex(str(tmpdir.join('index.db')))
+    sections = ['posts', 'friends', 'photos']
+    make_scraper(sections, index=index).scrape(TARGET_URL)
+    for kind in ('posts', 'friends', 'photos'):
+        assert index.count(TARGET, kind) == SIZE
+
+    # a file of its own even if it's the same second
+    second = make_scraper(sections, index=index, filenaming='second-%TYPE%')
+    second.scrape(TARGET_URL)
+    for section in sections:
+        first_file, second_file = output('*-{}.csv'.format(section))
+        assert len(rows(first_file)) == SIZE
+        assert rows(second_file) == []
+    # the images aren't downloaded again either
+    assert second.downloads.urls == []
+    assert index.count() == 3 * SIZE
+    index.close()
@@ -0,0 +1,30 @@
+import pytest
+
+from benchmark.server import FakeFacebook
+from fbscrape.lite import LiteCrawler, NeedsBrowser
+
+
+@pytest.fixture
+def server():
+    # every list fits in the first page so it can be read without scrolling
+    fake = FakeFacebook(batch=100).start()
+    yield fake
+    fake.stop()
+
+
+@pytest.mark.parametrize('section', ['friends', 'likes', 'groups', 'checkins'])
+def test_lists(server, section):
+    found = []
+    count = getattr(LiteCrawler(), 'crawl_' + section)(server.url + '/bench-50', lambda *item: found.append(item))
+    assert count == len(found) == 50
+    assert found[-1][-1] == 50
+
+
+def test_about(server):
+    found = []
+    assert LiteCrawler().crawl_about(server.url + '/bench-50', lambda *item: found.append(item)) > 0
+
+
+def test_missing_page_needs_browser(server):
+    with pytest.raises(NeedsBrowser):
+        LiteCrawler().crawl_friends(server.url + '/nothing-here', lambda *item: None)
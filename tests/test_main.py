@@ -0,0 +1,102 @@
+import argparse
+import logging
+import socket
+
+import pytest
+
+import main
+
+
+def free_port():
+    s = socket.socket()
+    s.bind(('127.0.0.1', 0))
+    port = s.getsockname()[1]
+    s.close()
+    return port
+
+
+@pytest.fixture
+def root_logger():
+    """The root logger, restored to how it was afterwards.
+    """
+    root = logging.getLogger()
+    handlers, level = root.handlers[:], root.level
+    yield root
+    root.handlers = handlers
+    root.setLevel(level)
+
+
+def test_logging_with_metrics(root_logger, monkeypatch, capsys):
+    def run(args, latency, sink=None):
+        logging.getLogger('fbscraper').info('scraping')
+        logging.getLogger('fbscraper').warning('slow down')
+
+    monkeypatch.setattr(main, 'run', run)
+    # start without handlers as main.py does, pytest adds its own just before the test runs
+    root_logger.handlers = []
+    args = argparse.Namespace(nogui=True, workers=1, metricsport=free_port(), latencyfile=None, tracefile=None,
+                              format='csv', compress=None, outputdir=None, checkpoint=None,
+                              delta=False)
+    main.main(args)
+    assert root_logger.level == logging.INFO
+    err = capsys.readouterr().err
+    assert 'INFO:scraping' in err
+    assert 'WARNING:slow down' in err
+    assert 'fbscrape_log_messages_total{level="WARNING"}' in main.metrics.registry.render()
+
+
+@pytest.mark.parametrize('option, value', [('checkpoint', 'checkpoint'), ('delta', True)])
+@pytest.mark.parametrize('fmt', ['sqlite', 'parquet'])
+def test_needs_csv(tmpdir, option, value, fmt):
+    args = argparse.Namespace(nogui=False, workers=1, metricsport=None, latencyfile=None, tracefile=None, format=fmt,
+                              compress=None, outputdir=str(tmpdir), checkpoint=None, delta=False)
+    setattr(args, option, value)
+    with pytest.raises(SystemExit):
+        main.main(args)
+    assert tmpdir.listdir() == []
+
+
+class FakePool(object):
+    """Stands in for ScraperPool, remembering whether the browsers were closed.
+    """
+    logged_in = True
+    error = None
+
+    def __init__(self, size, factory):
+        self.quit_called = False
+        FakePool.last = self
+
+    def login(self, user, password):
+        return self.logged_in
+
+    def scrape(self, targets):
+        if self.error:
+            raise self.error
+
+    def interrupt(self):
+        pass
+
+    def quit(self):
+        self.quit_called = True
+
+
+@pytest.mark.parametrize('logged_in, error, raised', [
+    (False, None, SystemExit),
+    (True, RuntimeError('crashed'), RuntimeError),
+    (True, KeyboardInterrupt(), None),
+])
+def test_pool_is_always_quit(tmpdir, monkeypatch, logged_in, error, raised):
+    monkeypatch.setattr(main, 'ScraperPool', FakePool)
+    monkeypatch.setattr(FakePool, 'logged_in', logged_in)
+    monkeypatch.setattr(FakePool, 'error', error)
+    loginfile = tmpdir.join('login.txt')
+    loginfile.write('user\npassword\n')
+    infile = tmpdir.join('targets.txt')
+    infile.write('zuck\n')
+    args = argparse.Namespace(workers=2)
+    if raised:
+        with pytest.raises(raised):
+            main.main_pool(args, str(loginfile), str(infile), None, None, None, None, None)
+    else:
+        main.main_pool(args, str(loginfile), str(infile), None, None, None, None, None)
+    assert FakePool.last.quit_called
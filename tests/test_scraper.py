@@ -0,0 +1,61 @@
+import os
+
+import pytest
+
+from benchmark import fixtures
+from tests.util import SIZE, TARGET_URL, rows
+
+
+@pytest.mark.parametrize('section, columns', [
+    ('posts', ['date', 'post', 'translation', 'permalink']),
+    ('friends', ['name', 'profile']),
+    ('likes', ['name', 'url']),
+    ('groups', ['name', 'url']),
+    ('checkins', ['name', 'url']),
+])
+def test_list_sections(make_scraper, output, section, columns):
+    make_scraper([section]).scrape(TARGET_URL)
+    files = output('*-{}.csv'.format(section))
+    assert len(files) == 1
+    records = rows(files[0])
+    assert len(records) == SIZE
+    assert sorted(records[0].keys()) == sorted(columns)
+    # nothing is recorded twice
+    assert len(set(tuple(sorted(r.items())) for r in records)) == SIZE
+
+
+def test_posts_newest_first(make_scraper, output):
+    make_scraper(['posts']).scrape(TARGET_URL)
+    dates = [r['date'] for r in rows(output('*-posts.csv')[0])]
+    assert dates == sorted(dates, reverse=True)
+
+
+def test_friends_without_query(make_scraper, output):
+    make_scraper(['friends']).scrape(TARGET_URL)
+    profiles = [r['profile'] for r in rows(output('*-friends.csv')[0])]
+    assert profiles[0] == 'http://fake/friend0'
+    assert not any('?' in p for p in profiles)
+
+
+def test_about(make_scraper, output):
+    make_scraper(['about']).scrape(TARGET_URL)
+    records = rows(output('*-about.csv')[0])
+    assert [r['section'] for r in records] == fixtures.about_sections
+
+
+def test_photos(make_scraper, output):
+    fbs = make_scraper(['photos'])
+    fbs.scrape(TARGET_URL)
+    assert len(rows(output('*-photos.csv')[0])) == SIZE
+    folder = [f for f in output('*-photos') if os.path.isdir(f)][0]
+    assert len(os.listdir(folder)) == SIZE
+    assert len(fbs.downloads.urls) == SIZE
+
+
+def test_albums(make_scraper, output):
+    make_scraper(['albums']).scrape(TARGET_URL)
+    files = output('*-album-*.csv')
+    assert len(files) == fixtures.ALBUMS
+    for f in files:
+        assert len(rows(f)) == SIZE
+
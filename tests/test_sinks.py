@@ -0,0 +1,41 @@
+import os
+import sqlite3
+
+import pytest
+
+from fbscrape import ParquetSink, SQLiteSink
+from tests.util import SIZE, TARGET, TARGET_URL
+
+
+def test_sqlite(make_scraper, tmpdir):
+    filename = str(tmpdir.join('records.sqlite'))
+    sink = SQLiteSink(filename)
+    fbs = make_scraper(['posts', 'friends', 'photos', 'about'], sink=sink)
+    fbs.scrape(TARGET_URL)
+    fbs.close()
+    sink.close()
+
+    db = sqlite3.connect(filename)
+    assert db.execute('SELECT name FROM targets').fetchall() == [(TARGET,)]
+    for table in ('posts', 'friends', 'photos'):
+        assert db.execute('SELECT COUNT(*) FROM ' + table).fetchone()[0] == SIZE
+    assert db.execute('SELECT COUNT(*) FROM about').fetchone()[0] > 0
+    # the dates are stored as unix times
+    newest, = db.execute('SELECT MAX(date) FROM posts').fetchone()
+    assert isinstance(newest, int)
+    # no csv files are written
+    assert not [f for f in os.listdir(str(tmpdir)) if f.endswith('.csv')]
+
+
+def test_parquet(make_scraper, tmpdir):
+    parquet = pytest.importorskip('pyarrow.parquet')
+    directory = str(tmpdir.join('dataset'))
+    fbs = make_scraper(['posts', 'friends'], sink=ParquetSink(directory))
+    fbs.scrape(TARGET_URL)
+    fbs.close()
+
+    for section in ('posts', 'friends'):
+        folder = os.path.join(directory, 'section=' + section, 'target=' + TARGET)
+        files = os.listdir(folder)
+        assert len(files) == 1
+        assert parquet.read_table(os.path.join(folder, files[0])).num_rows == SIZE
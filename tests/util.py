@@ -0,0 +1,34 @@
+"""Things shared by the tests, which crawl the fake profile in benchmark/fixtures.py with the FakeDriver.
+"""
+
+from fbscrape.record import read_records
+
+
+# the number of items in every list of the fake profile
+SIZE = 50
+TARGET = 'bench-{}'.format(SIZE)
+TARGET_URL = 'http://fake/' + TARGET
+
+
+class FakeDownloads(object):
+    """Stands in for download.DownloadEngine, writing a few bytes for every image straight away.
+    """
+
+    def __init__(self):
+        self.urls = []
+
+    def download(self, url, path, callback=None):
+        self.urls.append(url)
+        with open(path, 'wb') as f:
+            f.write(b'image')
+        if callback:
+            callback(url, path, None)
+
+    def alive(self):
+        return True
+
+
+def rows(filename):
+    """Returns every record in the record file filename.
+    """
+    return list(read_records(filename))